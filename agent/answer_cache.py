@@ -0,0 +1,146 @@
+import re
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+import scipy.sparse as sp
+
+# ==============================================================================
+# SEMANTIC ANSWER CACHE - reuse SQL for rephrased questions
+# ==============================================================================
+
+CATEGORIES = ['beverages', 'condiments', 'confections', 'dairy products',
+              'grains/cereals', 'meat/poultry', 'produce', 'seafood']
+
+# Words that change what a query computes. Two questions only share an entry when
+# they agree on all of these, however similar the rest of the wording is.
+KEY_TERMS = {
+    'revenue', 'quantity', 'margin', 'aov', 'average', 'count', 'order',
+    'customer', 'product', 'category', 'supplier', 'employee',
+    'highest', 'lowest', 'top', 'bottom', 'most', 'least', 'best', 'worst',
+}
+
+# Words naming a date window. The window itself is resolved from the docs
+# ("summer campaign" → a date range), so the question text must match on these.
+# Plural-folded like the question words ('christmas' → 'christma').
+CALENDAR_TERMS = {
+    'summer', 'winter', 'spring', 'autumn', 'fall', 'holiday', 'christma', 'campaign', 'season',
+    'quarter', 'q1', 'q2', 'q3', 'q4', 'january', 'february', 'march', 'april', 'may', 'june',
+    'july', 'august', 'september', 'october', 'november', 'december',
+}
+
+
+def _key_signature(question: str) -> tuple:
+    """Numbers, category names, KEY_TERMS and CALENDAR_TERMS mentioned by the question (plurals folded)"""
+    q = question.lower()
+    numbers = re.findall(r'\d+(?:[.-]\d+)*', q)
+    categories = [cat for cat in CATEGORIES if cat in q]
+    words = {w.rstrip('s') for w in re.findall(r'q[1-4]\b|[a-z]+', q)}
+    terms = words & KEY_TERMS
+    calendar = words & CALENDAR_TERMS
+    return (frozenset(numbers), frozenset(categories), frozenset(terms), frozenset(calendar))
+
+
+def constraint_key(constraints: Optional[Dict[str, Any]]) -> tuple:
+    """The planner's resolved filters an entry's SQL was written for: (date_range, category)"""
+    constraints = constraints or {}
+    date_range = constraints.get('date_range')
+    return (tuple(date_range) if date_range else None, constraints.get('category'))
+
+
+class SemanticAnswerCache:
+    """
+    Maps questions that resolved to working SQL onto that SQL, so near-duplicate
+    phrasings can skip NL2SQL.
+
+    Questions are embedded with a stateless hashing TF vectorizer (no refit as the
+    cache grows) and compared by cosine similarity. A hit requires the same
+    format_hint, the same key signature (numbers, categories, metric and calendar
+    words), the same resolved planner constraints (see constraint_key) and a
+    similarity >= threshold. All entries are dropped when the fingerprint
+    (database + docs version) changes.
+    """
+
+    def __init__(self, threshold: float = 0.85, max_entries: int = 5000):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.vectorizer = None  # created by the first _vectorize() call
+        self._entries: list[Dict[str, Any]] = []
+        self._vectors: list = []
+        self._matrix = None
+        self._fingerprint = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _vectorize(self, question: str):
+        """Embed one question (call with the lock held)"""
+        if self.vectorizer is None:
+            # Heavy import, only paid once a question reaches the cache
+            from sklearn.feature_extraction.text import HashingVectorizer
+
+            self.vectorizer = HashingVectorizer(
+                stop_words='english',
+                alternate_sign=False,
+                binary=True,
+                norm='l2',
+                n_features=2 ** 18
+            )
+        return self.vectorizer.transform([question])
+
+    def _check_fingerprint(self, fingerprint):
+        if fingerprint != self._fingerprint:
+            self._entries, self._vectors, self._matrix = [], [], None
+            self._fingerprint = fingerprint
+
+    def lookup(self, question: str, format_hint: str, fingerprint, constraints: tuple) -> Optional[Dict[str, Any]]:
+        """
+        Return {'sql', 'question', 'similarity'} for the most similar entry written
+        for the same constraint_key, or None. Entries for other date ranges or
+        categories are skipped (not counted as hits), so they can't hide one that fits.
+        """
+        signature = _key_signature(question)
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix = sp.vstack(self._vectors).tocsr()
+            scores = (self._matrix @ self._vectorize(question).T).toarray().ravel()
+
+            for idx in np.argsort(scores)[::-1]:
+                if scores[idx] < self.threshold:
+                    break
+                entry = self._entries[idx]
+                if (entry['format_hint'] == format_hint and entry['signature'] == signature
+                        and entry['constraints'] == constraints):
+                    self.hits += 1
+                    return {'sql': entry['sql'], 'question': entry['question'], 'similarity': float(scores[idx])}
+            self.misses += 1
+            return None
+
+    def add(self, question: str, format_hint: str, sql: str, fingerprint,
+            constraints: Optional[Dict[str, Any]] = None):
+        """Record SQL that executed successfully for this question (and the planner constraints it used)"""
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            if any(e['question'] == question and e['format_hint'] == format_hint for e in self._entries):
+                return
+            vector = self._vectorize(question)
+            self._entries.append({
+                'question': question,
+                'format_hint': format_hint,
+                'sql': sql,
+                'signature': _key_signature(question),
+                'constraints': constraint_key(constraints),
+            })
+            self._vectors.append(vector)
+            if len(self._entries) > self.max_entries:
+                self._entries.pop(0)
+                self._vectors.pop(0)
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
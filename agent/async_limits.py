@@ -0,0 +1,95 @@
+import asyncio
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import copy_context
+from typing import Any, Callable, Optional
+
+from agent.tools.sqlite_tool import POOL_MAX_SIZE
+
+# ==============================================================================
+# ASYNC LIMITS - Backpressure for HybridAgent.arun
+# ==============================================================================
+
+MAX_LM_REQUESTS = 4          # LM calls in flight per event loop (match OLLAMA_NUM_PARALLEL)
+BLOCKING_WORKERS = POOL_MAX_SIZE  # SQLite / retrieval threads; more would only queue on the pool
+
+
+class AsyncLimits:
+    """
+    Limits shared by every question in flight on an event loop.
+
+    LM calls wait for one of `max_lm_requests` slots, so hundreds of concurrent
+    questions queue here instead of flooding Ollama. Blocking work (SQLite,
+    TF-IDF search) runs on a bounded thread pool with the caller's context, so
+    the loop never blocks and log capture still works.
+    """
+
+    def __init__(self, max_lm_requests: int = MAX_LM_REQUESTS, blocking_workers: int = BLOCKING_WORKERS):
+        self.max_lm_requests = max_lm_requests
+        self._executor = ThreadPoolExecutor(max_workers=blocking_workers, thread_name_prefix='agent-blocking')
+        # asyncio primitives belong to one loop; keep one semaphore per running loop
+        self._semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._calls = 0
+        self._waits = 0
+        self._in_flight = 0
+        self._peak = 0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_lm_requests)
+        return semaphore
+
+    @asynccontextmanager
+    async def lm_slot(self):
+        """Hold one of the LM request slots for the duration of the async with-block"""
+        semaphore = self._semaphore()
+        if semaphore.locked():
+            self._waits += 1
+        async with semaphore:
+            self._calls += 1
+            self._in_flight += 1
+            self._peak = max(self._peak, self._in_flight)
+            try:
+                yield
+            finally:
+                self._in_flight -= 1
+
+    async def run_blocking(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking call on the worker pool and await its result"""
+        call = functools.partial(copy_context().run, fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    def stats(self) -> dict:
+        return {
+            'lm_calls': self._calls,
+            'lm_waits': self._waits,
+            'lm_peak': self._peak,
+            'max_lm_requests': self.max_lm_requests,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+_limits: Optional[AsyncLimits] = None
+
+
+def get_async_limits() -> AsyncLimits:
+    global _limits
+    if _limits is None:
+        _limits = AsyncLimits()
+    return _limits
+
+
+def configure_async_limits(max_lm_requests: int = MAX_LM_REQUESTS,
+                           blocking_workers: int = BLOCKING_WORKERS) -> AsyncLimits:
+    """Replace the shared limits (call before the event loop starts answering questions)"""
+    global _limits
+    if _limits is not None:
+        _limits.close()
+    _limits = AsyncLimits(max_lm_requests, blocking_workers)
+    return _limits
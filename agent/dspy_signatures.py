@@ -1,6 +1,10 @@
 import json
 import dspy
 
+from agent.async_limits import get_async_limits
+from agent.routing import rule_route
+from agent.result_encoding import encode_rows
+
 # ==============================================================================
 # SIGNATURES
 # ==============================================================================
@@ -47,24 +51,36 @@ class QuestionRouter(dspy.Module):
         self.classify = dspy.ChainOfThought(RouterSignature)
     
     def forward(self, question):
-        # Hardcoded rules for reliability
-        q_lower = question.lower()
-        
-        # Rule 1: Pure RAG questions
-        if any(word in q_lower for word in ['policy', 'return window', 'return days', 'definition']):
-            return 'rag'
+        route = rule_route(question)
+        if route:
+            return route
         
-        # Rule 2: Hybrid questions (needs both docs + SQL)
-        if any(word in q_lower for word in ['during', 'summer', 'winter', 'calendar', 'marketing']):
+        # Fallback to model classification
+        try:
+            result = self.classify(question=self._classify_prompt(question))
+            return self._parse_route(result)
+            
+        except Exception as e:
+            print(f"   ⚠️  Router error: {e}, defaulting to 'hybrid'")
             return 'hybrid'
+    
+    async def aforward(self, question):
+        """forward() for HybridAgent.arun: the LM fallback is awaited within the LM request limit"""
+        route = rule_route(question)
+        if route:
+            return route
         
-        # Rule 3: Pure SQL (numbers, rankings, totals)
-        if any(word in q_lower for word in ['top 3', 'total revenue', 'all-time', 'how many']):
-            return 'sql'
-        
-        # Fallback to model classification
         try:
-            enhanced_question = f"""Classify this question:
+            async with get_async_limits().lm_slot():
+                result = await self.classify.acall(question=self._classify_prompt(question))
+            return self._parse_route(result)
+            
+        except Exception as e:
+            print(f"   ⚠️  Router error: {e}, defaulting to 'hybrid'")
+            return 'hybrid'
+    
+    def _classify_prompt(self, question):
+        return f"""Classify this question:
 "{question}"
 
 Guidelines:
@@ -73,18 +89,27 @@ Guidelines:
 - If needs BOTH document info (dates/categories) AND database numbers → route='hybrid'
 
 Question: {question}"""
-            
-            result = self.classify(question=enhanced_question)
-            route = result.route.strip().lower()
-            
-            if route not in ['rag', 'sql', 'hybrid']:
-                route = 'hybrid'  # Safe default
-            
-            return route
-            
-        except Exception as e:
-            print(f"   ⚠️  Router error: {e}, defaulting to 'hybrid'")
-            return 'hybrid'
+    
+    def _parse_route(self, result):
+        route = result.route.strip().lower()
+        
+        if route not in ['rag', 'sql', 'hybrid']:
+            route = 'hybrid'  # Safe default
+        
+        return route
+
+
+# Speculative NL2SQL: variant 0 is the plain prompt; the others add one line of
+# guidance and sample at their own temperature so candidates actually differ
+# (and each still has a stable LM cache key).
+SQL_VARIANTS = [
+    {'temperature': None, 'guidance': ''},
+    {'temperature': 0.3, 'guidance': "Start FROM the table that holds the measure, then add each JOIN with its ON condition before any filter."},
+    {'temperature': 0.5, 'guidance': "Use one flat SELECT with explicit JOINs: no subqueries, no CTEs."},
+    {'temperature': 0.7, 'guidance': ("Example: SELECT c.CategoryName, SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS revenue "
+                                      "FROM \"Order Details\" od JOIN Products p ON od.ProductID = p.ProductID "
+                                      "JOIN Categories c ON p.CategoryID = c.CategoryID GROUP BY c.CategoryName")},
+]
 
 
 class NL2SQLModule(dspy.Module):
@@ -94,7 +119,29 @@ class NL2SQLModule(dspy.Module):
         super().__init__()
         self.generate = dspy.Predict(NL2SQLSignature)
     
-    def forward(self, question, schema, constraints, error_feedback=None):
+    def forward(self, question, schema, constraints, error_feedback=None, variant=0):
+        try:
+            result = self.generate(**self._build_inputs(question, schema, constraints, error_feedback, variant))
+            return self._clean_result(result)
+            
+        except Exception as e:
+            print(f"   ⚠️  NL2SQL error: {e}")
+            return type('Result', (), {'sql': 'SELECT 1;', 'reasoning': f'Error: {e}'})()
+    
+    async def aforward(self, question, schema, constraints, error_feedback=None, variant=0):
+        """forward() for HybridAgent.arun: the LM call is awaited within the LM request limit"""
+        try:
+            inputs = self._build_inputs(question, schema, constraints, error_feedback, variant)
+            async with get_async_limits().lm_slot():
+                result = await self.generate.acall(**inputs)
+            return self._clean_result(result)
+            
+        except Exception as e:
+            print(f"   ⚠️  NL2SQL error: {e}")
+            return type('Result', (), {'sql': 'SELECT 1;', 'reasoning': f'Error: {e}'})()
+    
+    def _build_inputs(self, question, schema, constraints, error_feedback, variant):
+        """Keyword arguments for self.generate (prompt, schema, constraints, variant config)"""
         # Format schema as readable text
         schema_text = self._format_schema(schema)
         
@@ -109,13 +156,11 @@ class NL2SQLModule(dspy.Module):
             error_text = "None"
         
         # Enhanced prompt for better SQL generation
+        # (schema goes only in db_schema; repeating it here doubled prompt prefill)
         enhanced_question = f"""Generate ONLY valid SQLite SQL for this question.
 
 Question: {question}
 
-Available Tables and Columns:
-{schema_text}
-
 Extracted Constraints:
 {constraints_text}
 
@@ -124,8 +169,8 @@ Previous Error (if any):
 
 CRITICAL RULES:
 1. Quote "Order Details": FROM "Order Details" od
-2. Use EXACT table/column names from schema above
-3. Date filter: WHERE o.OrderDate BETWEEN 'YYYY-MM-DD' AND 'YYYY-MM-DD' (no DATE() function!)
+2. Use EXACT table/column names from db_schema (use its JOIN PATHS when listed)
+3. Date filter: WHERE o.OrderDate >= 'start' AND o.OrderDate < 'day after end' (no DATE() function!)
 4. Revenue: SUM(od.UnitPrice * od.Quantity * (1 - od.Discount))
    ↑ Use Order Details.UnitPrice, NOT Products.UnitPrice!
 5. ALWAYS include JOIN clause before using table alias:
@@ -137,34 +182,48 @@ CRITICAL RULES:
 
 SQL Query:"""
         
-        try:
-            result = self.generate(
-                question=enhanced_question,
-                db_schema=schema_text,
-                constraints=constraints_text,
-                error_feedback=error_text
-            )
-            
-            # Clean up the SQL
-            sql = result.sql.strip()
-            sql = sql.replace('```sql', '').replace('```', '')
-            sql = sql.split('\n\n')[0]  # Take only first paragraph
-            
-            # Remove comments
-            lines = [line for line in sql.split('\n') if not line.strip().startswith('--')]
-            sql = '\n'.join(lines)
-            
-            return type('Result', (), {'sql': sql.strip(), 'reasoning': ''})()
-            
-        except Exception as e:
-            print(f"   ⚠️  NL2SQL error: {e}")
-            return type('Result', (), {'sql': 'SELECT 1;', 'reasoning': f'Error: {e}'})()
+        settings = SQL_VARIANTS[variant % len(SQL_VARIANTS)]
+        if settings['guidance']:
+            enhanced_question = enhanced_question.replace("\n\nSQL Query:", f"\n7. {settings['guidance']}\n\nSQL Query:")
+        config = {'temperature': settings['temperature']} if settings['temperature'] is not None else {}
+        
+        return {
+            'question': enhanced_question,
+            'db_schema': schema_text,
+            'constraints': constraints_text,
+            'error_feedback': error_text,
+            'config': config,
+        }
+    
+    def _clean_result(self, result):
+        # Clean up the SQL
+        sql = result.sql.strip()
+        sql = sql.replace('```sql', '').replace('```', '')
+        sql = sql.split('\n\n')[0]  # Take only first paragraph
+        
+        # Remove comments
+        lines = [line for line in sql.split('\n') if not line.strip().startswith('--')]
+        sql = '\n'.join(lines)
+        
+        return type('Result', (), {'sql': sql.strip(), 'reasoning': ''})()
     
     def _analyze_error(self, error_msg):
         """Provide specific fix instructions based on error"""
         error_lower = error_msg.lower()
-        
-        if "no such column: o." in error_lower or "no such column: orders." in error_lower:
+
+        if "query too expensive" in error_lower:
+            return """
+🔧 FIX REQUIRED: Query refused as too expensive!
+
+Every table in FROM/JOIN must be linked with an ON condition (no comma joins):
+  JOIN Orders o ON od.OrderID = o.OrderID
+  JOIN Customers cu ON o.CustomerID = cu.CustomerID
+
+Return only what the question asks for: aggregate with SUM/COUNT ... GROUP BY,
+and use ORDER BY ... LIMIT N for top-N questions.
+"""
+
+        elif "no such column: o." in error_lower or "no such column: orders." in error_lower:
             return """
 🔧 FIX REQUIRED: Missing Orders JOIN!
 
@@ -229,6 +288,26 @@ class SynthesizerModule(dspy.Module):
         self.synthesize = dspy.Predict(SynthesizerSignature)
     
     def forward(self, question, doc_chunks, sql_results, format_hint):
+        try:
+            return self.synthesize(**self._build_inputs(question, doc_chunks, sql_results, format_hint))
+            
+        except Exception as e:
+            print(f"   ⚠️  Synthesizer error: {e}")
+            return self._error_result(e)
+    
+    async def aforward(self, question, doc_chunks, sql_results, format_hint):
+        """forward() for HybridAgent.arun: the LM call is awaited within the LM request limit"""
+        try:
+            inputs = self._build_inputs(question, doc_chunks, sql_results, format_hint)
+            async with get_async_limits().lm_slot():
+                return await self.synthesize.acall(**inputs)
+            
+        except Exception as e:
+            print(f"   ⚠️  Synthesizer error: {e}")
+            return self._error_result(e)
+    
+    def _build_inputs(self, question, doc_chunks, sql_results, format_hint):
+        """Keyword arguments for self.synthesize"""
         # Format inputs as text
         docs_text = self._format_docs(doc_chunks)
         sql_text = self._format_sql_results(sql_results)
@@ -250,28 +329,25 @@ CRITICAL RULES:
 2. If format_hint is 'float': return ONLY a decimal number (e.g., 123.45)
 3. If format_hint contains '{{': return valid JSON object (e.g., {{"category": "Beverages", "quantity": 100}})
 4. If format_hint contains 'list': return valid JSON array (e.g., [{{"product": "X", "revenue": 100.0}}])
-5. If SQL returned empty rows, check if you can infer the answer from context
-6. NO extra text, NO markdown, JUST the answer in the requested format
+5. SQL results are CSV (header line first); if rows were truncated, use the summary lines for the rest
+6. If SQL returned empty rows, check if you can infer the answer from context
+7. NO extra text, NO markdown, JUST the answer in the requested format
 
 Answer:"""
         
-        try:
-            result = self.synthesize(
-                question=enhanced_question,
-                doc_chunks=docs_text,
-                sql_results=sql_text,
-                format_hint=format_hint
-            )
-            
-            return result
-            
-        except Exception as e:
-            print(f"   ⚠️  Synthesizer error: {e}")
-            return type('Result', (), {
-                'answer': '0',
-                'explanation': f'Error during synthesis: {e}',
-                'confidence': '0.0'
-            })()
+        return {
+            'question': enhanced_question,
+            'doc_chunks': docs_text,
+            'sql_results': sql_text,
+            'format_hint': format_hint,
+        }
+    
+    def _error_result(self, error):
+        return type('Result', (), {
+            'answer': '0',
+            'explanation': f'Error during synthesis: {error}',
+            'confidence': '0.0'
+        })()
     
     def _format_docs(self, doc_chunks):
         """Format document chunks as text"""
@@ -291,7 +367,7 @@ Answer:"""
         return '\n'.join(lines) if lines else "No documents"
     
     def _format_sql_results(self, sql_results):
-        """Format SQL results as text"""
+        """Format SQL results as text (see agent/result_encoding.py for the row table)"""
         if not sql_results:
             return "No SQL executed"
         
@@ -302,7 +378,8 @@ Answer:"""
             if sql_results.get('success'):
                 rows = sql_results.get('rows', [])
                 if rows:
-                    return json.dumps(rows, indent=2)
+                    # CSV within a token budget, not indented JSON: big results used to flood the prompt
+                    return encode_rows(rows, sql_results.get('columns') or None)
                 else:
                     return "SQL executed successfully but returned no rows"
             else:
@@ -0,0 +1,158 @@
+import re
+from typing import Any, Dict, Optional
+
+# ==============================================================================
+# FORMAT HINT PARSING - 'int', 'float', '{category:str, quantity:int}', 'list[{...}]'
+# ==============================================================================
+
+SCALAR_TYPES = {'int', 'float', 'str', 'bool'}
+
+_OBJECT = re.compile(r'^\{(.*)\}$', re.DOTALL)
+_LIST = re.compile(r'^list\[(.*)\]$', re.DOTALL)
+
+
+def _parse_fields(body: str) -> Optional[list]:
+    fields = []
+    for part in body.split(','):
+        if not part.strip():
+            continue
+        name, sep, type_name = part.partition(':')
+        name, type_name = name.strip().strip('"\''), type_name.strip()
+        if not sep or not name or type_name not in SCALAR_TYPES:
+            return None
+        fields.append((name, type_name))
+    return fields or None
+
+
+def parse_format_hint(format_hint: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse a format hint into a typed spec.
+
+    Returns:
+        None if the hint is not understood, else one of:
+        - {'kind': 'scalar', 'type': 'int' | 'float' | 'str' | 'bool'}
+        - {'kind': 'object', 'fields': [(name, type), ...]}
+        - {'kind': 'list', 'item': <scalar or object spec>}
+    """
+    hint = (format_hint or '').strip()
+    if hint in SCALAR_TYPES:
+        return {'kind': 'scalar', 'type': hint}
+
+    match = _OBJECT.match(hint)
+    if match:
+        fields = _parse_fields(match.group(1))
+        return {'kind': 'object', 'fields': fields} if fields else None
+
+    match = _LIST.match(hint)
+    if match:
+        item = parse_format_hint(match.group(1))
+        if item is None or item['kind'] == 'list':
+            return None
+        return {'kind': 'list', 'item': item}
+
+    return None
+
+
+def object_fields(spec: Optional[Dict[str, Any]]) -> list:
+    """Fields of an object spec or of a list-of-objects spec ([] otherwise)"""
+    if not spec:
+        return []
+    if spec['kind'] == 'list':
+        spec = spec['item']
+    return spec.get('fields', []) if spec['kind'] == 'object' else []
+
+
+# ==============================================================================
+# DETERMINISTIC FORMATTING - Map SQL rows onto a parsed format hint
+# ==============================================================================
+
+FLOAT_DECIMALS = 2
+
+
+class FormatMismatch(ValueError):
+    """SQL rows can't be mapped onto the format hint without guessing"""
+
+
+def _normalize_name(name: str) -> str:
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+def _coerce(value: Any, type_name: str) -> Any:
+    """Coerce one SQL value to a hint type; refuses lossy conversions"""
+    if value is None:
+        raise FormatMismatch("NULL value")
+    if type_name == 'float':
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise FormatMismatch(f"{value!r} is not numeric")
+        return round(float(value), FLOAT_DECIMALS)
+    if type_name == 'int':
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise FormatMismatch(f"{value!r} is not an integer")
+        return value
+    if type_name == 'bool':
+        if value in (0, 1):
+            return bool(value)
+        raise FormatMismatch(f"{value!r} is not boolean")
+    if not isinstance(value, str):
+        raise FormatMismatch(f"{value!r} is not text")
+    return value
+
+
+def _map_columns(fields: list, columns: list) -> Dict[str, str]:
+    """
+    field name → result column.
+    Columns are matched by name (case/underscore-insensitive, or a column name
+    containing the field name: category → CategoryName). A field left over is only mapped to the
+    column left over when that column is an unaliased expression (SUM(...)) and the
+    field is the query's single numeric metric; anything else is a guess.
+    """
+    mapping, unmatched = {}, []
+    for name, type_name in fields:
+        key = _normalize_name(name)
+        exact = [col for col in columns if _normalize_name(col) == key]
+        partial = [col for col in columns if key and key in _normalize_name(col)]
+        candidates = exact or partial
+        if len(candidates) == 1 and candidates[0] not in mapping.values():
+            mapping[name] = candidates[0]
+        else:
+            unmatched.append((name, type_name))
+    if not unmatched:
+        return mapping
+
+    rest = [col for col in columns if col not in mapping.values()]
+    if (len(unmatched) == 1 and len(rest) == 1 and unmatched[0][1] in ('int', 'float')
+            and not re.fullmatch(r'\w+', rest[0])):
+        mapping[unmatched[0][0]] = rest[0]
+        return mapping
+    raise FormatMismatch(f"columns {columns} don't match fields {[name for name, _ in fields]}")
+
+
+def _format_row(spec: Dict[str, Any], row: dict) -> Any:
+    columns = list(row.keys())
+    if spec['kind'] == 'scalar':
+        if len(columns) != 1:
+            raise FormatMismatch(f"expected one column, got {columns}")
+        return _coerce(row[columns[0]], spec['type'])
+    mapping = _map_columns(spec['fields'], columns)
+    return {name: _coerce(row[mapping[name]], type_name) for name, type_name in spec['fields']}
+
+
+def format_rows(format_hint: str, rows: list) -> Any:
+    """
+    Build the final answer straight from SQL rows.
+
+    Scalars and objects need exactly one row; lists take every row in order.
+
+    Raises:
+        FormatMismatch: when the hint isn't understood or the rows don't fit it
+    """
+    spec = parse_format_hint(format_hint)
+    if spec is None:
+        raise FormatMismatch(f"unsupported format hint: {format_hint!r}")
+    if spec['kind'] == 'list':
+        return [_format_row(spec['item'], row) for row in rows]
+    if len(rows) != 1:
+        raise FormatMismatch(f"expected one row, got {len(rows)}")
+    return _format_row(spec, rows[0])
@@ -1,11 +1,65 @@
-from typing import TypedDict, Literal, Any
+from typing import Annotated, TypedDict, Literal, Any
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
 from langgraph.graph import StateGraph, END
+import asyncio
 import json
+import operator
 import re
-
-from agent.dspy_signatures import QuestionRouter, NL2SQLModule, SynthesizerModule
+import threading
+import time
+
+from agent.async_limits import get_async_limits
+from agent.micro_batch import MicroBatcher, distinct_batch, BATCH_WINDOW_MS, MAX_BATCH
+from agent.lm_setup import get_lm
+from agent.routing import rule_route
+from agent.answer_cache import SemanticAnswerCache, constraint_key
+from agent.kpi_templates import KPITemplateEngine
+from agent.format_hint import format_rows, FormatMismatch
 from agent.rag.retrieval import DocumentRetriever
+from agent.tools import sqlite_tool
 from agent.tools.sqlite_tool import get_schema_text, execute_sql, extract_tables_from_sql
+from agent.tools.schema_linker import SchemaLinker
+from agent.tools.sql_repair import SQLAutoRepair
+from agent.tools.sql_cache import db_fingerprint
+from agent.tools.rollups import get_rollups
+
+# Per-question log buffer; set by HybridAgent.capture_logs() so concurrent
+# questions don't interleave their output line by line.
+_log_buffer: ContextVar[list[str] | None] = ContextVar('hybrid_agent_log_buffer', default=None)
+
+# DSPy modules built on first use (see HybridAgent.__getattr__): importing dspy
+# costs seconds, and rule-routed, templated or cached questions never need it.
+_LM_MODULES = {'router': 'QuestionRouter', 'nl2sql': 'NL2SQLModule', 'synthesizer': 'SynthesizerModule'}
+_lm_modules_lock = threading.Lock()
+
+
+def _result_signature(result: dict) -> tuple:
+    """Hashable summary of a successful result, so candidates returning the same rows can be counted"""
+    rows = result['rows'].tuples() if hasattr(result['rows'], 'tuples') else [tuple(r.values()) for r in result['rows']]
+    return tuple(tuple(round(v, 2) if isinstance(v, float) else v for v in row) for row in rows)
+
+
+def _strip_fences(sql: str) -> str:
+    return re.sub(r'^```sql\n|```$', '', sql.strip(), flags=re.MULTILINE)
+
+
+def _timing(name: str, state: dict, start: float) -> tuple:
+    """(node, start ms relative to run(), duration ms)"""
+    return name, (start - state.get('started_at', start)) * 1000, (time.perf_counter() - start) * 1000
+
+
+def format_timings(timings: list[tuple]) -> str:
+    """'router 0→2ms | retriever 2→40ms, db_prep 2→15ms | ...': nodes that ran side by side share a group"""
+    groups: list[list[tuple]] = []
+    for name, start, elapsed in sorted(timings, key=lambda t: t[1]):
+        if groups and start < max(s + e for _, s, e in groups[-1]):
+            groups[-1].append((name, start, elapsed))
+        else:
+            groups.append([(name, start, elapsed)])
+    return ' | '.join(', '.join(f"{name} {start:.0f}→{start + elapsed:.0f}ms" for name, start, elapsed in group)
+                      for group in groups)
 
 
 # ------------------------------
@@ -26,96 +80,309 @@ class AgentState(TypedDict):
     citations: list[str]
     repair_count: int
     max_repairs: int
+    sql_source: str  # 'llm', 'speculative', 'answer_cache' or 'kpi_template'
+    started_at: float  # perf_counter() when run() started
+    node_timings: Annotated[list[tuple], operator.add]  # (node, start ms, duration ms), appended by every node
 
 
 # ------------------------------
 # Hybrid Agent
 # ------------------------------
 class HybridAgent:
-    def __init__(self, enable_logging: bool = True):
+    def __init__(self, enable_logging: bool = True, answer_cache_threshold: float | None = 0.85,
+                 retrieval_mode: str = 'tfidf', sql_candidates: int = 1, candidate_strategy: str = 'vote'):
+        """
+        Args:
+            enable_logging: Print node progress
+            answer_cache_threshold: Similarity above which a rephrased question reuses
+                SQL from an earlier one (None disables the semantic answer cache)
+            retrieval_mode: DocumentRetriever backend: 'tfidf', 'dense' or 'hybrid'
+            sql_candidates: SQL candidates generated and executed concurrently on the
+                first NL2SQL attempt (1 = a single candidate, repaired serially)
+            candidate_strategy: 'vote' waits for all candidates and takes the result most
+                of them agree on; 'first' takes the first candidate that succeeds
+        """
+        if candidate_strategy not in ('vote', 'first'):
+            raise ValueError(f"candidate_strategy must be 'vote' or 'first', got {candidate_strategy!r}")
         self.enable_logging = enable_logging
-        self.retriever = DocumentRetriever()
-        self.router = QuestionRouter()
-        self.nl2sql = NL2SQLModule()
-        self.synthesizer = SynthesizerModule()
+        self.sql_candidates = max(1, sql_candidates)
+        self.candidate_strategy = candidate_strategy
+        self.retriever = DocumentRetriever(mode=retrieval_mode)
+        self.answer_cache = SemanticAnswerCache(answer_cache_threshold) if answer_cache_threshold is not None else None
         self.schema = get_schema_text()  # ← FIX: Use text format
+        self.schema_linker = SchemaLinker()
+        self.sql_repair = SQLAutoRepair(self.schema_linker)
+        self.kpi_templates = KPITemplateEngine()
+        self.graph = self.build_graph()  # Compiled once, reused for every question
+        self.agraph = self.build_graph(asynchronous=True)
+        self.micro_batches: dict[str, MicroBatcher] | None = None  # see enable_micro_batching()
+
+    def __getattr__(self, name):
+        """Build the DSPy modules (router, nl2sql, synthesizer) the first time one is used"""
+        if name not in _LM_MODULES:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+        with _lm_modules_lock:
+            if name not in self.__dict__:
+                from agent import dspy_signatures
+
+                module = getattr(dspy_signatures, _LM_MODULES[name])()
+                lm = get_lm()
+                if lm is not None:  # otherwise the module uses dspy.settings.lm
+                    module.set_lm(lm)
+                self.__dict__[name] = module
+        return self.__dict__[name]
 
     def log(self, *args):
         if self.enable_logging:
-            print(*args)
+            buffer = _log_buffer.get()
+            if buffer is not None:
+                buffer.append(' '.join(str(arg) for arg in args))
+            else:
+                print(*args)
+
+    @contextmanager
+    def capture_logs(self):
+        """
+        Collect log lines emitted while answering a question instead of printing them.
+        Used by concurrent batch runs to print each question's log as one block.
+        """
+        lines: list[str] = []
+        token = _log_buffer.set(lines)
+        try:
+            yield lines
+        finally:
+            _log_buffer.reset(token)
 
     # ------------------------------
     # Nodes
     # ------------------------------
     def router_node(self, state: AgentState) -> AgentState:
         self.log("📍 Router: Classifying question...")
-        route = self.router(state['question'])
+        route = rule_route(state['question']) or self.router(state['question'])
         self.log(f"   → Route: {route}")
-        return {**state, 'route': route}
+        return {'route': route}
 
     def retriever_node(self, state: AgentState) -> AgentState:
-        if state['route'] in ['rag', 'hybrid']:
-            self.log("📍 Retriever: Searching documents...")
-            chunks = self.retriever.search(state['question'], top_k=3)
-            self.log(f"   → Retrieved {len(chunks)} chunks")
-            for chunk in chunks:
-                self.log(f"      - {chunk['id']} (score: {chunk['score']:.2f})")
-            return {**state, 'retrieved_chunks': chunks}
-        return state
+        self.log("📍 Retriever: Searching documents...")
+        return self._retrieved(self.retriever.search(state['question'], top_k=3))
+
+    def _retrieved(self, chunks: list[dict]) -> AgentState:
+        self.log(f"   → Retrieved {len(chunks)} chunks")
+        for chunk in chunks:
+            self.log(f"      - {chunk['id']} (score: {chunk['score']:.2f})")
+        return {'retrieved_chunks': chunks}
+
+    def db_prep_node(self, state: AgentState) -> AgentState:
+        """
+        Database-side work that doesn't need the retrieved documents, so on hybrid
+        questions it runs alongside the retriever: bring the KPI rollups up to date
+        (a rebuild after a DB change is the slow part). The semantic answer cache is
+        probed later, by nl2sql, once the planner has resolved the constraints.
+        """
+        self.log("📍 DB prep: Warming rollups...")
+        self._prep_db([state['question']])
+        return {}
+
+    def _prep_db(self, questions: list[str]) -> list[None]:
+        """One rollup freshness check for a batch of questions"""
+        rollups = get_rollups(sqlite_tool.DB_PATH)
+        if rollups is not None:
+            rollups.ensure()
+        return [None] * len(questions)
 
     def planner_node(self, state: AgentState) -> AgentState:
-        if state['route'] in ['sql', 'hybrid']:
-            self.log("📍 Planner: Extracting constraints...")
-            constraints = self._extract_constraints(
-                state['question'], state.get('retrieved_chunks', [])
-            )
-            self.log(f"   → Constraints: {json.dumps(constraints, indent=4)}")
-            return {**state, 'constraints': constraints}
-        return state
+        self.log("📍 Planner: Extracting constraints...")
+        constraints = self._extract_constraints(
+            state['question'], state.get('retrieved_chunks', [])
+        )
+        self.log(f"   → Constraints: {json.dumps(constraints, indent=4)}")
+
+        template = self.kpi_templates.match(
+            state['question'], state['format_hint'], constraints, state.get('retrieved_chunks', [])
+        )
+        if template:
+            self.log(f"   ⚡ KPI template: {template['name']} (skipping NL2SQL)")
+            self.log(f"   → SQL:\n      {template['sql']}")
+            return {'constraints': constraints, 'sql_query': template['sql'], 'sql_source': 'kpi_template'}
+        return {'constraints': constraints}
 
     def nl2sql_node(self, state: AgentState) -> AgentState:
-        if state['route'] in ['sql', 'hybrid']:
-            self.log("📍 NL2SQL: Generating SQL query...")
-            error_feedback = state.get('sql_error') if state.get('repair_count', 0) > 0 else None
-            if error_feedback:
-                self.log(f"   ⚠️  Repair attempt {state['repair_count']}, previous error: {error_feedback}")
-            
-            result = self.nl2sql(
-                state['question'],
-                self.schema,
-                state.get('constraints', {}),
-                error_feedback=error_feedback
-            )
-            sql = re.sub(r'^```sql\n|```$', '', result.sql.strip(), flags=re.MULTILINE)
-            self.log(f"   → Generated SQL:\n      {sql}")
-            return {**state, 'sql_query': sql}
-        return state
+        reused = self._reuse_cached_sql(state)
+        if reused is not None:
+            return reused
+        
+        error_feedback, linked = self._start_nl2sql(state)
+        if self.sql_candidates > 1 and not error_feedback:
+            speculated = self._speculate(state, linked['text'])
+            if speculated is not None:
+                return speculated
+        
+        result = self.nl2sql(
+            state['question'],
+            linked['text'],
+            state.get('constraints', {}),
+            error_feedback=error_feedback
+        )
+        return self._generated_sql(result)
+
+    def _reuse_cached_sql(self, state: AgentState) -> AgentState | None:
+        """First attempt of a question with an answer-cache entry for the same constraints: reuse its SQL"""
+        if self.answer_cache is None or state.get('repair_count', 0) > 0:
+            return None
+        cached = self.answer_cache.lookup(state['question'], state['format_hint'], self._cache_fingerprint(),
+                                          constraint_key(state.get('constraints')))
+        if cached:
+            self.log(f"📍 NL2SQL: ♻️  Reusing SQL from similar question (similarity {cached['similarity']:.2f})")
+            self.log(f"   → \"{cached['question']}\"")
+            return {'sql_query': cached['sql'], 'sql_source': 'answer_cache'}
+        return None
+
+    def _start_nl2sql(self, state: AgentState) -> tuple:
+        """Repair feedback (None on the first attempt) and the schema linked for this question"""
+        self.log("📍 NL2SQL: Generating SQL query...")
+        error_feedback = state.get('sql_error') if state.get('repair_count', 0) > 0 else None
+        if error_feedback:
+            self.log(f"   ⚠️  Repair attempt {state['repair_count']}, previous error: {error_feedback}")
+        
+        linked = self.schema_linker.link(state['question'], state.get('constraints', {}))
+        self.log(f"   → Schema: {len(linked['tables'])} tables {linked['tables']}, "
+                 f"~{linked['tokens_linked']} of ~{linked['tokens_full']} prompt tokens")
+        return error_feedback, linked
+
+    def _generated_sql(self, result) -> AgentState:
+        sql = _strip_fences(result.sql)
+        self.log(f"   → Generated SQL:\n      {sql}")
+        return {'sql_query': sql, 'sql_source': 'llm'}
+
+    def _speculate(self, state: AgentState, schema_text: str) -> AgentState | None:
+        """
+        Generate `sql_candidates` SQL variants concurrently and execute each as soon as it
+        is generated, instead of waiting on executor → repair → nl2sql round-trips.
+        Failed candidates leave the serial repair loop as the fallback.
+
+        Returns:
+            State update with sql_query/sql_results of the picked candidate,
+            or None if no candidate could be generated at all
+        """
+        k = self.sql_candidates
+        self.log(f"   ⚡ Speculating {k} SQL candidates ({self.candidate_strategy})")
+
+        def attempt(variant):
+            generated = self.nl2sql(state['question'], schema_text, state.get('constraints', {}), variant=variant)
+            return (variant, *self._run_candidate(generated))
+
+        # Each task gets a copy of this context: DSPy settings and the log buffer follow it
+        pool = ThreadPoolExecutor(max_workers=k, thread_name_prefix='nl2sql')
+        futures = [pool.submit(copy_context().run, attempt, variant) for variant in range(k)]
+        candidates = []
+        try:
+            for future in as_completed(futures):
+                if self._collect_candidate(candidates, *future.result()):
+                    break
+        finally:
+            # 'first' doesn't wait for the stragglers; their results are simply dropped
+            pool.shutdown(wait=self.candidate_strategy == 'vote', cancel_futures=True)
+        return self._finish_speculation(state, candidates)
+
+    def _run_candidate(self, generated) -> tuple:
+        """(sql, result) of one generated candidate after local repair; (None, None) if generation failed"""
+        if generated.reasoning.startswith('Error'):
+            return None, None
+        sql = self._check_sql(_strip_fences(generated.sql))
+        return sql, execute_sql(sql)
+
+    def _collect_candidate(self, candidates: list, variant: int, sql: str | None, result: dict | None) -> bool:
+        """Record a finished candidate; True when the 'first' strategy can stop waiting"""
+        if sql is None:
+            return False
+        candidates.append((variant, sql, result))
+        status = f"✓ {result['row_count']} rows" if result['success'] else f"✗ {result['error']}"
+        self.log(f"   → Candidate {variant}: {status}")
+        return self.candidate_strategy == 'first' and result['success'] and bool(result['rows'])
+
+    def _finish_speculation(self, state: AgentState, candidates: list) -> AgentState | None:
+        if not candidates:
+            self.log("   ✗ No candidate generated, falling back to a single NL2SQL call")
+            return None
+        variant, sql, result = self._pick_candidate(candidates)
+        self.log(f"   → Picked candidate {variant}:\n      {sql}")
+        if result['success']:
+            self._remember_sql(state, sql, result)
+        return {'sql_query': sql, 'sql_source': 'speculative', 'sql_results': result, 'sql_error': result.get('error')}
+
+    def _pick_candidate(self, candidates: list) -> tuple:
+        """
+        Candidate whose result the most successful candidates agree on (non-empty results
+        before empty ones, ties to the lowest variant); if none succeeded, the lowest
+        variant's failure so the repair loop sees its error.
+        """
+        candidates.sort(key=lambda c: c[0])
+        succeeded = [c for c in candidates if c[2]['success']]
+        if not succeeded:
+            return candidates[0]
+        votes: dict = {}
+        for candidate in succeeded:
+            votes.setdefault(_result_signature(candidate[2]), []).append(candidate)
+        best = max(votes.values(), key=lambda group: (bool(group[0][2]['rows']), len(group), -group[0][0]))
+        if len(votes) > 1:
+            self.log(f"   → {len(best)} of {len(succeeded)} successful candidates agree")
+        return best[0]
+
+    def _remember_sql(self, state: AgentState, sql: str, result: dict):
+        """Offer freshly generated SQL that returned rows to the semantic answer cache"""
+        if self.answer_cache is not None and result['rows']:
+            self.answer_cache.add(state['question'], state['format_hint'], sql, self._cache_fingerprint(),
+                                  state.get('constraints'))
+
+    def _check_sql(self, sql: str) -> str:
+        """Validate with EXPLAIN and apply local rewrites; only what's left needs an LLM repair turn"""
+        checked = self.sql_repair.repair(sql)
+        if checked['fixes']:
+            self.log(f"   🔧 Auto-repaired locally: {'; '.join(checked['fixes'])}")
+        return checked['sql']
 
     def executor_node(self, state: AgentState) -> AgentState:
         if state.get('sql_query'):
             self.log("📍 Executor: Running SQL...")
-            result = execute_sql(state['sql_query'])
-            if result['success']:
-                self.log(f"   ✓ Success: {len(result['rows'])} rows returned")
-                if result['rows']:
-                    self.log(f"   Sample: {result['rows'][0]}")
-            else:
-                self.log(f"   ✗ Error: {result['error']}")
-            return {**state, 'sql_results': result, 'sql_error': result.get('error')}
-        return state
+            sql = self._executor_sql(state)
+            return self._executed(state, sql, execute_sql(sql))
+        return {}
+
+    def _executor_sql(self, state: AgentState) -> str:
+        if state.get('sql_source') == 'kpi_template':  # templates are validated at startup
+            return state['sql_query']
+        return self._check_sql(state['sql_query'])
+
+    def _executed(self, state: AgentState, sql: str, result: dict) -> AgentState:
+        if result['success']:
+            self.log(f"   ✓ Success: {len(result['rows'])} rows returned")
+            if result['rows']:
+                self.log(f"   Sample: {result['rows'][0]}")
+            if state.get('sql_source') == 'llm':
+                self._remember_sql(state, sql, result)
+        else:
+            self.log(f"   ✗ Error: {result['error']}")
+        return {'sql_query': sql, 'sql_results': result, 'sql_error': result.get('error')}
 
     def repair_node(self, state: AgentState) -> AgentState:
         self.log("📍 Repair: Incrementing repair count for SQL")
-        return {**state, 'repair_count': state.get('repair_count', 0) + 1}
+        return {'repair_count': state.get('repair_count', 0) + 1}
 
     def synthesizer_node(self, state: AgentState) -> AgentState:
         self.log("📍 Synthesizer: Creating final answer...")
+        formatted = self._format_from_sql(state)
+        if formatted is not None:
+            return formatted
+
         result = self.synthesizer(
             state['question'],
             state.get('retrieved_chunks', []),
             state.get('sql_results', {}),
             state['format_hint']
         )
+        return self._synthesis_update(state, result)
+
+    def _synthesis_update(self, state: AgentState, result) -> AgentState:
         final_answer = self._parse_answer(result.answer, state['format_hint'], state.get('sql_results', {}))
         citations = self._collect_citations(state)
         confidence = self._calculate_confidence(state, result)
@@ -125,16 +392,184 @@ class HybridAgent:
         self.log(f"   → Citations: {citations}")
 
         return {
-            **state,
             'final_answer': final_answer,
             'explanation': result.explanation,
             'confidence': confidence,
             'citations': citations
         }
 
+    # ------------------------------
+    # Async Nodes (arun): LM calls are awaited under the shared LM request limit,
+    # SQLite and retrieval run on the bounded worker pool
+    # ------------------------------
+    async def arouter_node(self, state: AgentState) -> AgentState:
+        self.log("📍 Router: Classifying question...")
+        route = rule_route(state['question']) or await self.router.acall(state['question'])
+        self.log(f"   → Route: {route}")
+        return {'route': route}
+
+    async def aretriever_node(self, state: AgentState) -> AgentState:
+        if self.micro_batches is None:
+            return await get_async_limits().run_blocking(self.retriever_node, state)
+        self.log("📍 Retriever: Searching documents...")
+        return self._retrieved(await self.micro_batches['retrieval'].submit(state['question']))
+
+    async def adb_prep_node(self, state: AgentState) -> AgentState:
+        if self.micro_batches is None:
+            return await get_async_limits().run_blocking(self.db_prep_node, state)
+        self.log("📍 DB prep: Warming rollups...")
+        await self.micro_batches['db_prep'].submit(state['question'])
+        return {}
+
+    async def aplanner_node(self, state: AgentState) -> AgentState:
+        return self.planner_node(state)  # regexes and template matching only
+
+    async def anl2sql_node(self, state: AgentState) -> AgentState:
+        reused = await get_async_limits().run_blocking(self._reuse_cached_sql, state)
+        if reused is not None:
+            return reused
+
+        error_feedback, linked = self._start_nl2sql(state)
+        if self.sql_candidates > 1 and not error_feedback:
+            speculated = await self._aspeculate(state, linked['text'])
+            if speculated is not None:
+                return speculated
+
+        result = await self.nl2sql.acall(
+            state['question'],
+            linked['text'],
+            state.get('constraints', {}),
+            error_feedback=error_feedback
+        )
+        return self._generated_sql(result)
+
+    async def _aspeculate(self, state: AgentState, schema_text: str) -> AgentState | None:
+        """_speculate() on the event loop: candidates are tasks instead of threads"""
+        k = self.sql_candidates
+        self.log(f"   ⚡ Speculating {k} SQL candidates ({self.candidate_strategy})")
+
+        async def attempt(variant):
+            generated = await self.nl2sql.acall(state['question'], schema_text, state.get('constraints', {}),
+                                                variant=variant)
+            return (variant, *await get_async_limits().run_blocking(self._run_candidate, generated))
+
+        tasks = [asyncio.ensure_future(attempt(variant)) for variant in range(k)]
+        candidates = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                if self._collect_candidate(candidates, *await next_done):
+                    break
+        finally:
+            # 'first' doesn't wait for the stragglers (no-op for 'vote', where all are done)
+            for task in tasks:
+                task.cancel()
+        return self._finish_speculation(state, candidates)
+
+    async def aexecutor_node(self, state: AgentState) -> AgentState:
+        if self.micro_batches is None or not state.get('sql_query'):
+            return await get_async_limits().run_blocking(self.executor_node, state)
+        self.log("📍 Executor: Running SQL...")
+        sql = await get_async_limits().run_blocking(self._executor_sql, state)
+        return self._executed(state, sql, await self.micro_batches['sql'].submit(sql))
+
+    async def arepair_node(self, state: AgentState) -> AgentState:
+        return self.repair_node(state)
+
+    async def asynthesizer_node(self, state: AgentState) -> AgentState:
+        self.log("📍 Synthesizer: Creating final answer...")
+        formatted = self._format_from_sql(state)
+        if formatted is not None:
+            return formatted
+
+        result = await self.synthesizer.acall(
+            state['question'],
+            state.get('retrieved_chunks', []),
+            state.get('sql_results', {}),
+            state['format_hint']
+        )
+        return self._synthesis_update(state, result)
+
+    # ------------------------------
+    # Micro-batching (arun only)
+    # ------------------------------
+    def enable_micro_batching(self, window_ms: float = BATCH_WINDOW_MS, max_batch: int = MAX_BATCH):
+        """
+        Group the retrieval, DB prep and SQL execution of concurrent arun() calls:
+        questions arriving within `window_ms` of each other share one vectorized
+        search_many(), one rollup check and one worker hop, and identical SQL
+        runs once for all of them. Meant for the HTTP service, where requests
+        arrive one by one.
+        """
+        self.micro_batches = {
+            'retrieval': MicroBatcher(self._search_batch, window_ms, max_batch),
+            'db_prep': MicroBatcher(self._db_prep_batch, window_ms, max_batch),
+            'sql': MicroBatcher(self._execute_batch, window_ms, max_batch),
+        }
+
+    def warm_up(self):
+        """
+        Do the first question's one-off work now: rollup build, pool connections,
+        retrieval index and the DSPy modules (with dspy itself)
+        """
+        self._prep_db([])
+        with sqlite_tool.get_pool().connection() as conn:
+            conn.execute("SELECT 1").fetchall()
+        self.retriever.search("warm up", top_k=1)
+        for name in _LM_MODULES:
+            getattr(self, name)
+
+    async def _search_batch(self, questions: list[str]) -> list[list[dict]]:
+        distinct = list(dict.fromkeys(questions))
+        found = await get_async_limits().run_blocking(self.retriever.search_many, distinct, 3)
+        by_question = dict(zip(distinct, found))
+        return [by_question[question] for question in questions]
+
+    async def _db_prep_batch(self, questions: list[str]) -> list[None]:
+        return await get_async_limits().run_blocking(self._prep_db, questions)
+
+    async def _execute_batch(self, queries: list[str]) -> list[dict]:
+        return await distinct_batch(queries, lambda sql: get_async_limits().run_blocking(execute_sql, sql))
+
     # ------------------------------
     # Helper Methods
     # ------------------------------
+    def _format_from_sql(self, state: AgentState) -> AgentState | None:
+        """
+        Answer without the LLM when the SQL rows already fit the format hint.
+        Returns None (→ SynthesizerModule) when there's no SQL result or it doesn't map cleanly.
+        """
+        sql_results = state.get('sql_results', {})
+        if state.get('route') == 'rag' or not sql_results.get('success'):
+            return None
+        try:
+            final_answer = format_rows(state['format_hint'], sql_results['rows'])
+        except FormatMismatch as e:
+            self.log(f"   → Needs LLM synthesis ({e})")
+            return None
+
+        tables = extract_tables_from_sql(state['sql_query'])
+        rows = len(sql_results['rows'])
+        explanation = (f"Computed directly from the SQL result ({rows} row{'s' if rows != 1 else ''} "
+                       f"over {', '.join(tables) or 'the database'}).")
+        citations = self._collect_citations(state)
+        confidence = self._calculate_confidence(state, None)
+
+        self.log("   ⚡ Formatted from SQL result (skipping LLM)")
+        self.log(f"   → Answer: {final_answer}")
+        self.log(f"   → Confidence: {confidence:.2f}")
+        self.log(f"   → Citations: {citations}")
+
+        return {
+            'final_answer': final_answer,
+            'explanation': explanation,
+            'confidence': confidence,
+            'citations': citations
+        }
+
+    def _cache_fingerprint(self):
+        """Answer cache entries are only valid for the current DB and docs"""
+        return (db_fingerprint(sqlite_tool.DB_PATH), self.retriever.fingerprint)
+
     def _extract_constraints(self, question, chunks):
         """
         Extract constraints from retrieved docs and question.
@@ -221,7 +656,7 @@ class HybridAgent:
                 except:
                     # Fallback: return SQL rows directly
                     if sql_results and sql_results.get('rows'):
-                        return sql_results['rows']
+                        return list(sql_results['rows'])
                     return []
             
             return answer_str
@@ -231,7 +666,7 @@ class HybridAgent:
             # Try to use SQL results directly
             if sql_results and sql_results.get('rows'):
                 if format_hint.startswith('list'):
-                    return sql_results['rows']
+                    return list(sql_results['rows'])
                 elif format_hint.startswith('{') and sql_results['rows']:
                     return sql_results['rows'][0]
             return answer_str
@@ -279,28 +714,72 @@ class HybridAgent:
             return 'repair'
         return 'synthesize'
 
-    def route_after_router(self, state: AgentState) -> Literal['retriever', 'planner']:
-        return 'retriever' if state['route'] in ['rag', 'hybrid'] else 'planner'
+    def route_after_router(self, state: AgentState) -> list[Literal['retriever', 'db_prep']]:
+        # Hybrid questions fan out: retrieval and DB prep don't depend on each other
+        return {
+            'rag': ['retriever'],
+            'hybrid': ['retriever', 'db_prep'],
+        }.get(state['route'], ['db_prep'])
+
+    def route_after_planner(self, state: AgentState) -> Literal['nl2sql', 'executor']:
+        # A matched KPI template already produced validated SQL
+        return 'executor' if state.get('sql_source') == 'kpi_template' else 'nl2sql'
+
+    def route_after_nl2sql(self, state: AgentState) -> Literal['executor', 'repair', 'synthesize']:
+        # Speculative candidates were already executed; go straight to the repair decision
+        if state.get('sql_source') == 'speculative':
+            return self.should_repair(state)
+        return 'executor'
+
+    def route_after_retriever(self, state: AgentState) -> Literal['planner', 'synthesize']:
+        # Pure RAG questions have no SQL work to do; hybrid ones join db_prep at the planner
+        return 'synthesize' if state['route'] == 'rag' else 'planner'
 
     # ------------------------------
     # Graph Construction
     # ------------------------------
-    def build_graph(self):
+    def _timed(self, name: str, node):
+        """Wrap a node so its update also records (name, start ms, duration ms) relative to run()"""
+        def timed_node(state: AgentState) -> AgentState:
+            start = time.perf_counter()
+            update = node(state)
+            return {**update, 'node_timings': [_timing(name, state, start)]}
+        return timed_node
+
+    def _atimed(self, name: str, node):
+        """_timed() for async nodes"""
+        async def timed_node(state: AgentState) -> AgentState:
+            start = time.perf_counter()
+            update = await node(state)
+            return {**update, 'node_timings': [_timing(name, state, start)]}
+        return timed_node
+
+    def build_graph(self, asynchronous: bool = False):
+        """
+        Build and compile the workflow.
+        Called once from __init__ for run() and once for arun() (asynchronous=True,
+        same edges with the async nodes); compiled graphs are stateless and reused.
+
+        Nodes return only the keys they change. For hybrid questions the router fans
+        out to retriever and db_prep, which run in the same step (concurrently) and
+        both feed the planner; it runs once, after both.
+        """
         workflow = StateGraph(AgentState)
 
-        workflow.add_node("router", self.router_node)
-        workflow.add_node("retriever", self.retriever_node)
-        workflow.add_node("planner", self.planner_node)
-        workflow.add_node("nl2sql", self.nl2sql_node)
-        workflow.add_node("executor", self.executor_node)
-        workflow.add_node("repair", self.repair_node)
-        workflow.add_node("synthesizer", self.synthesizer_node)
+        names = ["router", "retriever", "db_prep", "planner", "nl2sql", "executor", "repair", "synthesizer"]
+        for name in names:
+            if asynchronous:
+                workflow.add_node(name, self._atimed(name, getattr(self, f"a{name}_node")))
+            else:
+                workflow.add_node(name, self._timed(name, getattr(self, f"{name}_node")))
 
         workflow.set_entry_point("router")
-        workflow.add_conditional_edges("router", self.route_after_router, {'retriever': 'retriever', 'planner': 'planner'})
-        workflow.add_edge("retriever", "planner")
-        workflow.add_edge("planner", "nl2sql")
-        workflow.add_edge("nl2sql", "executor")
+        workflow.add_conditional_edges("router", self.route_after_router, ['retriever', 'db_prep'])
+        workflow.add_conditional_edges("retriever", self.route_after_retriever, {'planner': 'planner', 'synthesize': 'synthesizer'})
+        workflow.add_edge("db_prep", "planner")
+        workflow.add_conditional_edges("planner", self.route_after_planner, {'nl2sql': 'nl2sql', 'executor': 'executor'})
+        workflow.add_conditional_edges("nl2sql", self.route_after_nl2sql,
+                                       {'executor': 'executor', 'repair': 'repair', 'synthesize': 'synthesizer'})
         workflow.add_conditional_edges("executor", self.should_repair, {'repair': 'repair', 'synthesize': 'synthesizer'})
         workflow.add_edge("repair", "nl2sql")
         workflow.add_edge("synthesizer", END)
@@ -308,8 +787,22 @@ class HybridAgent:
         return workflow.compile()
 
     def run(self, question: str, format_hint: str, max_repairs: int = 2):
-        graph = self.build_graph()
-        initial_state: AgentState = {
+        final_state = self.graph.invoke(self._initial_state(question, format_hint, max_repairs))
+        self.log(f"⏱️  {format_timings(final_state['node_timings'])}")
+        return final_state
+
+    async def arun(self, question: str, format_hint: str, max_repairs: int = 2):
+        """
+        run() without blocking the event loop, so one process can keep many questions
+        in flight. LM calls wait for a slot under get_async_limits() (backpressure on
+        the LM server); SQLite and retrieval run on its bounded worker pool.
+        """
+        final_state = await self.agraph.ainvoke(self._initial_state(question, format_hint, max_repairs))
+        self.log(f"⏱️  {format_timings(final_state['node_timings'])}")
+        return final_state
+
+    def _initial_state(self, question: str, format_hint: str, max_repairs: int) -> AgentState:
+        return {
             'question': question,
             'format_hint': format_hint,
             'route': '',
@@ -323,6 +816,8 @@ class HybridAgent:
             'confidence': 0.0,
             'citations': [],
             'repair_count': 0,
-            'max_repairs': max_repairs
-        }
-        return graph.invoke(initial_state)
\ No newline at end of file
+            'max_repairs': max_repairs,
+            'sql_source': '',
+            'started_at': time.perf_counter(),
+            'node_timings': []
+        }
\ No newline at end of file
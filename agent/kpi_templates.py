@@ -0,0 +1,312 @@
+import re
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+from agent.format_hint import parse_format_hint, object_fields
+from agent.tools.sqlite_tool import get_pool
+
+# ==============================================================================
+# KPI TEMPLATES - Deterministic SQL for the KPIs in docs/kpi_definitions.md
+# ==============================================================================
+
+CATEGORIES = ['Beverages', 'Condiments', 'Confections', 'Dairy Products',
+              'Grains/Cereals', 'Meat/Poultry', 'Produce', 'Seafood']
+
+REVENUE = "SUM(od.UnitPrice * od.Quantity * (1 - od.Discount))"
+
+METRICS = {
+    'revenue': REVENUE,
+    'quantity': "SUM(od.Quantity)",
+    'aov': f"{REVENUE} / COUNT(DISTINCT od.OrderID)",
+    # GM = SUM((UnitPrice - CostOfGoods) * Quantity * (1 - Discount)), CostOfGoods ≈ ratio * UnitPrice
+    'gross_margin': "SUM((od.UnitPrice - {cost_ratio} * od.UnitPrice) * od.Quantity * (1 - od.Discount))",
+}
+
+# dimension → (SELECT/GROUP BY expression, joins it needs)
+DIMENSIONS = {
+    'category': ('c.CategoryName', ['products', 'categories']),
+    'product': ('p.ProductName', ['products']),
+    'customer': ('cu.CompanyName', ['orders', 'customers']),
+}
+
+# Join clauses in dependency order
+JOINS = {
+    'orders': "JOIN Orders o ON od.OrderID = o.OrderID",
+    'products': "JOIN Products p ON od.ProductID = p.ProductID",
+    'categories': "JOIN Categories c ON p.CategoryID = c.CategoryID",
+    'customers': "JOIN Customers cu ON o.CustomerID = cu.CustomerID",
+}
+
+# Words in format hint fields / questions that name a dimension or metric
+_DIMENSION_WORDS = {
+    'category': 'category', 'categoryname': 'category',
+    'product': 'product', 'productname': 'product',
+    'customer': 'customer', 'company': 'customer', 'companyname': 'customer',
+}
+_METRIC_FIELDS = {
+    'revenue': 'revenue', 'sales': 'revenue', 'quantity': 'quantity', 'qty': 'quantity',
+    'aov': 'aov', 'margin': 'gross_margin', 'gross_margin': 'gross_margin',
+}
+
+_ISO_DATE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_DATE_RANGE = re.compile(r'(\d{4}-\d{2}-\d{2})\s+(?:to|and|through|-)\s+(\d{4}-\d{2}-\d{2})')
+_YEAR = re.compile(r'\b((?:19|20)\d{2})\b')
+# Words that narrow a year to part of it (or open-end it); the template can't resolve those
+_SUB_PERIOD = re.compile(
+    r'\b(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sep(?:t(?:ember)?)?|'
+    r'oct(?:ober)?|nov(?:ember)?|dec(?:ember)?|q[1-4]|quarter|half|h[12]|spring|summer|autumn|fall|winter|'
+    r'week|month|since|before|after|until|till|prior|through)\b',
+    re.IGNORECASE
+)
+_COST_RATIO = re.compile(r'(\d+(?:\.\d+)?)\s*%\s*of\s*(?:the\s+)?unit\s*price', re.IGNORECASE)
+# Negation, ratio and normalisation words: the templates only compute plain totals
+_UNSUPPORTED = re.compile(
+    r'%|\bnon-|\b(?:exclud\w*|except|without|other\s+than|percent\w*|share|proportion|ratio|fraction|'
+    r'per\b(?!\s+the\b)|average|avg|mean|median|growth|grew|change|increase|decrease|difference|'
+    r'vs|versus|compar\w*|count|how\s+many|number\s+of)\b',
+    re.IGNORECASE
+)
+_AOV_WORDS = re.compile(r'\baverage\s+order\s+value\b|\baov\b', re.IGNORECASE)
+# Question words naming each metric
+_METRIC_WORDS = {
+    'aov': _AOV_WORDS,
+    'gross_margin': re.compile(r'\bmargin\b', re.IGNORECASE),
+    'quantity': re.compile(r'\bquantity\b|\bunits\s+sold\b', re.IGNORECASE),
+    'revenue': re.compile(r'\brevenue\b|\bsales\b', re.IGNORECASE),
+}
+
+
+class KPITemplateEngine:
+    """
+    Recognizes revenue / quantity / AOV / gross-margin questions, optionally
+    grouped by category, product or customer and filtered by date range and
+    category, and renders pre-validated SQL for them.
+
+    Every metric x dimension combination is checked once with EXPLAIN against
+    the current schema; combinations that fail are never emitted. Anything the
+    engine is not sure about returns None so the LLM path handles it: negations
+    (excluding, without), ratios and normalisations (share, per, average, growth),
+    counts, and questions naming more than one metric.
+    """
+
+    def __init__(self):
+        self.valid = self._validate_templates()
+
+    def _validate_templates(self) -> set:
+        valid = set()
+        with get_pool().connection() as conn:
+            for metric in METRICS:
+                for dimension in [None, *DIMENSIONS]:
+                    sql = self.render(
+                        metric, dimension,
+                        date_range=('1997-01-01', '1997-12-31'),
+                        category='Beverages',
+                        limit=1 if dimension else None,
+                        cost_ratio=0.7
+                    )
+                    try:
+                        conn.execute(f"EXPLAIN {sql}")
+                        valid.add((metric, dimension))
+                    except Exception:
+                        continue
+        return valid
+
+    # ------------------------------
+    # Rendering
+    # ------------------------------
+    def render(self, metric: str, dimension: Optional[str] = None, date_range: Optional[tuple] = None,
+               category: Optional[str] = None, limit: Optional[int] = None, descending: bool = True,
+               cost_ratio: Optional[float] = None, dimension_alias: Optional[str] = None,
+               metric_alias: Optional[str] = None) -> str:
+        """
+        Render SQL for validated parameters.
+        Values are checked against strict formats / whitelists before being inlined.
+        """
+        if category is not None and category not in CATEGORIES:
+            raise ValueError(f"Unknown category: {category}")
+        if date_range is not None and not all(_ISO_DATE.match(d) for d in date_range):
+            raise ValueError(f"Invalid date range: {date_range}")
+        if limit is not None and not (isinstance(limit, int) and 0 < limit <= 1000):
+            raise ValueError(f"Invalid limit: {limit}")
+        for alias in (dimension_alias, metric_alias):
+            if alias is not None and not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', alias):
+                raise ValueError(f"Invalid alias: {alias}")
+
+        metric_sql = METRICS[metric]
+        if metric == 'gross_margin':
+            metric_sql = metric_sql.format(cost_ratio=float(cost_ratio))
+        metric_alias = metric_alias or metric
+
+        needed = set()
+        select = []
+        if dimension:
+            dimension_sql, joins = DIMENSIONS[dimension]
+            needed.update(joins)
+            select.append(f"{dimension_sql} AS {dimension_alias or dimension}")
+        select.append(f"{metric_sql} AS {metric_alias}")
+
+        where = []
+        if date_range:
+            needed.add('orders')
+            # Half-open range on the raw column: works for 'YYYY-MM-DD' and
+            # 'YYYY-MM-DD HH:MM:SS' values and stays index-friendly
+            end = (date.fromisoformat(date_range[1]) + timedelta(days=1)).isoformat()
+            where.append(f"o.OrderDate >= '{date_range[0]}' AND o.OrderDate < '{end}'")
+        if category:
+            needed.update(['products', 'categories'])
+            where.append(f"c.CategoryName = '{category}'")
+
+        lines = [f"SELECT {', '.join(select)}", 'FROM "Order Details" od']
+        lines.extend(JOINS[name] for name in JOINS if name in needed)
+        if where:
+            lines.append("WHERE " + " AND ".join(where))
+        if dimension:
+            lines.append(f"GROUP BY {DIMENSIONS[dimension][0]}")
+            lines.append(f"ORDER BY {metric_alias} {'DESC' if descending else 'ASC'}")
+            if limit:
+                lines.append(f"LIMIT {limit}")
+        return "\n".join(lines)
+
+    # ------------------------------
+    # Matching
+    # ------------------------------
+    def match(self, question: str, format_hint: str, constraints: dict,
+              chunks: Optional[List[dict]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Returns:
+            None if no template applies, else {'name', 'sql', 'params'}
+        """
+        q_lower = question.lower()
+        spec = parse_format_hint(format_hint)
+        if spec is None:
+            return None
+
+        # Campaign names (e.g. 'Summer Beverages 1997') resolve dates and must not
+        # be mistaken for category filters, so they are cut out of the question
+        date_range, remaining = self._resolve_dates(question, chunks or [])
+        if date_range is False:
+            return None
+        # The cost assumption ("70% of UnitPrice") is a margin parameter, not a ratio question
+        checked = _AOV_WORDS.sub(' ', _COST_RATIO.sub(' ', remaining))
+        if _UNSUPPORTED.search(checked):
+            return None
+
+        metric, metric_alias = self._detect_metric(q_lower, spec, constraints)
+        if metric is None:
+            return None
+        if spec['kind'] == 'scalar' and spec['type'] == 'int' and metric != 'quantity':
+            return None
+        cost_ratio = None
+        if metric == 'gross_margin':
+            cost_ratio = self._cost_ratio(q_lower, constraints)
+            if cost_ratio is None:
+                return None
+
+        dimension, dimension_alias, limit, descending = None, None, None, True
+        if spec['kind'] == 'scalar':
+            if spec['type'] not in ('int', 'float'):
+                return None
+        else:
+            dimension, dimension_alias = self._detect_dimension(q_lower, spec)
+            if dimension is None:
+                return None
+            descending = not re.search(r'\b(lowest|least|bottom|worst|fewest|smallest)\b', q_lower)
+            top_n = re.search(r'\b(?:top|bottom)\s+(\d+)\b', q_lower)
+            if top_n:
+                limit = int(top_n.group(1))
+            elif spec['kind'] == 'object':
+                limit = 1
+            else:
+                return None  # open-ended list; let the LLM decide
+
+        categories = [cat for cat in CATEGORIES if re.search(rf'\b{re.escape(cat.lower())}\b', remaining.lower())]
+        # Only a positive mention is a filter ("not from Beverages" is the opposite one)
+        if any(re.search(rf"\b(?:not|no|never)\b(?:\W+\w+){{0,3}}?\W+{re.escape(cat.lower())}\b", remaining.lower())
+               for cat in categories):
+            return None
+        if len(categories) > 1 or (categories and dimension == 'category'):
+            return None
+        category = categories[0] if categories else None
+
+        if (metric, dimension) not in self.valid:
+            return None
+
+        params = {
+            'metric': metric, 'dimension': dimension, 'date_range': date_range,
+            'category': category, 'limit': limit, 'descending': descending,
+            'cost_ratio': cost_ratio, 'dimension_alias': dimension_alias, 'metric_alias': metric_alias
+        }
+        try:
+            sql = self.render(**params)
+        except ValueError:
+            return None
+        name = f"{metric}_by_{dimension}" if dimension else metric
+        return {'name': name, 'sql': sql, 'params': params}
+
+    def _resolve_dates(self, question: str, chunks: List[dict]):
+        """
+        Returns (date_range or None, question with campaign names removed).
+        date_range is False when the question mentions a period we can't resolve.
+        """
+        explicit = _DATE_RANGE.search(question)
+        if explicit:
+            return (explicit.group(1), explicit.group(2)), question
+
+        for chunk in chunks:
+            content = chunk.get('content', '')
+            title = content.split('\n', 1)[0].strip('# ').strip()
+            dates = _DATE_RANGE.search(content)
+            if title and dates and title.lower() in question.lower():
+                remaining = re.sub(re.escape(title), ' ', question, flags=re.IGNORECASE)
+                return (dates.group(1), dates.group(2)), remaining
+
+        # A quoted name we couldn't resolve is probably a campaign: not safe to guess
+        if re.search(r"'[^']*\d{4}[^']*'", question):
+            return False, question
+
+        years = set(_YEAR.findall(question))
+        if years and _SUB_PERIOD.search(question):
+            return False, question
+        if len(years) == 1:
+            year = years.pop()
+            return (f"{year}-01-01", f"{year}-12-31"), question
+        if years:
+            return False, question
+        return None, question
+
+    def _detect_metric(self, q_lower: str, spec: dict, constraints: dict):
+        """Returns (metric, alias) — alias is the format hint field name when there is one"""
+        numeric_fields = [name for name, type_name in object_fields(spec) if type_name in ('int', 'float')]
+        for name in numeric_fields:
+            metric = _METRIC_FIELDS.get(name.lower())
+            if metric:
+                return metric, name
+
+        # From the question text the metric must be unambiguous: exactly one named
+        named = [metric for metric, words in _METRIC_WORDS.items() if words.search(q_lower)]
+        if constraints.get('kpi_type') == 'AOV' and not named:
+            named = ['aov']
+        if len(named) != 1:
+            return None, None
+        metric = named[0]
+        return metric, (numeric_fields[0] if len(numeric_fields) == 1 else None)
+
+    def _detect_dimension(self, q_lower: str, spec: dict):
+        """Returns (dimension, alias) from the hint's string field, else from the question"""
+        text_fields = [name for name, type_name in object_fields(spec) if type_name == 'str']
+        if len(text_fields) != 1:
+            return None, None
+        field = text_fields[0]
+        dimension = _DIMENSION_WORDS.get(field.lower().replace('_', ''))
+        if dimension is None:
+            for word, candidate in _DIMENSION_WORDS.items():
+                if re.search(rf'\b(which|top|best|highest)\s+(\w+\s+)?{word}', q_lower):
+                    dimension = candidate
+                    break
+        return dimension, (field if dimension else None)
+
+    def _cost_ratio(self, q_lower: str, constraints: dict) -> Optional[float]:
+        match = _COST_RATIO.search(q_lower)
+        if match:
+            return float(match.group(1)) / 100
+        return constraints.get('cost_approximation')
@@ -0,0 +1,74 @@
+import threading
+from typing import Any, Callable, Dict, Optional
+
+# ==============================================================================
+# LM SETUP - DSPy / Ollama configuration applied on the first LM call
+# ==============================================================================
+# Importing dspy (and litellm under it) is most of the agent's startup time, so
+# entry points only record the settings here. Questions answered by routing
+# rules, KPI templates and direct formatting never import it.
+
+_settings: Optional[Dict[str, Any]] = None
+_lm = None
+_on_error: Optional[Callable[[Exception], None]] = None
+_lock = threading.Lock()
+
+
+def configure_lm(model: str, api_base: str, use_cache: bool = True,
+                 cache_dir: Optional[str] = None, cache_max_bytes: Optional[int] = None,
+                 on_error: Optional[Callable[[Exception], None]] = None):
+    """
+    Record the LM and LM-cache settings; get_lm() applies them on first use.
+    on_error is called once, with the exception, the first time applying them fails
+    (configuration errors otherwise only surface as per-question errors).
+    """
+    global _settings, _lm, _on_error
+    with _lock:
+        _settings = {
+            'model': model,
+            'api_base': api_base,
+            'use_cache': use_cache,
+            'cache_dir': cache_dir,
+            'cache_max_bytes': cache_max_bytes,
+        }
+        _lm = None
+        _on_error = on_error
+
+
+def get_lm():
+    """
+    The configured dspy.LM, built (and the LM cache configured) on the first call.
+    None when configure_lm() was never called: modules then use dspy.settings.lm.
+    """
+    global _lm, _on_error
+    with _lock:
+        if _settings is None:
+            return None
+        if _lm is None:
+            try:
+                _lm = _build_lm(_settings)
+            except Exception as e:
+                on_error, _on_error = _on_error, None
+                if on_error is not None:
+                    on_error(e)
+                raise
+        return _lm
+
+
+def _build_lm(settings: Dict[str, Any]):
+    import dspy
+
+    # Identical prompts from earlier runs are answered from disk; the cache
+    # evicts the oldest entries once it exceeds cache_max_bytes.
+    dspy.configure_cache(
+        enable_disk_cache=settings['use_cache'],
+        enable_memory_cache=settings['use_cache'],
+        disk_cache_dir=settings['cache_dir'],
+        disk_size_limit_bytes=settings['cache_max_bytes'],
+    )
+    return dspy.LM(
+        model=settings['model'],
+        api_base=settings['api_base'],
+        api_key='',  # Not needed for Ollama but required param
+        cache=settings['use_cache'],
+    )
@@ -0,0 +1,84 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List
+
+# ==============================================================================
+# MICRO-BATCHING - Group concurrent calls into one batched call
+# ==============================================================================
+
+BATCH_WINDOW_MS = 5.0   # how long the first call of a batch waits for company
+MAX_BATCH = 32
+
+
+class MicroBatcher:
+    """
+    Collects items submitted on the event loop within `window_ms` of the first
+    one (or until `max_batch` are waiting) and passes them to `batch_fn` as one
+    list. Each submitter gets its own result back; if `batch_fn` raises, every
+    submitter of that batch sees the exception.
+
+    `batch_fn` is an async callable mapping a list of items to a list of results
+    in the same order. It runs outside the submitters' contexts, so it must not
+    log per question.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], Awaitable[List[Any]]],
+                 window_ms: float = BATCH_WINDOW_MS, max_batch: int = MAX_BATCH):
+        self.batch_fn = batch_fn
+        self.window_s = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: list = []
+        self._timer = None
+        self._running: set = set()  # the loop only holds weak references to tasks
+        self.batches = 0
+        self.items = 0
+        self.largest = 0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_s, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            self.batches += 1
+            self.items += len(batch)
+            self.largest = max(self.largest, len(batch))
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: list):
+        try:
+            results = await self.batch_fn([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():  # the submitter may have been cancelled meanwhile
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'largest': self.largest,
+            'avg_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+async def distinct_batch(items: List[Any], run_one: Callable[[Any], Awaitable[Any]]) -> List[Any]:
+    """Run `run_one` once per distinct item, concurrently, and fan the results back out"""
+    distinct = list(dict.fromkeys(items))
+    results = dict(zip(distinct, await asyncio.gather(*(run_one(item) for item in distinct))))
+    return [results[item] for item in items]
@@ -0,0 +1,154 @@
+import os
+import json
+import threading
+import numpy as np
+
+DEFAULT_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+RRF_K = 60  # standard reciprocal-rank-fusion damping constant
+
+
+def top_k_rows(scores, top_k):
+    """Per row of a (n_queries, n_chunks) score matrix: indices of the top_k scores, best first"""
+    top_k = min(top_k, scores.shape[1])
+    if top_k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    candidates = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def top_k_indices(scores, top_k):
+    """Indices of the top_k highest scores, best first (argpartition, no full sort)"""
+    return top_k_rows(np.asarray(scores)[np.newaxis, :], top_k)[0]
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """
+    Fuse several best-first index rankings.
+    Returns [(index, score)] with score scaled to [0, 1] (1 = ranked first everywhere).
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking):
+            fused[int(idx)] = fused.get(int(idx), 0.0) + 1.0 / (k + rank + 1)
+    best_possible = len(rankings) / (k + 1)
+    ordered = sorted(fused.items(), key=lambda item: -item[1])[:top_k]
+    return [(idx, score / best_possible) for idx, score in ordered]
+
+
+class DenseIndex:
+    """
+    Sentence-embedding index stored as a memory-mapped float32 matrix.
+
+    Embeddings are L2-normalised, so search is a single matrix-vector product.
+    Like the TF-IDF index, rows are tracked per source file: a rebuild only
+    encodes chunks from files whose (mtime, size) changed.
+    """
+
+    def __init__(self, index_dir, model_name=DEFAULT_MODEL, batch_size=64, encoder=None):
+        """
+        Args:
+            index_dir: Directory shared with the TF-IDF index
+            model_name: sentence-transformers model used when no encoder is given
+            batch_size: Chunks encoded per model call
+            encoder: Optional callable(list[str]) -> array of shape (n, dim)
+        """
+        self.index_dir = index_dir
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self._encoder = encoder
+        self._encoder_lock = threading.Lock()
+        self.embeddings = None
+        slug = model_name.replace('/', '__')
+        self._emb_path = os.path.join(index_dir, f'embeddings_{slug}.npy')
+        self._meta_path = os.path.join(index_dir, f'embeddings_{slug}.json')
+
+    def _encode(self, texts):
+        if self._encoder is None:
+            with self._encoder_lock:
+                if self._encoder is None:
+                    # Heavy import, only paid when dense retrieval is actually used
+                    from sentence_transformers import SentenceTransformer
+                    model = SentenceTransformer(self.model_name)
+                    self._encoder = lambda batch: model.encode(
+                        batch, batch_size=self.batch_size, show_progress_bar=False
+                    )
+        vectors = np.asarray(self._encoder(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _read_meta(self):
+        try:
+            with open(self._meta_path, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def ensure(self, chunks, files, fingerprint):
+        """
+        Load the embedding matrix for `fingerprint`, (re)encoding what changed.
+
+        Args:
+            chunks: Chunk sequence of the TF-IDF index
+            files: {filename: {'stat', 'start', 'end'}} chunk ranges of that index
+            fingerprint: Docs fingerprint the embeddings must match
+        """
+        meta = self._read_meta()
+        if not (meta and meta['fingerprint'] == fingerprint and os.path.exists(self._emb_path)):
+            self._build(chunks, files, fingerprint, meta)
+        self.embeddings = np.load(self._emb_path, mmap_mode='r')
+
+    def _build(self, chunks, files, fingerprint, meta):
+        previous = meta['files'] if meta else {}
+        old = np.load(self._emb_path, mmap_mode='r') if previous and os.path.exists(self._emb_path) else None
+
+        n = len(chunks)
+        dim = old.shape[1] if old is not None else None
+        pending = []  # (row, text) still to encode
+        copies = []   # (new_start, old_start, length)
+        for filename, info in files.items():
+            prev = previous.get(filename)
+            length = info['end'] - info['start']
+            if old is not None and prev and prev['stat'] == info['stat'] and prev['end'] - prev['start'] == length:
+                copies.append((info['start'], prev['start'], length))
+            else:
+                pending.extend((row, chunks[row]['content']) for row in range(info['start'], info['end']))
+
+        # The first batch is encoded up front so a fresh index learns the embedding size
+        first = self._encode([text for _, text in pending[:self.batch_size]]) if pending else None
+        if dim is None:
+            dim = first.shape[1] if first is not None else 0
+
+        tmp_path = self._emb_path + '.tmp'
+        out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(n, dim))
+        for new_start, old_start, length in copies:
+            out[new_start:new_start + length] = old[old_start:old_start + length]
+        for i in range(0, len(pending), self.batch_size):
+            batch = pending[i:i + self.batch_size]
+            vectors = first if i == 0 else self._encode([text for _, text in batch])
+            out[[row for row, _ in batch]] = vectors
+        out.flush()
+        del out, old
+
+        # The old meta's per-file rows only describe the old matrix: drop it before the
+        # swap so a crash in between forces a full re-encode, and rename the new one in last
+        try:
+            os.remove(self._meta_path)
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_path, self._emb_path)
+        with open(self._meta_path + '.tmp', 'w') as f:
+            json.dump({'model': self.model_name, 'fingerprint': fingerprint, 'files': files}, f)
+        os.replace(self._meta_path + '.tmp', self._meta_path)
+
+    def search(self, query, top_k=3):
+        """Return (indices, scores) of the top_k chunks by cosine similarity"""
+        indices, scores = self.search_many([query], top_k)
+        return indices[0], scores[0]
+
+    def search_many(self, queries, top_k=3):
+        """Batched search: one encode call and one matrix product for all queries"""
+        query_matrix = self._encode(list(queries))
+        scores = query_matrix @ self.embeddings.T
+        indices = top_k_rows(scores, top_k)
+        return indices, np.take_along_axis(scores, indices, axis=1)
@@ -1,51 +1,350 @@
 import os
+import re
+import math
 import json
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import hashlib
+import threading
+from collections import Counter
+import numpy as np
+import scipy.sparse as sp
+
+from agent.rag.dense import DenseIndex, DEFAULT_MODEL, top_k_rows, reciprocal_rank_fusion
+
+INDEX_DIR = '.cache/retrieval'
+INDEX_VERSION = 2  # bump when chunking, vectorizer settings or the index files change
+RETRIEVAL_MODES = ('tfidf', 'dense', 'hybrid')
+FUSION_CANDIDATES = 50  # per-backend candidates considered by hybrid fusion
+SEARCH_BATCH_SIZE = 1024  # queries scored per matrix product (bounds the dense score matrix)
+
+
+class QueryVectorizer:
+    """
+    Query side of the fitted TfidfVectorizer: the same tokens, n-grams and
+    weights (raw counts x idf, L2-normalised), from the saved vocabulary and idf.
+
+    Loading and searching an existing index never imports scikit-learn; it is
+    only needed to fit the index (DocumentRetriever._build_index).
+    """
+
+    TOKEN_PATTERN = re.compile(r'(?u)\b\w\w+\b')  # TfidfVectorizer default
+
+    def __init__(self, vocabulary, idf, stop_words=(), ngram_range=(1, 1)):
+        self.vocabulary_ = vocabulary
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.stop_words = frozenset(stop_words)
+        self.ngram_range = tuple(ngram_range)
+
+    @classmethod
+    def from_fitted(cls, vectorizer):
+        return cls(
+            vocabulary={term: int(i) for term, i in vectorizer.vocabulary_.items()},
+            idf=vectorizer.idf_,
+            stop_words=vectorizer.get_stop_words() or (),
+            ngram_range=vectorizer.ngram_range,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            return cls(**json.load(f))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'vocabulary': self.vocabulary_,
+                'idf': self.idf.tolist(),
+                'stop_words': sorted(self.stop_words),
+                'ngram_range': list(self.ngram_range),
+            }, f)
+
+    def _terms(self, text):
+        tokens = [t for t in self.TOKEN_PATTERN.findall(text.lower()) if t not in self.stop_words]
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(tokens) - n + 1):
+                yield ' '.join(tokens[i:i + n])
+
+    def transform(self, texts):
+        """(n_texts, n_terms) CSR matrix, equal to TfidfVectorizer.transform on the fitted vectorizer"""
+        data, indices, indptr = [], [], [0]
+        for text in texts:
+            counts = Counter(self.vocabulary_[t] for t in self._terms(text) if t in self.vocabulary_)
+            cols = sorted(counts)
+            indices.extend(cols)
+            data.extend(counts[c] for c in cols)
+            indptr.append(len(indices))
+
+        matrix = sp.csr_matrix(
+            (np.asarray(data, dtype=np.float64), np.asarray(indices, dtype=np.int32), np.asarray(indptr)),
+            shape=(len(indptr) - 1, len(self.idf))
+        )
+        matrix.data *= self.idf[matrix.indices]
+        # Row norms summed term by term in column order, as scikit-learn does, so
+        # scores match the fitted vectorizer bit for bit
+        for start, end in zip(matrix.indptr[:-1], matrix.indptr[1:]):
+            row = matrix.data[start:end]
+            squares = 0.0
+            for value in row.tolist():
+                squares += value * value
+            if squares > 0:
+                row /= math.sqrt(squares)
+        return matrix
+
+
+class ChunkStore:
+    """
+    Read-only chunk list backed by a JSONL file.
+    Only the byte offsets live in memory; chunks are decoded when accessed.
+    """
+
+    def __init__(self, path, offsets):
+        self.path = path
+        self.offsets = offsets
+        self._file = open(path, 'rb')
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        start, end = int(self.offsets[idx]), int(self.offsets[idx + 1])
+        with self._lock:
+            self._file.seek(start)
+            line = self._file.read(end - start)
+        return json.loads(line)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        self._file.close()
+
 
 class DocumentRetriever:
-    def __init__(self, docs_dir='docs/'):
-        self.chunks = self._load_and_chunk(docs_dir)
-        self._build_index()
-    
-    def _load_and_chunk(self, docs_dir):
-        chunks = []
-        for filename in os.listdir(docs_dir):
+    """
+    Retriever over markdown docs with an on-disk index.
+
+    mode selects the backend: 'tfidf' (default), 'dense' (sentence embeddings)
+    or 'hybrid' (reciprocal-rank fusion of both).
+
+    The fitted vectorizer (as a QueryVectorizer), the TF-IDF matrix (memory-mapped) and the chunks are
+    persisted in index_dir together with a per-file (mtime, size) manifest. On start,
+    an unchanged docs dir loads the index without reading any doc; otherwise only
+    changed files are re-chunked and the vectorizer is refit over all chunks.
+    """
+
+    def __init__(self, docs_dir='docs/', index_dir=INDEX_DIR, mode='tfidf', dense_model=DEFAULT_MODEL, encoder=None):
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode '{mode}', expected one of {RETRIEVAL_MODES}")
+        self.docs_dir = docs_dir
+        self.index_dir = index_dir
+        self.mode = mode
+        manifest = self._scan(docs_dir)
+        # Version of the indexed docs; caches built on retrieval results key on it
+        self.fingerprint = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()
+
+        if not self._load_index():
+            self._rebuild_index(manifest)
+            self._load_index()
+
+        self.dense = None
+        if mode != 'tfidf':
+            self.dense = DenseIndex(index_dir, model_name=dense_model, encoder=encoder)
+            self.dense.ensure(self.chunks, self._files, self.fingerprint)
+
+    # ------------------------------
+    # Index persistence
+    # ------------------------------
+    def _scan(self, docs_dir):
+        """Per-file fingerprint: stat only, so unchanged docs are never read"""
+        manifest = {}
+        for filename in sorted(os.listdir(docs_dir)):
             if not filename.endswith('.md'):
                 continue
-            
-            filepath = os.path.join(docs_dir, filename)
-            with open(filepath, 'r') as f:
-                content = f.read()
-            
-            # Split by sections (## headers)
-            sections = content.split('\n## ')
-            
-            for i, section in enumerate(sections):
-                if section.strip():
-                    chunks.append({
-                        'id': f'{filename}::chunk{i}',
-                        'content': section.strip(),
-                        'source': filename
-                    })
-        
+            st = os.stat(os.path.join(docs_dir, filename))
+            manifest[filename] = [st.st_mtime_ns, st.st_size]
+        return manifest
+
+    def _path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._path('meta.json'), 'r') as f:
+                meta = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if meta.get('version') != INDEX_VERSION or meta.get('docs_dir') != os.path.abspath(self.docs_dir):
+            return None
+        return meta
+
+    def _load_index(self):
+        meta = self._read_meta()
+        if meta is None or meta['fingerprint'] != self.fingerprint:
+            return False
+        try:
+            self.vectorizer = QueryVectorizer.load(self._path('vectorizer.json'))
+            arrays = {
+                name: np.load(self._path(f'tfidf_{name}.npy'), mmap_mode='r')
+                for name in ('data', 'indices', 'indptr')
+            }
+            self.tfidf_matrix = sp.csr_matrix(
+                (arrays['data'], arrays['indices'], arrays['indptr']),
+                shape=tuple(meta['shape']),
+                copy=False
+            )
+            self.chunks = ChunkStore(self._path('chunks.jsonl'), np.load(self._path('chunk_offsets.npy')))
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        self._files = meta['files']
+        return True
+
+    def _rebuild_index(self, manifest):
+        meta = self._read_meta()
+        previous = meta['files'] if meta else {}
+        old_store = None
+        if previous:
+            try:
+                old_store = ChunkStore(self._path('chunks.jsonl'), np.load(self._path('chunk_offsets.npy')))
+            except OSError:
+                previous = {}
+        # Invalidate the index before replacing any of its files: the old per-file
+        # ranges only describe the old chunks.jsonl, so a crash below must force a
+        # full rebuild rather than an incremental one against mismatched files.
+        # (old_store keeps the old chunks readable through its open file.)
+        try:
+            os.remove(self._path('meta.json'))
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        files = {}
+        offsets = [0]
+        tmp_chunks = self._path('chunks.jsonl.tmp')
+        with open(tmp_chunks, 'wb') as out:
+            for filename, stat in manifest.items():
+                old = previous.get(filename)
+                if old and old['stat'] == stat:
+                    file_chunks = old_store[old['start']:old['end']]
+                else:
+                    with open(os.path.join(self.docs_dir, filename), 'r') as f:
+                        file_chunks = self._chunk_file(filename, f.read())
+
+                start = len(offsets) - 1
+                for chunk in file_chunks:
+                    line = (json.dumps(chunk) + '\n').encode()
+                    out.write(line)
+                    offsets.append(offsets[-1] + len(line))
+                files[filename] = {'stat': stat, 'start': start, 'end': len(offsets) - 1}
+
+        if old_store is not None:
+            old_store.close()
+        os.replace(tmp_chunks, self._path('chunks.jsonl'))
+        np.save(self._path('chunk_offsets.npy'), np.asarray(offsets, dtype=np.int64))
+
+        self.chunks = ChunkStore(self._path('chunks.jsonl'), np.asarray(offsets, dtype=np.int64))
+        self._build_index()
+        self.chunks.close()
+
+        matrix = self.tfidf_matrix.tocsr()
+        for name in ('data', 'indices', 'indptr'):
+            np.save(self._path(f'tfidf_{name}.npy'), getattr(matrix, name))
+        self.vectorizer.save(self._path('vectorizer.json'))
+
+        # Written last (and renamed into place): the index only becomes valid once every other file is
+        with open(self._path('meta.json.tmp'), 'w') as f:
+            json.dump({
+                'version': INDEX_VERSION,
+                'docs_dir': os.path.abspath(self.docs_dir),
+                'fingerprint': self.fingerprint,
+                'shape': list(matrix.shape),
+                'files': files
+            }, f)
+        os.replace(self._path('meta.json.tmp'), self._path('meta.json'))
+
+    # ------------------------------
+    # Chunking and search
+    # ------------------------------
+    def _chunk_file(self, filename, content):
+        chunks = []
+        # Split by sections (## headers)
+        sections = content.split('\n## ')
+
+        for i, section in enumerate(sections):
+            if section.strip():
+                chunks.append({
+                    'id': f'{filename}::chunk{i}',
+                    'content': section.strip(),
+                    'source': filename
+                })
+
         return chunks
-    
+
     def _build_index(self):
+        # Heavy import, only paid when the docs changed and the index is refit
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
         texts = [c['content'] for c in self.chunks]
-        self.vectorizer = TfidfVectorizer(
+        vectorizer = TfidfVectorizer(
             max_features=300,
             ngram_range=(1, 2),
             stop_words='english'
         )
-        self.tfidf_matrix = self.vectorizer.fit_transform(texts)
-    
+        self.tfidf_matrix = vectorizer.fit_transform(texts)
+        self.vectorizer = QueryVectorizer.from_fitted(vectorizer)
+
     def search(self, query, top_k=3):
-        query_vec = self.vectorizer.transform([query])
-        scores = cosine_similarity(query_vec, self.tfidf_matrix)[0]
-        top_indices = scores.argsort()[-top_k:][::-1]
-        
+        return self.search_many([query], top_k)[0]
+
+    def search_many(self, queries, top_k=3):
+        """
+        Retrieve for many queries in one vectorized pass per block of queries.
+        Returns one result list per query, identical to calling search() on each
+        (in 'dense' mode scores may differ in the last float32 bit, since BLAS
+        accumulates matrix-matrix and matrix-vector products differently).
+        """
+        queries = list(queries)
+        results = []
+        for start in range(0, len(queries), SEARCH_BATCH_SIZE):
+            block = queries[start:start + SEARCH_BATCH_SIZE]
+            if self.mode == 'dense':
+                indices, scores = self.dense.search_many(block, top_k)
+                results.extend(self._to_results(indices, scores))
+            elif self.mode == 'hybrid':
+                results.extend(self._search_hybrid(block, top_k))
+            else:
+                scores = self._tfidf_scores(block)
+                indices = top_k_rows(scores, top_k)
+                results.extend(self._to_results(indices, np.take_along_axis(scores, indices, axis=1)))
+        return results
+
+    def _tfidf_scores(self, queries):
+        """Dense (n_queries, n_chunks) cosine scores from one sparse product"""
+        query_matrix = self.vectorizer.transform(queries)
+        # TF-IDF rows are L2-normalised, so the dot product is the cosine similarity
+        return (query_matrix @ self.tfidf_matrix.T).toarray()
+
+    def _to_results(self, indices, scores):
+        return [
+            [{**self.chunks[int(idx)], 'score': float(score)} for idx, score in zip(row_indices, row_scores)]
+            for row_indices, row_scores in zip(indices, scores)
+        ]
+
+    def _search_hybrid(self, queries, top_k):
+        """Reciprocal-rank fusion of TF-IDF and dense rankings; score is the normalised RRF score"""
+        candidates = max(top_k, FUSION_CANDIDATES)
+        tfidf_rankings = top_k_rows(self._tfidf_scores(queries), candidates)
+        dense_rankings, _ = self.dense.search_many(queries, candidates)
+
         return [
-            {**self.chunks[idx], 'score': float(scores[idx])}
-            for idx in top_indices
-        ]
\ No newline at end of file
+            [
+                {**self.chunks[idx], 'score': score}
+                for idx, score in reciprocal_rank_fusion([tfidf_ranking, dense_ranking], top_k)
+            ]
+            for tfidf_ranking, dense_ranking in zip(tfidf_rankings, dense_rankings)
+        ]
@@ -0,0 +1,85 @@
+import csv
+import io
+from typing import Any, List, Optional, Sequence
+
+from agent.tools.schema_linker import approx_tokens
+
+# ==============================================================================
+# RESULT ENCODING - SQL rows as a compact, token-bounded table for LM prompts
+# ==============================================================================
+
+RESULT_TOKEN_BUDGET = 1000   # prompt tokens the SQL result may take
+MAX_CELL_CHARS = 200         # long text values are cut so one row can't eat the budget
+FLOAT_DIGITS = 4
+
+
+def _cell(value: Any) -> str:
+    """Deterministic text for one value (same input → same prompt → LM cache hit)"""
+    if value is None:
+        return 'NULL'
+    if isinstance(value, float):
+        return repr(round(value, FLOAT_DIGITS))
+    if isinstance(value, bytes):
+        return f"<{len(value)} bytes>"
+    text = str(value)
+    return text if len(text) <= MAX_CELL_CHARS else text[:MAX_CELL_CHARS - 3] + '...'
+
+
+def _csv_line(values: Sequence[str]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='').writerow(values)
+    return buffer.getvalue()
+
+
+def _summary(columns: Sequence[str], omitted: List[tuple]) -> str:
+    """Truncation note plus count/sum/min/max of the numeric columns over the omitted rows"""
+    lines = [f"... {len(omitted)} more rows not shown (truncated to fit the prompt)."]
+    for i, name in enumerate(columns):
+        values = [row[i] for row in omitted if isinstance(row[i], (int, float)) and not isinstance(row[i], bool)]
+        if values:
+            lines.append(f"omitted {name}: count={len(values)} sum={_cell(sum(values))} "
+                         f"min={_cell(min(values))} max={_cell(max(values))}")
+    return '\n'.join(lines)
+
+
+def encode_rows(rows: Sequence, columns: Optional[Sequence[str]] = None,
+                token_budget: int = RESULT_TOKEN_BUDGET) -> str:
+    """
+    Encode SQL rows as CSV (header once, one line per row) within a token budget.
+
+    Rows are kept in result order (so ORDER BY ... top rows survive) until the
+    budget is used up; the remaining rows are replaced by an explicit truncation
+    note with summary statistics of their numeric columns. At least one row is
+    always shown.
+
+    Args:
+        rows: ResultSet or list of row dicts
+        columns: Column names (default: rows.columns, else the first row's keys)
+        token_budget: Approximate prompt tokens the encoding may use
+
+    Returns:
+        The encoded table as text
+    """
+    if columns is None:
+        columns = getattr(rows, 'columns', None) or (list(rows[0].keys()) if rows else [])
+    columns = list(columns)
+    tuples = rows.tuples() if hasattr(rows, 'tuples') else [tuple(row.get(c) for c in columns) for row in rows]
+
+    header = _csv_line(columns)
+    lines = [_csv_line([_cell(v) for v in row]) for row in tuples]
+    if approx_tokens('\n'.join([header] + lines)) <= token_budget:
+        return '\n'.join([header] + lines)
+
+    def truncated(shown: int) -> str:
+        return '\n'.join([header] + lines[:shown] + [f"(showing the first {shown} of {len(lines)} rows)",
+                                                     _summary(columns, tuples[shown:])])
+
+    # Largest prefix that fits together with the summary of the rows it leaves out
+    low, high = 1, len(lines) - 1
+    while low < high:
+        mid = (low + high + 1) // 2
+        if approx_tokens(truncated(mid)) <= token_budget:
+            low = mid
+        else:
+            high = mid - 1
+    return truncated(low)
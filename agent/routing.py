@@ -0,0 +1,28 @@
+from typing import Optional
+
+# ==============================================================================
+# ROUTING RULES - Keyword routes decided without the LM (and without importing dspy)
+# ==============================================================================
+
+RAG_KEYWORDS = ['policy', 'return window', 'return days', 'definition']
+HYBRID_KEYWORDS = ['during', 'summer', 'winter', 'calendar', 'marketing']
+SQL_KEYWORDS = ['top 3', 'total revenue', 'all-time', 'how many']
+
+
+def rule_route(question: str) -> Optional[str]:
+    """'rag', 'hybrid' or 'sql' when a hardcoded rule matches; None when the model has to decide"""
+    q_lower = question.lower()
+    
+    # Rule 1: Pure RAG questions
+    if any(word in q_lower for word in RAG_KEYWORDS):
+        return 'rag'
+    
+    # Rule 2: Hybrid questions (needs both docs + SQL)
+    if any(word in q_lower for word in HYBRID_KEYWORDS):
+        return 'hybrid'
+    
+    # Rule 3: Pure SQL (numbers, rankings, totals)
+    if any(word in q_lower for word in SQL_KEYWORDS):
+        return 'sql'
+    
+    return None
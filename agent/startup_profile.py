@@ -0,0 +1,112 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+# ==============================================================================
+# STARTUP PROFILE - Cold start of an entry point, measured in a fresh process
+# ==============================================================================
+
+# Packages that cost a second or more to import; they should load on first use
+HEAVY_PACKAGES = ('dspy', 'litellm', 'sklearn', 'sentence_transformers', 'torch', 'pandas')
+
+# Runs in the child: import the entry module, build the agent, optionally warm it
+# up, and print phase timings plus the heavy packages loaded by first-question-ready.
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import importlib
+importlib.import_module({entry!r})
+imported = time.perf_counter()
+from agent.graph_hybrid import HybridAgent
+agent = HybridAgent(enable_logging=False)
+ready = time.perf_counter()
+loaded = [name for name in {heavy!r} if name in sys.modules]
+if {warm_up!r}:
+    agent.warm_up()
+warm = time.perf_counter()
+print(json.dumps({{
+    'import_ms': (imported - start) * 1000,
+    'init_ms': (ready - imported) * 1000,
+    'ready_ms': (ready - start) * 1000,
+    'warm_up_ms': (warm - ready) * 1000 if {warm_up!r} else None,
+    'loaded': loaded,
+}}))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """
+    Parse `python -X importtime` output.
+
+    Returns:
+        [{'module', 'self_ms', 'cumulative_ms', 'depth'}] in import order
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append({
+            'module': name.strip(),
+            'self_ms': int(self_us) / 1000,
+            'cumulative_ms': int(cumulative_us) / 1000,
+            'depth': (len(name) - len(name.lstrip())) // 2,
+        })
+    return modules
+
+
+def profile_startup(entry: str = 'run_agent_hybrid', warm_up: bool = False, cwd: Optional[str] = None,
+                    importtime: bool = True) -> Dict[str, Any]:
+    """
+    Start a fresh interpreter with -X importtime and time it to first-question-ready.
+
+    Args:
+        entry: Module imported first, as the CLI would (e.g. 'run_agent_hybrid', 'serve_agent')
+        warm_up: Also time HybridAgent.warm_up() (what serve_agent.py does before listening)
+        cwd: Repo root to run in (default: the current directory)
+        importtime: Trace imports (-X importtime adds some overhead to the timings)
+
+    Returns:
+        Phase timings (import_ms, init_ms, ready_ms, warm_up_ms), the heavy packages
+        that were loaded, and per-package import times (empty without importtime)
+    """
+    probe = _PROBE.format(entry=entry, warm_up=warm_up, heavy=HEAVY_PACKAGES)
+    root = cwd or os.getcwd()
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [root, os.environ.get('PYTHONPATH')]))}
+    flags = ['-X', 'importtime'] if importtime else []
+    proc = subprocess.run([sys.executable, *flags, '-c', probe], cwd=root, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        tail = '\n'.join(line for line in proc.stderr.splitlines() if not line.startswith('import time:'))
+        raise RuntimeError(f"Startup probe failed:\n{tail[-2000:]}")
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    modules = parse_importtime(proc.stderr)
+    # Self time summed per top-level package (cumulative times nest across packages)
+    packages: Dict[str, float] = defaultdict(float)
+    for module in modules:
+        packages[module['module'].split('.')[0]] += module['self_ms']
+    result['packages'] = dict(sorted(packages.items(), key=lambda item: -item[1]))
+    result['modules'] = modules
+    return result
+
+
+def format_report(profile: Dict[str, Any], top: int = 15) -> str:
+    """Human-readable summary of profile_startup()"""
+    lines = [
+        f"Cold start: import {profile['import_ms']:.0f} ms + agent init {profile['init_ms']:.0f} ms"
+        f" = first question ready after {profile['ready_ms']:.0f} ms",
+    ]
+    if profile.get('warm_up_ms') is not None:
+        lines.append(f"warm_up(): {profile['warm_up_ms']:.0f} ms")
+
+    lines.append(f"\nImport time by package (self time, top {top}):")
+    for package, ms in list(profile['packages'].items())[:top]:
+        lines.append(f"  {ms:>8.1f} ms  {package}")
+
+    deferred = [name for name in HEAVY_PACKAGES if name not in profile['loaded']]
+    lines.append(f"\nDeferred past first-question-ready: {', '.join(deferred) or '-'}")
+    lines.append(f"Loaded by first-question-ready:     {', '.join(profile['loaded']) or '-'}")
+    return '\n'.join(lines)
@@ -0,0 +1,201 @@
+"""
+Sargable date filters on Orders.
+
+rewrite_date_filters() turns function-wrapped predicates such as
+DATE(o.OrderDate) BETWEEN ... or strftime('%Y', o.OrderDate) = '1997' into
+half-open day ranges on the indexed OrderDay key (data/create_date_keys.sql),
+or on the raw OrderDate column when the key hasn't been added.
+
+Usage (from the repo root, one-time migration):
+    python -m agent.tools.date_filters
+"""
+import os
+import re
+import sqlite3
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import click
+
+DATE_KEY_COLUMN = "OrderDay"
+DATE_KEY_INDEX = "idx_orders_orderday"
+DATE_KEY_SQL = os.path.join(os.path.dirname(__file__), "..", "..", "data", "create_date_keys.sql")
+
+# Orders referenced as a table or through its lowercase view
+_ORDERS_REF = re.compile(r'\b(?:FROM|JOIN)\s+"?(orders)"?(?:\s+(?:AS\s+)?(?!ON\b|JOIN\b|WHERE\b|INNER\b|LEFT\b|GROUP\b|ORDER\b|LIMIT\b)(\w+))?',
+                         re.IGNORECASE)
+_COLUMN = r'(?:(?P<q>\w+)\.)?"?OrderDate"?'
+_OPS = r'(>=|<=|<>|!=|=|<|>)'
+
+_STRFTIME_PERIODS = {'%Y': 'year', '%Y-%m': 'month', '%Y-%m-%d': 'day'}
+
+
+# ------------------------------
+# Periods → day ranges
+# ------------------------------
+def _parse_period(value: str, kind: str) -> Optional[Tuple[date, date]]:
+    """'1997' / '1997-06' / '1997-06-30' → [first day, first day of the next period)"""
+    try:
+        if kind == 'year' and re.fullmatch(r'\d{4}', value):
+            start = date(int(value), 1, 1)
+            return start, date(start.year + 1, 1, 1)
+        if kind == 'month' and re.fullmatch(r'\d{4}-\d{2}', value):
+            start = date(int(value[:4]), int(value[5:]), 1)
+            return start, (start + timedelta(days=32)).replace(day=1)
+        if kind == 'day' and re.fullmatch(r'\d{4}-\d{2}-\d{2}', value):
+            start = date.fromisoformat(value)
+            return start, start + timedelta(days=1)
+    except ValueError:
+        return None
+    return None
+
+
+def _comparison_range(op: str, period: Tuple[date, date]):
+    """Day range [lower, upper) equivalent to `<period-of-row> op <period>`"""
+    start, end = period
+    return {
+        '=': (start, end),
+        '>=': (start, None),
+        '>': (end, None),
+        '<': (None, start),
+        '<=': (None, end),
+    }.get(op)
+
+
+def _render(column: str, lower: Optional[date], upper: Optional[date]) -> str:
+    parts = []
+    if lower:
+        parts.append(f"{column} >= '{lower.isoformat()}'")
+    if upper:
+        parts.append(f"{column} < '{upper.isoformat()}'")
+    return f"({' AND '.join(parts)})"
+
+
+# ------------------------------
+# Rewrite
+# ------------------------------
+def rewrite_date_filters(sql: str, date_key: bool = False) -> str:
+    """
+    Rewrite date predicates on Orders.OrderDate into index-friendly day ranges.
+
+    Handled (date-only literals):
+        DATE(col) BETWEEN 'a' AND 'b' / DATE(col) op 'd'
+        strftime('%Y' | '%Y-%m' | '%Y-%m-%d', col) = / BETWEEN / op 'period'
+        col >= 'd' / col < 'd'    (with date_key)
+    Anything else (other columns, times of day, bare col BETWEEN, != and NOT BETWEEN)
+    is left unchanged; every rewrite returns the same rows as the original.
+
+    Args:
+        sql: Query to rewrite
+        date_key: Target the indexed OrderDay column instead of OrderDate
+    """
+    orders = {m.group(2 if m.group(2) else 1).lower() for m in _ORDERS_REF.finditer(sql)}
+    if not orders:
+        return sql
+
+    def target(match) -> Optional[str]:
+        qualifier = match.group('q')
+        if qualifier and qualifier.lower() not in orders:
+            return None
+        prefix = f"{qualifier}." if qualifier else ""
+        return f"{prefix}{DATE_KEY_COLUMN if date_key else 'OrderDate'}"
+
+    def between(kind):
+        def replace(match):
+            column = target(match)
+            low = _parse_period(match.group('a'), kind)
+            high = _parse_period(match.group('b'), kind)
+            if column is None or low is None or high is None:
+                return match.group(0)
+            return _render(column, low[0], high[1])
+        return replace
+
+    def compare(kind, ops=('=', '>=', '>', '<', '<=')):
+        def replace(match):
+            column = target(match)
+            period = _parse_period(match.group('v'), kind)
+            if column is None or period is None or match.group('op') not in ops:
+                return match.group(0)
+            return _render(column, *_comparison_range(match.group('op'), period))
+        return replace
+
+    flags = re.IGNORECASE
+    # DATE(col) ...
+    sql = re.sub(rf"\bDATE\(\s*{_COLUMN}\s*\)\s+BETWEEN\s+'(?P<a>[^']*)'\s+AND\s+'(?P<b>[^']*)'",
+                 between('day'), sql, flags=flags)
+    sql = re.sub(rf"\bDATE\(\s*{_COLUMN}\s*\)\s*(?P<op>{_OPS[1:-1]})\s*'(?P<v>[^']*)'",
+                 compare('day'), sql, flags=flags)
+
+    # strftime('<fmt>', col) ...
+    for fmt, kind in _STRFTIME_PERIODS.items():
+        fmt_re = re.escape(fmt)
+        sql = re.sub(rf"\bstrftime\(\s*'{fmt_re}'\s*,\s*{_COLUMN}\s*\)\s+BETWEEN\s+'(?P<a>[^']*)'\s+AND\s+'(?P<b>[^']*)'",
+                     between(kind), sql, flags=flags)
+        sql = re.sub(rf"\bstrftime\(\s*'{fmt_re}'\s*,\s*{_COLUMN}\s*\)\s*(?P<op>{_OPS[1:-1]})\s*'(?P<v>[^']*)'",
+                     compare(kind), sql, flags=flags)
+
+    # Bare column with date-only literals (lookbehind skips the ranges rendered above).
+    # col BETWEEN 'a' AND 'b' is left alone: on timestamped rows it excludes day b,
+    # and reading it as whole days would change the result, not just the plan.
+    if date_key:
+        # >= / < against a date-only literal mean the same on OrderDay as on OrderDate
+        sql = re.sub(rf"(?<![\w.(]){_COLUMN}\s*(?P<op>>=|<(?![=>]))\s*'(?P<v>\d{{4}}-\d{{2}}-\d{{2}})'",
+                     compare('day', ops=('>=', '<')), sql, flags=flags)
+    return sql
+
+
+# ------------------------------
+# Date key migration
+# ------------------------------
+@lru_cache(maxsize=4)
+def has_date_key(db_path: str, fingerprint: str) -> bool:
+    """Whether Orders has the indexed OrderDay column (cached per DB file version)"""
+    try:
+        conn = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+        try:
+            columns = {row[1] for row in conn.execute('PRAGMA table_xinfo("Orders")')}
+            indexes = {row[1] for row in conn.execute('PRAGMA index_list("Orders")')}
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return False
+    return DATE_KEY_COLUMN in columns and DATE_KEY_INDEX in indexes
+
+
+def apply_date_key(db_path: str) -> bool:
+    """Add OrderDay + its index if missing. Returns True if the database was changed."""
+    conn = sqlite3.connect(db_path)
+    try:
+        columns = {row[1] for row in conn.execute('PRAGMA table_xinfo("Orders")')}
+        indexes = {row[1] for row in conn.execute('PRAGMA index_list("Orders")')}
+        if DATE_KEY_COLUMN in columns and DATE_KEY_INDEX in indexes:
+            return False
+        with open(DATE_KEY_SQL, 'r') as f:
+            script = ''.join(line for line in f if not line.lstrip().startswith('--'))
+        for statement in (s.strip() for s in script.split(';')):
+            if not statement:
+                continue
+            if statement.upper().startswith('ALTER TABLE') and DATE_KEY_COLUMN in columns:
+                continue  # re-run after a partial migration: only the index is missing
+            conn.execute(statement)
+        conn.commit()
+        return True
+    finally:
+        conn.close()
+
+
+@click.command()
+@click.option('--db', 'db_path', default=None, help='Database to migrate (default: agent.tools.sqlite_tool.DB_PATH)')
+def main(db_path):
+    """Add the indexed OrderDay key to Orders (safe to re-run)"""
+    from agent.tools import sqlite_tool
+    db_path = db_path or sqlite_tool.DB_PATH
+    if apply_date_key(db_path):
+        print(f"✅ Added Orders.{DATE_KEY_COLUMN} and {DATE_KEY_INDEX} to {db_path}")
+    else:
+        print(f"✓ {db_path} already has Orders.{DATE_KEY_COLUMN}")
+
+
+if __name__ == '__main__':
+    main()
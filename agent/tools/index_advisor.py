@@ -0,0 +1,332 @@
+"""
+Offline index advisor for the logged agent workload.
+
+Replays the distinct queries from the query log with EXPLAIN QUERY PLAN, finds
+full table scans and temp B-trees, and proposes single-column indexes on the
+columns those queries filter, join or group on. Candidates are tried on a
+temporary copy of the database: only indexes the planner actually picks are
+proposed, and the logged workload is timed before and after.
+
+Usage (from the repo root):
+    python -m agent.tools.index_advisor                 # report only
+    python -m agent.tools.index_advisor --apply         # also create the indexes
+"""
+import os
+import re
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Set, Tuple
+
+import click
+
+from agent.tools import sqlite_tool
+from agent.tools.query_log import DEFAULT_LOG_PATH, read_query_log
+from agent.tools.sql_cache import normalize_sql
+
+_KEYWORDS = r'ON|JOIN|INNER|LEFT|CROSS|NATURAL|WHERE|GROUP|ORDER|LIMIT|HAVING|UNION'
+_TABLE_REF = re.compile(
+    rf'\b(?:FROM|JOIN)\s+("[^"]+"|\[[^\]]+\]|\w+)(?:\s+(?:AS\s+)?(?!(?:{_KEYWORDS})\b)(\w+))?',
+    re.IGNORECASE
+)
+_WHERE = re.compile(r'\bWHERE\b(.*?)(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|\)|$)',
+                    re.IGNORECASE | re.DOTALL)
+_ON = re.compile(rf'\bON\b(.*?)(?=\b(?:{_KEYWORDS})\b|\)|$)', re.IGNORECASE | re.DOTALL)
+_GROUP_ORDER = re.compile(r'\b(GROUP|ORDER)\s+BY\b(.*?)(?=\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|\)|$)',
+                          re.IGNORECASE | re.DOTALL)
+_SCAN = re.compile(r'^SCAN (?:TABLE )?(.+?)(?: AS (\w+))?(?: USING (?:(?:COVERING )?INDEX (\S+)|.*))?$')
+_TEMP_BTREE = re.compile(r'^USE TEMP B-TREE FOR (GROUP BY|ORDER BY|DISTINCT)')
+
+
+# ------------------------------
+# Workload
+# ------------------------------
+def load_workload(log_path: str) -> List[Dict[str, Any]]:
+    """
+    Distinct successful queries that ran on the base tables.
+
+    Returns:
+        [{'sql', 'count'}] in first-seen order; rollup-answered queries are skipped
+    """
+    workload: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    for entry in read_query_log(log_path):
+        if not entry.get('success') or entry.get('source') == 'rollup':
+            continue
+        key = normalize_sql(entry['sql'])
+        if key in workload:
+            workload[key]['count'] += 1
+        else:
+            workload[key] = {'sql': entry['sql'], 'count': 1}
+    return list(workload.values())
+
+
+# ------------------------------
+# Schema helpers
+# ------------------------------
+def _schema(conn: sqlite3.Connection) -> Dict[str, Dict[str, Any]]:
+    """table → {'columns': {lower: Name}, 'rowid': lower INTEGER PK or None, 'indexed': leading columns}"""
+    schema = {}
+    tables = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")]
+    for table in tables:
+        info = conn.execute(f'PRAGMA table_xinfo("{table}")').fetchall()  # includes generated columns
+        pks = [c for c in info if c[5]]
+        rowid = pks[0][1].lower() if len(pks) == 1 and pks[0][2].upper() == 'INTEGER' else None
+        indexed = set()
+        for index in conn.execute(f'PRAGMA index_list("{table}")').fetchall():
+            first = conn.execute(f'PRAGMA index_info("{index[1]}")').fetchone()
+            if first and first[2]:
+                indexed.add(first[2].lower())
+        schema[table] = {'columns': {c[1].lower(): c[1] for c in info}, 'rowid': rowid, 'indexed': indexed}
+
+    # Lowercase views like `orders` are plain SELECT * aliases of a table
+    for name, sql in conn.execute("SELECT name, sql FROM sqlite_master WHERE type='view'"):
+        match = re.search(r'SELECT\s+\*\s+FROM\s+"?([^";]+?)"?\s*;?$', sql or '', re.IGNORECASE)
+        if match and match.group(1) in schema:
+            schema.setdefault(name, schema[match.group(1)] | {'view_of': match.group(1)})
+    return schema
+
+
+def _base_table(schema: dict, name: str) -> str:
+    return schema[name].get('view_of', name)
+
+
+def _aliases(sql: str, schema: dict) -> Dict[str, str]:
+    """alias or table name (lowercase) → base table"""
+    by_lower = {name.lower(): name for name in schema}
+    aliases = {}
+    for table, alias in _TABLE_REF.findall(sql):
+        name = by_lower.get(table.strip('"[]').lower())
+        if name is None:
+            continue
+        base = _base_table(schema, name)
+        aliases[name.lower()] = base
+        aliases[base.lower()] = base
+        if alias:
+            aliases[alias.lower()] = base
+    return aliases
+
+
+def _referenced_columns(clause: str, aliases: Dict[str, str], schema: dict) -> Set[Tuple[str, str]]:
+    """(table, Column) pairs a clause refers to, qualified or unambiguous unqualified"""
+    refs = set()
+    for quoted, plain, column in re.findall(r'(?:"([^"]+)"|\b(\w+))\.("?\w+"?)', clause):
+        table = aliases.get((quoted or plain).lower())
+        column = column.strip('"').lower()
+        if table and column in schema[table]['columns']:
+            refs.add((table, schema[table]['columns'][column]))
+    tables = set(aliases.values())
+    unqualified = re.sub(r'(?:"[^"]+"|\b\w+)\."?\w+"?', ' ', re.sub(r"'[^']*'", ' ', clause))
+    for word in set(re.findall(r'\b\w+\b', unqualified.lower())):
+        owners = [t for t in tables if word in schema[t]['columns']]
+        if len(owners) == 1:
+            refs.add((owners[0], schema[owners[0]]['columns'][word]))
+    return refs
+
+
+# ------------------------------
+# Plan analysis
+# ------------------------------
+def explain(conn: sqlite3.Connection, sql: str) -> List[str]:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def find_candidates(conn: sqlite3.Connection, workload: List[Dict[str, Any]]) -> Dict[Tuple[str, str], Dict[str, Any]]:
+    """
+    (table, column) → {'reasons': set, 'queries': set of workload indices}
+    for columns that scanned tables filter/join on or that a temp B-tree sorts on.
+    """
+    schema = _schema(conn)
+    candidates: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def propose(table, column, reason, query_index):
+        info = schema[table]
+        if column.lower() == info['rowid'] or column.lower() in info['indexed']:
+            return
+        entry = candidates.setdefault((table, column), {'reasons': set(), 'queries': set()})
+        entry['reasons'].add(reason)
+        entry['queries'].add(query_index)
+
+    for i, item in enumerate(workload):
+        sql = item['sql']
+        try:
+            plan = explain(conn, sql)
+        except sqlite3.Error:
+            continue
+        aliases = _aliases(sql, schema)
+        filters = set()
+        for clause in _WHERE.findall(sql):
+            filters |= _referenced_columns(clause, aliases, schema)
+        predicates = set(filters)
+        for clause in _ON.findall(sql):
+            predicates |= _referenced_columns(clause, aliases, schema)
+
+        for detail in plan:
+            scan = _SCAN.match(detail)
+            if scan and not scan.group(3):
+                scanned = aliases.get((scan.group(2) or scan.group(1)).strip('"').lower())
+                for table, column in predicates:
+                    if table == scanned:
+                        propose(table, column, f'full scan of {table}', i)
+                # An indexed filter on another table lets the planner start the join there instead
+                for table, column in filters:
+                    if table != scanned:
+                        propose(table, column, f'filter to drive join instead of scanning {scanned}', i)
+            sort = _TEMP_BTREE.match(detail)
+            if sort:
+                for kind, clause in _GROUP_ORDER.findall(sql):
+                    if f'{kind.upper()} BY' == sort.group(1):
+                        for table, column in _referenced_columns(clause, aliases, schema):
+                            propose(table, column, f'temp b-tree for {sort.group(1)}', i)
+    return candidates
+
+
+def index_name(table: str, column: str) -> str:
+    return 'idx_' + re.sub(r'\W+', '_', f"{table}_{column}").lower()
+
+
+def create_index_sql(table: str, column: str) -> str:
+    return f'CREATE INDEX IF NOT EXISTS {index_name(table, column)} ON "{table}"("{column}")'
+
+
+# ------------------------------
+# Measurement
+# ------------------------------
+def measure(conn: sqlite3.Connection, workload: List[Dict[str, Any]], repeat: int = 3) -> List[float]:
+    """Median ms per workload query (NaN for queries that fail)"""
+    timings = []
+    for item in workload:
+        runs = []
+        try:
+            conn.execute(item['sql']).fetchall()  # warm the page cache
+            for _ in range(repeat):
+                start = time.perf_counter()
+                conn.execute(item['sql']).fetchall()
+                runs.append((time.perf_counter() - start) * 1000)
+            timings.append(statistics.median(runs))
+        except sqlite3.Error:
+            timings.append(float('nan'))
+    return timings
+
+
+def _weighted_total(workload, timings) -> float:
+    return sum(t * item['count'] for item, t in zip(workload, timings) if t == t)
+
+
+def advise(db_path: str, workload: List[Dict[str, Any]], repeat: int = 3) -> Dict[str, Any]:
+    """
+    Try every candidate index on a scratch copy of the DB and keep the ones the planner uses.
+
+    Returns:
+        Dict with keys:
+        - indexes: [{'table', 'column', 'sql', 'reasons', 'queries'}] proposals
+        - rejected: candidates the planner ignored
+        - before_ms / after_ms: per-query median latency without / with the proposals
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch_path = os.path.join(tmp, 'advisor.sqlite')
+        source = sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+        scratch = sqlite3.connect(scratch_path)
+        try:
+            source.backup(scratch)
+        finally:
+            source.close()
+
+        try:
+            candidates = find_candidates(scratch, workload)
+            before = measure(scratch, workload, repeat)
+
+            for table, column in candidates:
+                scratch.execute(create_index_sql(table, column))
+            used = set()
+            for item in workload:
+                try:
+                    used.update(re.findall(r'INDEX (idx_\w+)', ' '.join(explain(scratch, item['sql']))))
+                except sqlite3.Error:
+                    continue
+
+            indexes, rejected = [], []
+            for (table, column), info in candidates.items():
+                proposal = {
+                    'table': table,
+                    'column': column,
+                    'sql': create_index_sql(table, column),
+                    'reasons': sorted(info['reasons']),
+                    'queries': sorted(info['queries']),
+                }
+                if index_name(table, column) in used:
+                    indexes.append(proposal)
+                else:
+                    scratch.execute(f"DROP INDEX {index_name(table, column)}")
+                    rejected.append(proposal)
+
+            after = measure(scratch, workload, repeat)
+        finally:
+            scratch.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return {'indexes': indexes, 'rejected': rejected, 'before_ms': before, 'after_ms': after}
+
+
+def apply_indexes(db_path: str, indexes: List[Dict[str, Any]]):
+    """Create the proposed indexes on the real database (like apply_date_key, an explicit opt-in migration)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        for index in indexes:
+            conn.execute(index['sql'])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+# ------------------------------
+# CLI
+# ------------------------------
+@click.command()
+@click.option('--log', 'log_path', default=DEFAULT_LOG_PATH, show_default=True, help='Query log written by execute_sql')
+@click.option('--db', 'db_path', default=None, help=f'Database to analyse (default: {sqlite_tool.DB_PATH})')
+@click.option('--repeat', default=3, show_default=True, help='Timed runs per query (median is reported)')
+@click.option('--apply', 'apply', is_flag=True, help='Create the proposed indexes')
+def main(log_path, db_path, repeat, apply):
+    """Propose (and optionally create) indexes for the logged agent workload"""
+    db_path = db_path or sqlite_tool.DB_PATH
+    if not os.path.exists(log_path):
+        raise click.ClickException(f"No query log at {log_path}; run the agent first")
+    workload = load_workload(log_path)
+    if not workload:
+        raise click.ClickException(f"No base-table queries in {log_path}")
+    print(f"📋 Workload: {len(workload)} distinct queries, {sum(w['count'] for w in workload)} executions")
+
+    report = advise(db_path, workload, repeat)
+
+    for index in report['indexes']:
+        print(f"\n✅ {index['sql']}")
+        print(f"   reasons: {', '.join(index['reasons'])}; helps {len(index['queries'])} queries")
+    for index in report['rejected']:
+        print(f"\n➖ {index_name(index['table'], index['column'])}: not used by the planner "
+              f"({', '.join(index['reasons'])})")
+
+    before = _weighted_total(workload, report['before_ms'])
+    after = _weighted_total(workload, report['after_ms'])
+    print("\n⏱️  Slowest queries (median ms, before → after):")
+    ranked = sorted(range(len(workload)), key=lambda i: -(report['before_ms'][i] if report['before_ms'][i] == report['before_ms'][i] else 0))
+    for i in ranked[:10]:
+        sql = ' '.join(workload[i]['sql'].split())
+        print(f"   {report['before_ms'][i]:8.2f} → {report['after_ms'][i]:8.2f}  x{workload[i]['count']:<3} {sql[:90]}")
+    print(f"\n📊 Workload total: {before:.1f} ms → {after:.1f} ms ({before / max(after, 1e-9):.1f}x)")
+
+    if not report['indexes']:
+        print("\nNo indexes to propose.")
+    elif apply:
+        apply_indexes(db_path, report['indexes'])
+        print(f"\n🛠️  Created {len(report['indexes'])} indexes on {db_path} "
+              f"(SQL cache and rollups refresh automatically)")
+    else:
+        print("\nRe-run with --apply to create them.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# ==============================================================================
+# QUERY GUARDRAILS - Cost preflight, wall-clock deadline and row cap
+# ==============================================================================
+
+QUERY_TIMEOUT_S = 10.0            # wall-clock budget per query
+MAX_RESULT_ROWS = 10_000          # answers are scalars or short lists; more means a wrong query
+MAX_SCAN_PRODUCT = 1_000_000      # nested full scans allowed before a plan counts as cartesian
+PROGRESS_STEPS = 10_000           # VM instructions between deadline checks
+FETCH_BATCH = 1_000
+
+# SCAN = full pass over a table (even via a covering index); SEARCH = index lookup
+_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(?P<name>[^(].*?)(?: AS (?P<alias>\w+))?(?: USING (?:COVERING )?INDEX .*)?$')
+
+
+class QueryTooExpensive(Exception):
+    """A query was refused or stopped by a guardrail"""
+
+    def __init__(self, reason: str, message: str):
+        """
+        Args:
+            reason: 'cartesian', 'timeout' or 'row_cap'
+            message: Human/LLM-readable explanation with a fix hint
+        """
+        super().__init__(message)
+        self.reason = reason
+
+
+def _estimate_rows(conn: sqlite3.Connection, name: str) -> int:
+    """Row count of a table or view, counting at most MAX_SCAN_PRODUCT + 1 rows"""
+    quoted = '"' + name.strip('"').replace('"', '""') + '"'
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM (SELECT 1 FROM {quoted} LIMIT {MAX_SCAN_PRODUCT + 1})").fetchone()[0]
+    except sqlite3.Error:
+        return 1  # CTE or subquery name: not resolvable on its own
+
+
+def _aliases(sql: str) -> Dict[str, str]:
+    """alias → table for FROM / JOIN / comma-joined table references"""
+    aliases = {}
+    for table, alias in re.findall(
+            r'(?:\bFROM|\bJOIN|,)\s+("[^"]+"|\w+)(?:\s+(?:AS\s+)?(?!ON\b|JOIN\b|WHERE\b|INNER\b|LEFT\b|CROSS\b|'
+            r'GROUP\b|ORDER\b|LIMIT\b|USING\b)(\w+))?', sql, re.IGNORECASE):
+        aliases[(alias or table).strip('"').lower()] = table.strip('"')
+        aliases[table.strip('"').lower()] = table.strip('"')
+    return aliases
+
+
+def preflight(conn: sqlite3.Connection, sql: str, max_scan_product: int = MAX_SCAN_PRODUCT):
+    """
+    Reject plans that nest full scans of several tables with no join condition.
+
+    EXPLAIN QUERY PLAN lists the loops of one SELECT as siblings under the same
+    parent. Two or more `SCAN` loops there (rather than index `SEARCH`es) mean
+    every row of one table is paired with every row of the other.
+
+    Raises:
+        QueryTooExpensive: reason 'cartesian'
+        sqlite3.Error: if the query doesn't compile (left to the normal error path)
+    """
+    loops: Dict[int, List[str]] = {}
+    for _, parent, _, detail in conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall():
+        match = _FULL_SCAN.match(detail)
+        if match and match.group('name') != 'CONSTANT ROW':
+            loops.setdefault(parent, []).append(match.group('alias') or match.group('name'))
+
+    aliases = None
+    for names in loops.values():
+        if len(names) < 2:
+            continue
+        aliases = aliases or _aliases(sql)
+        tables = [aliases.get(name.strip('"').lower(), name) for name in names]
+        counts = [_estimate_rows(conn, table) for table in tables]
+        product = 1
+        for count in counts:
+            product *= max(count, 1)
+        if product > max_scan_product:
+            shown = ' x '.join(f'"{t}" ({c:,} rows)' for t, c in zip(tables, counts))
+            raise QueryTooExpensive(
+                'cartesian',
+                f"Query too expensive: cartesian product of {shown} ≈ {product:,} row combinations. "
+                f"Every joined table needs an ON condition linking it to the others."
+            )
+
+
+@contextmanager
+def deadline(conn: sqlite3.Connection, seconds: Optional[float]):
+    """Interrupt the statement running on `conn` once `seconds` have passed"""
+    if not seconds:
+        yield
+        return
+    expires = time.monotonic() + seconds
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > expires else 0, PROGRESS_STEPS)
+    try:
+        yield
+    except sqlite3.OperationalError as e:
+        if 'interrupted' in str(e).lower():
+            raise QueryTooExpensive(
+                'timeout',
+                f"Query too expensive: stopped after {seconds:g}s. "
+                f"Check for missing join conditions, filter earlier, or aggregate instead of listing rows."
+            ) from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def fetch_capped(cursor: sqlite3.Cursor, max_rows: Optional[int]) -> list:
+    """fetchall() that gives up after max_rows instead of materializing everything"""
+    if not max_rows:
+        return cursor.fetchall()
+    rows = []
+    while True:
+        batch = cursor.fetchmany(FETCH_BATCH)
+        if not batch:
+            return rows
+        rows.extend(batch)
+        if len(rows) > max_rows:
+            raise QueryTooExpensive(
+                'row_cap',
+                f"Query too expensive: returned more than {max_rows:,} rows. "
+                f"Aggregate (SUM/COUNT/GROUP BY) or add ORDER BY ... LIMIT to return only what the question asks for."
+            )
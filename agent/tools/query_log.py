@@ -0,0 +1,94 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+# ==============================================================================
+# QUERY LOG - Append-only JSONL record of every query execute_sql runs
+# ==============================================================================
+
+DEFAULT_LOG_PATH = ".cache/query_log.jsonl"
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024  # per file; one rotated file (<path>.1) is kept
+
+
+class QueryLog:
+    """
+    Thread-safe JSONL query log, the workload the index advisor replays.
+
+    One line per execute_sql call:
+        {"ts", "sql", "source": "base" | "rollup" | "cache", "ms", "success", "row_count"}
+
+    Once the file reaches max_bytes it is renamed to <path>.1 (replacing the
+    previous one) and a new file is started, so the log stays under 2 * max_bytes.
+    """
+
+    def __init__(self, path: str = DEFAULT_LOG_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file = None
+
+    def record(self, sql: str, source: str, ms: float, success: bool, row_count: int = 0):
+        entry = {
+            'ts': round(time.time(), 3),
+            'sql': sql,
+            'source': source,
+            'ms': round(ms, 3),
+            'success': success,
+            'row_count': row_count,
+        }
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            try:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                elif self._file.tell() >= self.max_bytes:
+                    self._file.close()
+                    self._file = None
+                    os.replace(self.path, self.path + '.1')
+                    self._file = open(self.path, 'a', encoding='utf-8')
+                self._file.write(line)
+                self._file.flush()
+            except OSError:
+                pass  # logging must never fail a query
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_query_log(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield log entries oldest first (the rotated <path>.1, then `path`), skipping
+    lines that don't parse (e.g. a torn last line)
+    """
+    for file_path in (path + '.1', path):
+        if file_path != path and not os.path.exists(file_path):
+            continue
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+_log: Optional[QueryLog] = QueryLog()
+
+
+def get_query_log() -> Optional[QueryLog]:
+    return _log
+
+
+def configure_query_log(path: Optional[str] = DEFAULT_LOG_PATH,
+                        max_bytes: int = DEFAULT_MAX_BYTES) -> Optional[QueryLog]:
+    """Log to `path`, or disable logging with None"""
+    global _log
+    if _log is not None:
+        _log.close()
+    _log = QueryLog(path, max_bytes) if path else None
+    return _log
@@ -0,0 +1,120 @@
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# ==============================================================================
+# RESULT SET - Column names stored once, rows kept as the tuples SQLite returns
+# ==============================================================================
+
+_JSON_TAG = "__result_set__"
+
+
+class ResultSet(Sequence):
+    """
+    Immutable SQL result: one tuple of column names plus one value tuple per row.
+
+    Behaves like the old list of row dicts (len, indexing, slicing, iteration,
+    truthiness, == against a list of dicts), but a dict is only built for a row
+    when that row is accessed, so large intermediate results don't carry a copy
+    of the key set per row. Columnar access and NumPy/pandas export read the
+    tuples directly.
+    """
+
+    __slots__ = ('columns', '_rows', '_index', '_by_column')
+
+    def __init__(self, columns: Iterable[str], rows: List[tuple]):
+        self.columns: Tuple[str, ...] = tuple(columns)
+        self._rows = rows
+        self._index = {name: i for i, name in enumerate(self.columns)}
+        self._by_column: Dict[str, tuple] = {}
+
+    @classmethod
+    def from_cursor(cls, cursor, rows: List[tuple]) -> 'ResultSet':
+        """Wrap rows fetched from `cursor` (plain tuples, no row_factory)"""
+        columns = [d[0] for d in cursor.description] if cursor.description else []
+        return cls(columns, rows)
+
+    # ------------------------------
+    # Row (dict) API
+    # ------------------------------
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [dict(zip(self.columns, row)) for row in self._rows[i]]
+        return dict(zip(self.columns, self._rows[i]))
+
+    def __iter__(self):
+        columns = self.columns
+        for row in self._rows:
+            yield dict(zip(columns, row))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, ResultSet):
+            return self.columns == other.columns and self._rows == other._rows
+        if isinstance(other, list):
+            return len(other) == len(self) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ResultSet(columns={list(self.columns)}, rows={len(self._rows)})"
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return list(self)
+
+    # ------------------------------
+    # Columnar API
+    # ------------------------------
+    def tuples(self) -> List[tuple]:
+        """Row value tuples, in column order (no copy)"""
+        return self._rows
+
+    def column(self, name: str) -> tuple:
+        """All values of one column (computed once, then reused)"""
+        values = self._by_column.get(name)
+        if values is None:
+            i = self._index[name]
+            values = tuple(row[i] for row in self._rows)
+            self._by_column[name] = values
+        return values
+
+    def to_numpy(self, columns: Optional[List[str]] = None):
+        """
+        Numeric columns as a float64 array of shape (rows, columns).
+        NULLs become NaN; non-numeric values raise ValueError.
+        """
+        import numpy as np
+        names = list(columns) if columns is not None else list(self.columns)
+        array = np.empty((len(self._rows), len(names)), dtype=np.float64)
+        for j, name in enumerate(names):
+            array[:, j] = [np.nan if v is None else v for v in self.column(name)]
+        return array
+
+    def to_pandas(self):
+        """pandas DataFrame with the result's columns (pandas is imported on first use)"""
+        import pandas as pd
+        return pd.DataFrame.from_records(self._rows, columns=list(self.columns))
+
+    # ------------------------------
+    # JSON (SQL result cache)
+    # ------------------------------
+    def to_json(self) -> Dict[str, Any]:
+        return {_JSON_TAG: True, 'columns': list(self.columns), 'data': self._rows}
+
+    @classmethod
+    def from_json(cls, obj: Dict[str, Any]) -> 'ResultSet':
+        return cls(obj['columns'], [tuple(row) for row in obj['data']])
+
+
+def json_default(obj):
+    """json.dumps(default=...) hook: ResultSet → its compact columnar form"""
+    if isinstance(obj, ResultSet):
+        return obj.to_json()
+    raise TypeError(f"{type(obj).__name__} is not JSON serializable")
+
+
+def json_object_hook(obj: Dict[str, Any]):
+    """json.loads(object_hook=...) counterpart of json_default"""
+    if obj.get(_JSON_TAG):
+        return ResultSet.from_json(obj)
+    return obj
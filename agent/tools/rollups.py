@@ -0,0 +1,371 @@
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+from agent.tools.sql_cache import db_fingerprint
+
+# ==============================================================================
+# KPI ROLLUPS - Daily pre-aggregates and a rewrite layer for aggregate queries
+# ==============================================================================
+
+ROLLUP_PATH = ".cache/rollups.sqlite"
+ROLLUP_SQL = os.path.join(os.path.dirname(__file__), "..", "..", "data", "create_rollups.sql")
+ROLLUP_VERSION = "1"  # bump when data/create_rollups.sql changes
+
+# Base tables a rewritable query may join, by role
+TABLE_ROLES = {
+    'order details': 'od', 'order_details': 'od',
+    'orders': 'o',
+    'products': 'p',
+    'categories': 'c',
+    'customers': 'cu',
+}
+
+# Join conditions the rollups were built with: {roles} → key column
+JOIN_KEYS = {
+    frozenset({'od', 'o'}): 'orderid',
+    frozenset({'od', 'p'}): 'productid',
+    frozenset({'p', 'c'}): 'categoryid',
+    frozenset({'o', 'cu'}): 'customerid',
+}
+
+# Descriptor columns → rollup column
+DIMENSION_COLUMNS = {
+    '<c>.categoryname': 'category',
+    '<p>.productname': 'product',
+    '<cu>.companyname': 'customer',
+}
+
+# Rollup tables, smallest first:
+# (table, dimension columns, grain, roles that must be joined, roles that may be joined)
+# `orders` only adds up correctly across days, not across the grain: an order with
+# several products counts once per product. Order-count metrics (AOV) therefore
+# need every grain column grouped or filtered.
+ROLLUPS = [
+    ('rollup_daily', set(), set(), set(), {'o'}),
+    ('rollup_daily_category', {'category'}, {'category'}, {'p', 'c'}, {'o', 'p', 'c'}),
+    ('rollup_daily_customer', {'customer'}, {'customer'}, {'o', 'cu'}, {'o', 'cu'}),
+    ('rollup_daily_product', {'product', 'category'}, {'product'}, {'p'}, {'o', 'p', 'c'}),
+]
+
+_REVENUE = r'sum\(<od>\.unitprice\*<od>\.quantity\*\(1-<od>\.discount\)\)'
+_METRIC_PATTERNS = [
+    (re.compile(rf'^{_REVENUE}/count\(distinct<od>\.orderid\)$'), lambda m: "SUM(r.revenue) / SUM(r.orders)"),
+    (re.compile(rf'^{_REVENUE}$'), lambda m: "SUM(r.revenue)"),
+    (re.compile(r'^sum\(<od>\.quantity\)$'), lambda m: "SUM(r.quantity)"),
+    (re.compile(r'^sum\(\(<od>\.unitprice-(\d+(?:\.\d+)?)\*<od>\.unitprice\)\*<od>\.quantity\*\(1-<od>\.discount\)\)$'),
+     lambda m: f"SUM(r.revenue) * (1 - {m.group(1)})"),
+]
+
+_QUERY = re.compile(
+    r'^SELECT\s+(?P<select>.+?)\s+'
+    r'FROM\s+(?P<from>.+?)'
+    r'(?:\s+WHERE\s+(?P<where>.+?))?'
+    r'(?:\s+GROUP\s+BY\s+(?P<group>.+?))?'
+    r'(?:\s+ORDER\s+BY\s+(?P<order>.+?))?'
+    r'(?:\s+LIMIT\s+(?P<limit>\d+))?\s*;?$',
+    re.IGNORECASE | re.DOTALL
+)
+_TABLE = r'("[^"]+"|\[[^\]]+\]|\w+)(?:\s+(?:AS\s+)?(?!ON\b|JOIN\b|INNER\b)(\w+))?'
+_FROM = re.compile(rf'^{_TABLE}$', re.IGNORECASE)
+_JOIN = re.compile(rf'^(?:INNER\s+)?JOIN\s+{_TABLE}\s+ON\s+(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)$', re.IGNORECASE)
+_BETWEEN = re.compile(r"(\S+(?:\([^)]*\))?)\s+BETWEEN\s+('[^']*')\s+AND\s+('[^']*')", re.IGNORECASE)
+_ISO_DATE = re.compile(r"^'\d{4}-\d{2}-\d{2}'$")
+
+
+class _NotRewritable(Exception):
+    pass
+
+
+def _split_top_level(text: str, separator: str = ',') -> List[str]:
+    parts, depth, current = [], 0, []
+    for char in text:
+        depth += (char == '(') - (char == ')')
+        if char == separator and depth == 0:
+            parts.append(''.join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    parts.append(''.join(current).strip())
+    return parts
+
+
+def _parse_tables(from_clause: str) -> Dict[str, str]:
+    """alias → role, checking every join uses the key the rollups were built with"""
+    pieces = re.split(r'\s+(?=(?:INNER\s+)?JOIN\s)', from_clause.strip(), flags=re.IGNORECASE)
+    match = _FROM.match(pieces[0])
+    if not match:
+        raise _NotRewritable("FROM")
+    aliases = {}
+
+    def add(table: str, alias: Optional[str]) -> str:
+        role = TABLE_ROLES.get(table.strip('"[]').lower())
+        if role is None or role in aliases.values():
+            raise _NotRewritable(f"table {table}")
+        aliases[(alias or table.strip('"[]')).lower()] = role
+        return role
+
+    if add(match.group(1), match.group(2)) != 'od':
+        raise _NotRewritable("FROM must be Order Details")
+    for piece in pieces[1:]:
+        join = _JOIN.match(piece)
+        if not join:
+            raise _NotRewritable(f"join: {piece}")
+        role = add(join.group(1), join.group(2))
+        left, left_col, right, right_col = (g.lower() for g in join.group(3, 4, 5, 6))
+        roles = frozenset({aliases.get(left), aliases.get(right)})
+        if role not in roles or left_col != right_col or JOIN_KEYS.get(roles) != left_col:
+            raise _NotRewritable(f"join condition: {piece}")
+    return aliases
+
+
+def _canonical(expr: str, aliases: Dict[str, str]) -> str:
+    """Lowercase, aliases replaced by <role>, whitespace removed"""
+    expr = re.sub(r'\b(\w+)\.', lambda m: f"<{aliases[m.group(1).lower()]}>." if m.group(1).lower() in aliases
+                  else m.group(0), expr.lower())
+    return re.sub(r'\s+', '', expr)
+
+
+def _translate_expression(expr: str, aliases: Dict[str, str]):
+    """Returns (rollup SQL, dimension column or None)"""
+    canonical = _canonical(expr, aliases)
+    rounding = re.match(r'^round\((.+),(\d+)\)$', canonical)
+    inner = rounding.group(1) if rounding else canonical
+    if inner in DIMENSION_COLUMNS:
+        if rounding:
+            raise _NotRewritable("ROUND on a dimension")
+        return f"r.{DIMENSION_COLUMNS[inner]}", DIMENSION_COLUMNS[inner]
+    for pattern, render in _METRIC_PATTERNS:
+        match = pattern.match(inner)
+        if match:
+            sql = render(match)
+            return (f"ROUND({sql}, {rounding.group(2)})" if rounding else sql), None
+    raise _NotRewritable(f"expression: {expr}")
+
+
+def _translate_condition(condition: str, aliases: Dict[str, str]):
+    """Returns (rollup SQL, dimension column or None)"""
+    match = re.match(r"^(.+?)\s*(>=|<=|<|>|=)\s*('[^']*')$", condition.strip())
+    if not match:
+        raise _NotRewritable(f"condition: {condition}")
+    left, op, literal = match.groups()
+    canonical = _canonical(left, aliases)
+
+    if canonical in DIMENSION_COLUMNS and op == '=':
+        column = DIMENSION_COLUMNS[canonical]
+        return f"r.{column} = {literal}", column
+    if _ISO_DATE.match(literal):
+        if canonical == 'date(<o>.orderdate)':
+            return f"r.day {op} {literal}", None
+        # r.day = DATE(OrderDate): only >= / < against a bare date mean the same on the raw timestamp
+        if canonical == '<o>.orderdate' and op in ('>=', '<'):
+            return f"r.day {op} {literal}", None
+    fmt = re.match(r"^strftime\(('%[ymd](?:-%[md])*'),<o>\.orderdate\)$", canonical)
+    if fmt:
+        return f"strftime({fmt.group(1).replace('%y', '%Y')}, r.day) {op} {literal}", None
+    raise _NotRewritable(f"condition: {condition}")
+
+
+def rewrite_query(sql: str) -> Optional[str]:
+    """
+    Rewrite a KPI aggregate over "Order Details" onto a daily rollup table.
+
+    Accepts SELECT [dimension AS a,] metric AS b FROM "Order Details" + FK joins
+    to Orders / Products / Categories / Customers, AND-ed date and descriptor
+    filters, GROUP BY the dimension, ORDER BY / LIMIT. Metrics are revenue,
+    quantity, AOV and gross margin written as in docs/kpi_definitions.md,
+    optionally wrapped in ROUND(). Anything else returns None.
+    """
+    match = _QUERY.match(' '.join(sql.split()))
+    if not match:
+        return None
+    try:
+        aliases = _parse_tables(match.group('from'))
+        roles = set(aliases.values()) - {'od'}
+
+        select, dimensions, output, select_dimensions = [], [], {}, []
+        counts_orders = False
+        for item in _split_top_level(match.group('select')):
+            parts = re.match(r'^(.+?)\s+AS\s+"?(\w+)"?$', item, re.IGNORECASE)
+            if not parts:
+                raise _NotRewritable("select items need aliases")
+            expr_sql, dimension = _translate_expression(parts.group(1), aliases)
+            if dimension:
+                dimensions.append(dimension)
+            select_dimensions.append(dimension)
+            counts_orders = counts_orders or 'r.orders' in expr_sql
+            select.append(f"{expr_sql} AS {parts.group(2)}")
+            output[_canonical(parts.group(1), aliases)] = parts.group(2)
+
+        where, filters = [], set()
+        if match.group('where'):
+            conditions = _BETWEEN.sub(r"\1 >= \2 AND \1 <= \3", match.group('where'))
+            if re.search(r'\bOR\b', conditions, re.IGNORECASE):
+                raise _NotRewritable("OR")
+            for condition in re.split(r'\s+AND\s+', conditions, flags=re.IGNORECASE):
+                condition_sql, column = _translate_condition(condition, aliases)
+                where.append(condition_sql)
+                if column:
+                    filters.add(column)
+
+        dimension_aliases = {name.lower(): dim for name, dim in zip(output.values(), select_dimensions)}
+        grouped = []
+        for key in _split_top_level(match.group('group')) if match.group('group') else []:
+            alias_dimension = dimension_aliases.get(key.strip('"').lower())
+            grouped.append(alias_dimension or _translate_expression(key, aliases)[1])
+        if sorted(filter(None, grouped)) != sorted(dimensions) or None in grouped:
+            raise _NotRewritable("GROUP BY must list exactly the selected dimensions")
+
+        order = ''
+        if match.group('order'):
+            order_match = re.match(r'^(.+?)(?:\s+(ASC|DESC))?$', match.group('order'), re.IGNORECASE)
+            key = order_match.group(1)
+            name = output.get(_canonical(key, aliases)) or next(
+                (alias for alias in output.values() if alias.lower() == key.strip('"').lower()), None)
+            if name is None:
+                raise _NotRewritable("ORDER BY")
+            order = f" ORDER BY {name} {(order_match.group(2) or 'ASC').upper()}"
+
+        needed = set(dimensions) | filters
+        for table, columns, grain, required, allowed in ROLLUPS:
+            if needed <= columns and required <= roles <= allowed and (not counts_orders or grain <= needed):
+                break
+        else:
+            raise _NotRewritable("no rollup covers the query")
+
+        # Inner joins the rollup replaced with LEFT JOINs
+        if 'o' in roles and table != 'rollup_daily_customer':
+            where.append("r.day IS NOT NULL")
+        if 'c' in roles and table == 'rollup_daily_product':
+            where.append("r.category IS NOT NULL")
+    except _NotRewritable:
+        return None
+
+    rewritten = f"SELECT {', '.join(select)} FROM {table} r"
+    if where:
+        rewritten += " WHERE " + " AND ".join(where)
+    if dimensions:
+        rewritten += " GROUP BY " + ", ".join(f"r.{d}" for d in dimensions)
+    rewritten += order
+    if match.group('limit'):
+        rewritten += f" LIMIT {match.group('limit')}"
+    return rewritten
+
+
+# ------------------------------
+# Rollup store
+# ------------------------------
+class RollupStore:
+    """
+    Rollup tables in their own SQLite file (the Northwind DB stays read-only).
+
+    The store records the fingerprint of the base DB it was built from and is
+    rebuilt whenever that changes. While a rebuild runs, other threads keep
+    querying the base tables instead of waiting.
+    """
+
+    def __init__(self, db_path: str, path: str = ROLLUP_PATH, sql_path: str = ROLLUP_SQL):
+        self.db_path = db_path
+        self.path = path
+        self.sql_path = sql_path
+        self.pool = None
+        self._built_for = None
+        self._lock = threading.Lock()
+        self.rewrites = 0
+        self.builds = 0
+
+    def _read_meta(self) -> Dict[str, str]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            try:
+                return dict(conn.execute("SELECT key, value FROM rollup_meta").fetchall())
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return {}
+
+    def _build(self, fingerprint: str):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("ATTACH DATABASE ? AS base", (f"file:{os.path.abspath(self.db_path)}?mode=ro",))
+            with open(self.sql_path, 'r') as f:
+                conn.executescript(f.read())
+            conn.execute("CREATE TABLE rollup_meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.executemany("INSERT INTO rollup_meta VALUES (?, ?)",
+                             [('fingerprint', fingerprint), ('version', ROLLUP_VERSION)])
+            conn.commit()
+            conn.execute("DETACH DATABASE base")
+        finally:
+            conn.close()
+        os.replace(tmp_path, self.path)
+        self.builds += 1
+
+    def ensure(self) -> bool:
+        """Make sure rollups match the current base DB. Returns False if they can't be used right now."""
+        fingerprint = db_fingerprint(self.db_path)
+        if self._built_for == fingerprint:
+            return True
+        if not self._lock.acquire(blocking=False):
+            return False  # another thread is (re)building
+        try:
+            if self._built_for == fingerprint:
+                return True
+            meta = self._read_meta()
+            if meta.get('fingerprint') != fingerprint or meta.get('version') != ROLLUP_VERSION:
+                self._build(fingerprint)
+            # Imported here: sqlite_tool routes queries through this module
+            from agent.tools.sqlite_tool import ConnectionPool
+            old, self.pool = self.pool, ConnectionPool(self.path)
+            if old is not None:
+                old.close_all()
+            self._built_for = fingerprint
+            return True
+        except (OSError, sqlite3.Error) as e:
+            print(f"⚠️  Rollups unavailable, using base tables: {e}")
+            self._built_for = None
+            return False
+        finally:
+            self._lock.release()
+
+    def route(self, sql: str) -> Optional[str]:
+        """Rollup SQL answering `sql`, or None to run it on the base tables"""
+        rewritten = rewrite_query(sql)
+        if rewritten is None or not self.ensure():
+            return None
+        self.rewrites += 1
+        return rewritten
+
+    def stats(self) -> Dict[str, Any]:
+        return {'rewrites': self.rewrites, 'builds': self.builds, 'path': self.path}
+
+
+_store: Optional[RollupStore] = None
+_settings = {'enabled': True, 'path': ROLLUP_PATH}
+_store_lock = threading.Lock()
+
+
+def get_rollups(db_path: str) -> Optional[RollupStore]:
+    """Shared RollupStore for db_path (None when rollups are disabled)"""
+    global _store
+    if not _settings['enabled']:
+        return None
+    with _store_lock:
+        if _store is None or _store.db_path != db_path:
+            _store = RollupStore(db_path, path=_settings['path'])
+        return _store
+
+
+def configure_rollups(enabled: bool = True, path: str = ROLLUP_PATH):
+    """Enable/disable rollup routing or move the rollup file"""
+    global _store
+    with _store_lock:
+        _settings.update(enabled=enabled, path=path)
+        _store = None
@@ -0,0 +1,255 @@
+import re
+import sqlite3
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from agent.tools.sqlite_tool import get_pool, get_schema_info, get_foreign_keys, get_schema_text, quote_table
+
+# ==============================================================================
+# SCHEMA LINKING - Only send the tables a question needs to the NL2SQL prompt
+# ==============================================================================
+
+# Business vocabulary → tables that answer it (only tables present in the DB are used)
+KEYWORD_TABLES = {
+    'revenue': ['Order Details'],
+    'sales': ['Order Details'],
+    'sold': ['Order Details'],
+    'sell': ['Order Details'],
+    'quantity': ['Order Details'],
+    'unit': ['Order Details'],
+    'discount': ['Order Details'],
+    'aov': ['Order Details', 'Orders'],
+    'margin': ['Order Details'],
+    'cost': ['Order Details'],
+    'category': ['Categories'],
+    'product': ['Products'],
+    'item': ['Products'],
+    'stock': ['Products'],
+    'customer': ['Customers'],
+    'client': ['Customers'],
+    'company': ['Customers'],
+    'supplier': ['Suppliers'],
+    'vendor': ['Suppliers'],
+    'employee': ['Employees'],
+    'salesperson': ['Employees'],
+    'shipper': ['Shippers'],
+    'freight': ['Orders'],
+    'order': ['Orders'],
+    'date': ['Orders'],
+    'year': ['Orders'],
+    'month': ['Orders'],
+    'during': ['Orders'],
+    'territory': ['Territories'],
+    'region': ['Regions'],
+}
+
+# Columns always kept for a linked table: they name rows or carry the KPI inputs
+_DESCRIPTOR_COLUMN = re.compile(r'(Name|Date|Price|Quantity|Discount)$')
+
+# Column name parts too common to link a column on their own
+_GENERIC_PARTS = {'id', 'name', 'order', 'unit', 'ship', 'date', 'type'}
+
+# Category name parts that also mean a table ('Dairy Products'): not a category mention
+_GENERIC_CATEGORY_PARTS = {'product'}
+
+
+def _split_identifier(name: str) -> List[str]:
+    """'CategoryName' → ['category', 'name'], 'Order Details' → ['order', 'detail']"""
+    parts = re.findall(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+', name)
+    return [_singular(p.lower()) for p in parts]
+
+
+def _singular(word: str) -> str:
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def approx_tokens(text: str) -> int:
+    """Rough prompt-token estimate (~4 characters per token for English/SQL)"""
+    return (len(text) + 3) // 4
+
+
+class SchemaLinker:
+    """
+    Picks the tables and columns relevant to a question and the join paths between them.
+
+    Tables are seeded by keyword matches (table names, column names, business
+    vocabulary, category names stored in the DB, extracted constraints), then
+    connected through the foreign-key graph (declared FKs plus columns that share
+    a name with another table's single-column primary key). Falls back to the full schema when nothing links.
+    """
+
+    def __init__(self):
+        self.schema = get_schema_info()
+        self.graph = self._build_join_graph()
+        self.category_words = self._category_words()
+        self.full_text = get_schema_text()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.tokens_full = 0
+        self.tokens_linked = 0
+
+    def _build_join_graph(self) -> Dict[str, Dict[str, tuple]]:
+        """table → {neighbour: (column, neighbour_column)}"""
+        graph = {table: {} for table in self.schema}
+
+        def connect(a, col_a, b, col_b):
+            if a in graph and b in graph and a != b:
+                graph[a].setdefault(b, (col_a, col_b))
+                graph[b].setdefault(a, (col_b, col_a))
+
+        for fk in get_foreign_keys():
+            connect(fk['table'], fk['column'], fk['ref_table'], fk['ref_column'])
+
+        # Undeclared keys: a column named like another table's primary key
+        primary_keys = {}
+        for table, columns in self.schema.items():
+            pks = [c['name'] for c in columns if c['pk']]
+            if len(pks) == 1:
+                primary_keys.setdefault(pks[0], table)
+        for table, columns in self.schema.items():
+            for col in columns:
+                owner = primary_keys.get(col['name'])
+                if owner:
+                    connect(table, col['name'], owner, col['name'])
+        return graph
+
+    def _category_words(self) -> set:
+        """Words of the CategoryName values in the DB ('Seafood', 'Meat/Poultry' → meat, poultry)"""
+        if 'Categories' not in self.schema:
+            return set()
+        try:
+            with get_pool().connection() as conn:
+                names = [row[0] for row in conn.execute('SELECT CategoryName FROM Categories') if row[0]]
+        except sqlite3.Error:
+            return set()
+        return {_singular(w) for name in names for w in re.findall(r'[a-z]+', name.lower())} - _GENERIC_CATEGORY_PARTS
+
+    # ------------------------------
+    # Linking
+    # ------------------------------
+    def _seed_tables(self, question: str, constraints: dict) -> Dict[str, set]:
+        """table → columns matched directly by the question"""
+        words = {_singular(w) for w in re.findall(r'[a-z]+', question.lower())}
+        seeds: Dict[str, set] = {}
+
+        for table, columns in self.schema.items():
+            table_parts = _split_identifier(table)
+            if table_parts and all(part in words for part in table_parts):
+                seeds.setdefault(table, set())
+            for col in columns:
+                if col['name'].endswith('ID'):
+                    continue  # key columns are reached through the join graph instead
+                parts = [p for p in _split_identifier(col['name']) if p not in _GENERIC_PARTS]
+                if parts and all(part in words for part in parts):
+                    seeds.setdefault(table, set()).add(col['name'])
+
+        for word in words:
+            for table in KEYWORD_TABLES.get(word, []):
+                if table in self.schema:
+                    seeds.setdefault(table, set())
+
+        if words & self.category_words:
+            seeds.setdefault('Categories', set()).add('CategoryName')
+
+        if re.search(r'\b(19|20)\d{2}\b', question) or constraints.get('date_range'):
+            if 'Orders' in self.schema:
+                seeds.setdefault('Orders', set()).add('OrderDate')
+        if constraints.get('category') and 'Categories' in self.schema:
+            seeds.setdefault('Categories', set()).add('CategoryName')
+        if constraints.get('kpi_type') and 'Order Details' in self.schema:
+            seeds.setdefault('Order Details', set())
+        return seeds
+
+    def shortest_path(self, sources: set, target: str) -> Optional[List[str]]:
+        """BFS from any table in `sources` to `target`; returns the path including both ends"""
+        queue = deque([[s] for s in sorted(sources)])
+        seen = set(sources)
+        while queue:
+            path = queue.popleft()
+            if path[-1] == target:
+                return path
+            for neighbour in sorted(self.graph[path[-1]]):
+                if neighbour not in seen:
+                    seen.add(neighbour)
+                    queue.append(path + [neighbour])
+        return None
+
+    def link(self, question: str, constraints: Optional[dict] = None) -> Dict[str, Any]:
+        """
+        Returns:
+            Dict with keys:
+            - text: schema text for the prompt
+            - tables: linked tables (all tables on fallback)
+            - join_paths: join conditions between linked tables
+            - tokens_full / tokens_linked: approximate prompt tokens of each schema text
+        """
+        seeds = self._seed_tables(question, constraints or {})
+        if not seeds:
+            return self._record(self.full_text, list(self.schema), [])
+
+        # Grow a connected tree: repeatedly attach the nearest unconnected seed
+        ordered = sorted(seeds, key=lambda t: (-len(self.graph[t]), t))
+        connected = {ordered[0]}
+        edges = []
+        for table in ordered[1:]:
+            if table in connected:
+                continue
+            path = self.shortest_path(connected, table)
+            if path is None:
+                connected.add(table)  # disconnected component; still show it
+                continue
+            for a, b in zip(path, path[1:]):
+                if b not in connected:
+                    edges.append((a, b))
+                connected.add(a)
+                connected.add(b)
+
+        columns: Dict[str, set] = {table: set(seeds.get(table, set())) for table in connected}
+        join_paths = []
+        for a, b in edges:
+            col_a, col_b = self.graph[a][b]
+            columns[a].add(col_a)
+            columns[b].add(col_b)
+            join_paths.append(f"{quote_table(a)}.{col_a} = {quote_table(b)}.{col_b}")
+        for table in connected:
+            for col in self.schema[table]:
+                if col['pk'] or _DESCRIPTOR_COLUMN.search(col['name']):
+                    columns[table].add(col['name'])
+
+        tables = [t for t in self.schema if t in connected]
+        text = get_schema_text(
+            tables=tables,
+            columns={t: sorted(cols) for t, cols in columns.items()},
+            join_paths=join_paths
+        )
+        return self._record(text, tables, join_paths)
+
+    def _record(self, text: str, tables: List[str], join_paths: List[str]) -> Dict[str, Any]:
+        tokens_full = approx_tokens(self.full_text)
+        tokens_linked = approx_tokens(text)
+        with self._lock:
+            self.calls += 1
+            self.tokens_full += tokens_full
+            self.tokens_linked += tokens_linked
+        return {
+            'text': text,
+            'tables': tables,
+            'join_paths': join_paths,
+            'tokens_full': tokens_full,
+            'tokens_linked': tokens_linked
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Cumulative prompt-token savings of linked vs full schema text"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'tokens_full': self.tokens_full,
+                'tokens_linked': self.tokens_linked,
+                'tokens_saved': self.tokens_full - self.tokens_linked,
+            }
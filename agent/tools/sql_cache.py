@@ -0,0 +1,207 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from agent.tools.result_set import json_default, json_object_hook
+
+# ==============================================================================
+# SQL RESULT CACHE - LLM-generated SQL repeats with cosmetic differences
+# ==============================================================================
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Functions whose result changes between calls; queries using them are never cached
+_NONDETERMINISTIC = re.compile(r"\brandom\s*\(|\brandomblob\s*\(|'now'", re.IGNORECASE)
+
+# Quoted segments keep their case and spacing: single-quoted string literals, and
+# double-quoted tokens, which SQLite reads as strings when no column matches
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Canonical form of a query for cache keys.
+    Collapses runs of whitespace outside quotes, so `SELECT  x FROM Orders;` and
+    `SELECT x\nFROM Orders` share an entry. Case is kept: result column names
+    come from the select list as written (`AS Total` vs `AS total`, `SUM(x)` vs `sum(x)`).
+    """
+    parts = _QUOTED.split(query.strip().rstrip(';').strip())
+    normalized = []
+    for i, part in enumerate(parts):
+        if i % 2:  # quoted segment
+            normalized.append(part)
+        else:
+            normalized.append(re.sub(r'\s+', ' ', part))
+    return ''.join(normalized).strip()
+
+
+def db_fingerprint(db_path: str) -> str:
+    """
+    Version of the database file for cache keys.
+    Uses mtime and size of the DB (and its WAL, if any) rather than PRAGMA data_version,
+    which is per-connection and meaningless across pooled connections or processes.
+    """
+    parts = [os.path.abspath(db_path)]
+    for path in (db_path, f"{db_path}-wal"):
+        try:
+            st = os.stat(path)
+            parts.append(f"{st.st_mtime_ns}:{st.st_size}")
+        except FileNotFoundError:
+            parts.append("-")
+    return "|".join(parts)
+
+
+def is_cacheable(query: str) -> bool:
+    return not _NONDETERMINISTIC.search(query)
+
+
+class SQLResultCache:
+    """
+    Thread-safe LRU cache of successful execute_sql results.
+
+    Entries are keyed by (db fingerprint, normalized SQL) and bounded by the
+    JSON-encoded size of the stored results. With persist_path set, entries are
+    also written through to a small SQLite file and survive restarts; the file
+    only keeps the current DB fingerprint's entries and the same byte budget,
+    dropping the oldest writes first.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, persist_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.persist_path = persist_path
+        self._entries: OrderedDict = OrderedDict()   # key -> (encoded result, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._disk = self._open_disk(persist_path) if persist_path else None
+        self._disk_fingerprint: Optional[str] = None
+        self._disk_bytes = self._disk_size() if self._disk is not None else 0
+
+    def _open_disk(self, path: str) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sql_results ("
+            "fingerprint TEXT, query TEXT, result TEXT, PRIMARY KEY (fingerprint, query))"
+        )
+        conn.commit()
+        return conn
+
+    def _disk_size(self) -> int:
+        return self._disk.execute("SELECT COALESCE(SUM(length(result)), 0) FROM sql_results").fetchone()[0]
+
+    def _use_fingerprint(self, fingerprint: str):
+        """Drop persisted entries of other DB versions; they can never be hit again"""
+        if self._disk_fingerprint == fingerprint:
+            return
+        self._disk.execute("DELETE FROM sql_results WHERE fingerprint != ?", (fingerprint,))
+        self._disk.commit()
+        self._disk_fingerprint = fingerprint
+        self._disk_bytes = self._disk_size()
+
+    def get(self, fingerprint: str, query: str) -> Optional[Dict[str, Any]]:
+        key = (fingerprint, normalize_sql(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._disk is not None:
+                self._use_fingerprint(fingerprint)
+                row = self._disk.execute(
+                    "SELECT result FROM sql_results WHERE fingerprint = ? AND query = ?", key
+                ).fetchone()
+                if row:
+                    entry = (row[0], len(row[0]))
+                    self._insert(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # Decode outside the lock; every caller gets its own copy of the result
+        return json.loads(entry[0], object_hook=json_object_hook)
+
+    def put(self, fingerprint: str, query: str, result: Dict[str, Any]):
+        key = (fingerprint, normalize_sql(query))
+        try:
+            encoded = json.dumps(result, default=json_default)
+        except (TypeError, ValueError):
+            return  # e.g. BLOB columns; not worth caching
+        if len(encoded) > self.max_bytes:
+            return
+        with self._lock:
+            self._insert(key, (encoded, len(encoded)))
+            if self._disk is not None:
+                self._persist(key, encoded)
+
+    def _persist(self, key, encoded: str):
+        self._use_fingerprint(key[0])
+        old = self._disk.execute(
+            "SELECT length(result) FROM sql_results WHERE fingerprint = ? AND query = ?", key
+        ).fetchone()
+        self._disk.execute("INSERT OR REPLACE INTO sql_results VALUES (?, ?, ?)", (*key, encoded))
+        self._disk_bytes += len(encoded) - (old[0] if old else 0)
+        if self._disk_bytes > self.max_bytes:
+            # INSERT OR REPLACE assigns a fresh rowid, so rowid order is write order
+            excess, cutoff = self._disk_bytes - self.max_bytes, None
+            for rowid, size in self._disk.execute("SELECT rowid, length(result) FROM sql_results ORDER BY rowid"):
+                excess -= size
+                self._disk_bytes -= size
+                cutoff = rowid
+                if excess <= 0:
+                    break
+            self._disk.execute("DELETE FROM sql_results WHERE rowid <= ?", (cutoff,))
+        self._disk.commit()
+
+    def _insert(self, key, entry):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = entry
+        self._bytes += entry[1]
+        while self._bytes > self.max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM sql_results")
+                self._disk.commit()
+                self._disk_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for tuning max_bytes"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_cache = SQLResultCache()
+
+
+def get_result_cache() -> SQLResultCache:
+    return _cache
+
+
+def configure_result_cache(max_bytes: int = DEFAULT_MAX_BYTES, persist_path: Optional[str] = None) -> SQLResultCache:
+    """Replace the shared cache, e.g. to change its size or persist it to disk"""
+    global _cache
+    _cache = SQLResultCache(max_bytes=max_bytes, persist_path=persist_path)
+    return _cache
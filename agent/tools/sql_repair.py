@@ -0,0 +1,341 @@
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.tools.sqlite_tool import get_pool, quote_table
+from agent.tools.schema_linker import SchemaLinker
+
+# ==============================================================================
+# SQL AUTO-REPAIR - Fix known LLM SQL mistakes locally instead of asking the LLM again
+# ==============================================================================
+
+MAX_FIXES = 5  # rewrites tried per query before handing it back to the LLM repair loop
+
+# Aliases the NL2SQL prompt teaches; used when a join has to be added
+DEFAULT_ALIASES = {
+    'Orders': 'o',
+    'Order Details': 'od',
+    'Products': 'p',
+    'Categories': 'c',
+    'Customers': 'cu',
+}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_CLAUSE_WORDS = r'ON|USING|JOIN|INNER|LEFT|RIGHT|CROSS|NATURAL|OUTER|FULL|WHERE|GROUP|ORDER|HAVING|LIMIT|UNION|WINDOW'
+_TABLE_REF = re.compile(
+    rf'\b(?:FROM|JOIN)\s+("[^"]+"|\[[^\]]+\]|\w+)(?:\s+(?:AS\s+)?(?!(?:{_CLAUSE_WORDS})\b)(\w+))?', re.IGNORECASE
+)
+_FROM_END = re.compile(r'\b(?:WHERE|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT|WINDOW|UNION|INTERSECT|EXCEPT)\b', re.IGNORECASE)
+_BETWEEN_TYPO = re.compile(r'\bBETWE(?!EN\b)[A-Z]*\b', re.IGNORECASE)
+_ORDER_DETAILS = re.compile(r'(?<!["\w\[`])Order[ _]?Details(?![\w"\]`])', re.IGNORECASE)
+_NO_SUCH_COLUMN = re.compile(r'no such column:\s*(?:(\w+)\.)?(\w+)', re.IGNORECASE)
+_NO_SUCH_TABLE = re.compile(r'no such table:\s*(?:main\.)?(\S+)', re.IGNORECASE)
+_AMBIGUOUS = re.compile(r'ambiguous column name:\s*(?:\w+\.)?(\w+)', re.IGNORECASE)
+_ON_CLAUSE = re.compile(rf'\bON\b(.*?)(?=\b(?:{_CLAUSE_WORDS})\b|$)', re.IGNORECASE | re.DOTALL)
+_EQUALITY = re.compile(r'("[^"]+"|\[[^\]]+\]|\w+)\.(\w+)\s*=\s*("[^"]+"|\[[^\]]+\]|\w+)\.(\w+)')
+_AGGREGATE = re.compile(r'\b(?:COUNT|SUM|AVG|TOTAL|GROUP_CONCAT)\s*\(', re.IGNORECASE)
+
+
+def _mask_literals(sql: str) -> str:
+    """Blank out string literals (same length) so keyword searches can't match inside them"""
+    return _STRING_LITERAL.sub(lambda m: "'" + ' ' * (len(m.group(0)) - 2) + "'", sql)
+
+
+def _replace_spans(sql: str, spans: List[Tuple[int, int]], text: str) -> str:
+    for start, end in sorted(spans, reverse=True):
+        sql = sql[:start] + text + sql[end:]
+    return sql
+
+
+def _alias_or_none(alias: str, table: str) -> Optional[str]:
+    """The alias a reference was written with, or None when the table name itself is used"""
+    return None if alias == table.lower() else alias
+
+
+def _ref(alias: str, table: str) -> str:
+    """How to qualify a column of `table` referenced under `alias`"""
+    return _alias_or_none(alias, table) or quote_table(table)
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+class SQLAutoRepair:
+    """
+    Validates generated SQL with EXPLAIN (prepared, never run) and rewrites the
+    mistakes the NL2SQL model is known to make:
+
+    - BETWEEN typos (BETWEDIR, BETWELOG, ...)
+    - unquoted or misspelled "Order Details" / other table names
+    - columns used through an alias or table that was never joined
+      (o.OrderDate without JOIN Orders o, CategoryName without Categories)
+    - columns qualified with the wrong table (p.CategoryName)
+    - ambiguous bare join-key columns
+
+    Joins are added along the schema linker's foreign-key graph, never to the many
+    side of a 1:N edge in an aggregating query. Only queries the rewriter can't fix
+    need an LLM repair turn.
+    """
+
+    def __init__(self, linker: Optional[SchemaLinker] = None):
+        self.linker = linker or SchemaLinker()
+        self.columns = {table: {c['name'].lower(): c['name'] for c in cols} for table, cols in self.linker.schema.items()}
+        self.tables = {_normalize(table): table for table in self.columns}
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.fixed = 0
+        self.unfixable = 0
+
+    # ------------------------------
+    # Validation
+    # ------------------------------
+    def validate(self, sql: str) -> Optional[str]:
+        """Compile `sql` without running it; returns the SQLite error message or None"""
+        try:
+            with get_pool().connection() as conn:
+                conn.execute(f"EXPLAIN {sql}").close()
+        except (sqlite3.Error, sqlite3.Warning) as e:
+            return str(e)
+        return None
+
+    def repair(self, sql: str) -> Dict[str, Any]:
+        """
+        Validate and, if needed, rewrite a query.
+
+        Returns:
+            Dict with keys:
+            - sql: the query to run (rewritten only if every error was fixed)
+            - fixes: descriptions of the rewrites applied
+            - error: validation error of the returned query (None if it compiles)
+        """
+        original = sql
+        error = first_error = self.validate(sql)
+        fixes: List[str] = []
+        for _ in range(MAX_FIXES):
+            if error is None:
+                break
+            fixed = self._fix(sql, error)
+            if fixed is None:
+                break
+            sql, note = fixed
+            fixes.append(note)
+            error = self.validate(sql)
+
+        with self._lock:
+            self.checked += 1
+            if first_error is not None:
+                if error is None:
+                    self.fixed += 1
+                else:
+                    self.unfixable += 1
+        if error is not None:
+            return {'sql': original, 'fixes': [], 'error': first_error}
+        return {'sql': sql, 'fixes': fixes, 'error': None}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'checked': self.checked, 'fixed': self.fixed, 'unfixable': self.unfixable}
+
+    # ------------------------------
+    # Rules
+    # ------------------------------
+    def _fix(self, sql: str, error: str) -> Optional[Tuple[str, str]]:
+        masked = _mask_literals(sql)
+        if 'syntax error' in error.lower():
+            spans = [m.span() for m in _BETWEEN_TYPO.finditer(masked)]
+            if spans:
+                return _replace_spans(sql, spans, 'BETWEEN'), "BETWEEN typo"
+        spans = [m.span() for m in _ORDER_DETAILS.finditer(masked)]
+        if spans and 'Order Details' in self.columns:
+            return _replace_spans(sql, spans, '"Order Details"'), 'quoted "Order Details"'
+
+        match = _NO_SUCH_TABLE.search(error)
+        if match:
+            return self._fix_table_name(sql, masked, match.group(1))
+        match = _NO_SUCH_COLUMN.search(error)
+        if match:
+            return self._fix_column(sql, masked, match.group(1), match.group(2))
+        match = _AMBIGUOUS.search(error)
+        if match:
+            return self._fix_ambiguous(sql, masked, match.group(1))
+        return None
+
+    def _fix_table_name(self, sql: str, masked: str, name: str) -> Optional[Tuple[str, str]]:
+        name = name.strip('"[]`')
+        table = self.tables.get(_normalize(name)) or self.tables.get(_normalize(name) + 's')
+        if table is None and _normalize(name).endswith('y'):
+            table = self.tables.get(_normalize(name)[:-1] + 'ies')
+        if table is None:
+            return None
+        spans = [m.span() for m in re.finditer(rf'(?<![\w.]){re.escape(name)}(?!\w)', masked, re.IGNORECASE)]
+        return _replace_spans(sql, spans, quote_table(table)), f"table {name} → {table}"
+
+    def _references(self, masked: str) -> Optional[Dict[str, str]]:
+        """alias (lowercase) → table for every FROM/JOIN reference; None for queries with subqueries"""
+        if re.search(r'\(\s*SELECT\b', masked, re.IGNORECASE) or len(re.findall(r'\bFROM\b', masked, re.IGNORECASE)) != 1:
+            return None
+        refs = {}
+        for name, alias in _TABLE_REF.findall(masked):
+            table = self.tables.get(_normalize(name.strip('"[]')))
+            if table is None:
+                return None
+            refs[(alias or name.strip('"[]')).lower()] = table
+        return refs
+
+    def _owner(self, column: str, refs: Dict[str, str]) -> Optional[str]:
+        """The table holding `column` that is nearest (fewest joins) to the query's tables"""
+        owners = [t for t, cols in self.columns.items() if column.lower() in cols]
+        present = [t for t in owners if t in refs.values()]
+        if present:
+            return present[0]
+        distances = {}
+        for table in owners:
+            path = self.linker.shortest_path(set(refs.values()), table)
+            if path is not None:
+                distances[table] = len(path)
+        if not distances:
+            return None
+        best = min(distances.values())
+        nearest = [t for t, d in distances.items() if d == best]
+        return nearest[0] if len(nearest) == 1 else None
+
+    def _fans_out(self, a: str, b: str) -> bool:
+        """Whether joining `b` onto `a` can repeat a's rows (b's join column is not its primary key)"""
+        _, col_b = self.linker.graph[a][b]
+        pks = [c['name'] for c in self.linker.schema[b] if c['pk']]
+        return pks != [col_b]
+
+    def _add_joins(self, sql: str, masked: str, refs: Dict[str, str], table: str,
+                   alias: Optional[str]) -> Optional[Tuple[str, str]]:
+        """
+        Join `table` (as `alias`) to the query along the foreign-key graph. Refuses
+        (None) when an aggregating query would gain a join to the many side of a
+        1:N edge: COUNT(*) FROM Orders joined to "Order Details" counts lines, not orders.
+        """
+        path = self.linker.shortest_path(set(refs.values()), table)
+        if path is None:
+            return None
+        if _AGGREGATE.search(masked) and any(self._fans_out(a, b) for a, b in zip(path, path[1:])):
+            return None
+        names = {table_: _alias_or_none(a, table_) for a, table_ in refs.items()}
+        used = set(refs)
+        joins = []
+        for a, b in zip(path, path[1:]):
+            if b == table and alias:
+                name = alias
+            else:
+                default = DEFAULT_ALIASES.get(b)
+                name = default if default and default not in used else None
+            if name and name.lower() in used:
+                return None
+            used.add((name or b).lower())
+            names[b] = name
+            col_a, col_b = self.linker.graph[a][b]
+            ref_a = names.get(a) or quote_table(a)
+            ref_b = name or quote_table(b)
+            joins.append(f"JOIN {quote_table(b)}{' ' + name if name else ''} ON {ref_a}.{col_a} = {ref_b}.{col_b}")
+
+        from_at = re.search(r'\bFROM\b', masked, re.IGNORECASE).end()
+        end = _FROM_END.search(masked, from_at)
+        position = end.start() if end else len(sql.rstrip().rstrip(';'))
+        head, tail = sql[:position].rstrip(), sql[position:]
+        sql = head + '\n' + '\n'.join(joins) + ('\n' + tail if tail.strip() else '')
+        return sql, ', '.join(joins)
+
+    def _fix_column(self, sql: str, masked: str, qualifier: Optional[str], column: str) -> Optional[Tuple[str, str]]:
+        refs = self._references(masked)
+        if not refs:
+            return None
+
+        if qualifier is None:
+            table = self._owner(column, refs)
+            if table is None or table in refs.values():
+                return None
+            alias = DEFAULT_ALIASES.get(table) if DEFAULT_ALIASES.get(table) not in refs else None
+            joined = self._add_joins(sql, masked, refs, table, alias)
+            if joined is None:
+                return None
+            sql, note = joined
+            spans = [m.span() for m in re.finditer(rf'(?<![\w."]){re.escape(column)}(?![\w"])(?!\s*\()',
+                                                   _mask_literals(sql), re.IGNORECASE)
+                     if not re.search(r'\bAS\s+$', _mask_literals(sql)[:m.start()], re.IGNORECASE)]
+            qualified = f"{alias or quote_table(table)}.{self.columns[table][column.lower()]}"
+            return _replace_spans(sql, spans, qualified), f"added {note} for {column}"
+
+        owner_of_qualifier = refs.get(qualifier.lower())
+        if owner_of_qualifier is None:
+            # Qualifier never defined: it names a table, a conventional alias, or an alias for the column's table
+            table = (self.tables.get(_normalize(qualifier))
+                     or next((t for t, a in DEFAULT_ALIASES.items() if a == qualifier.lower()), None)
+                     or self._owner(column, refs))
+            if table is None or column.lower() not in self.columns.get(table, {}):
+                return None
+            if table in refs.values():
+                ref = _ref(next(a for a, t in refs.items() if t == table), table)
+                spans = self._qualified_spans(masked, qualifier, column)
+                return _replace_spans(sql, spans, f"{ref}.{column}"), f"{qualifier}.{column} → {ref}.{column}"
+            alias = None if qualifier.lower() == table.lower() else qualifier
+            joined = self._add_joins(sql, masked, refs, table, alias)
+            return (joined[0], f"added {joined[1]}") if joined else None
+
+        # Alias exists but the column lives in another table (p.CategoryName)
+        if column.lower() in self.columns[owner_of_qualifier]:
+            return None
+        table = self._owner(column, refs)
+        if table is None:
+            return None
+        if table in refs.values():
+            alias = _ref(next(a for a, t in refs.items() if t == table), table)
+            note = f"{qualifier}.{column} → {alias}.{column}"
+        else:
+            alias = DEFAULT_ALIASES.get(table) if DEFAULT_ALIASES.get(table) not in refs else None
+            joined = self._add_joins(sql, masked, refs, table, alias)
+            if joined is None:
+                return None
+            sql, note = joined
+            alias = alias or quote_table(table)
+            note = f"added {note} for {qualifier}.{column}"
+        spans = self._qualified_spans(_mask_literals(sql), qualifier, column)
+        return _replace_spans(sql, spans, f"{alias}.{self.columns[table][column.lower()]}"), note
+
+    @staticmethod
+    def _qualified_spans(masked: str, qualifier: str, column: str) -> List[Tuple[int, int]]:
+        pattern = rf'(?<![\w"]){re.escape(qualifier)}\.{re.escape(column)}(?!\w)'
+        return [m.span() for m in re.finditer(pattern, masked, re.IGNORECASE)]
+
+    def _equated(self, masked: str, column: str) -> List[set]:
+        """Groups of references (lowercase aliases) whose `column` an ON clause sets equal"""
+        groups: List[set] = []
+        for clause in _ON_CLAUSE.finditer(masked):
+            for left, col_l, right, col_r in _EQUALITY.findall(clause.group(1)):
+                if col_l.lower() != column.lower() or col_r.lower() != column.lower():
+                    continue
+                pair = {left.strip('"[]').lower(), right.strip('"[]').lower()}
+                merged = [g for g in groups if g & pair]
+                groups = [g for g in groups if not g & pair] + [set().union(pair, *merged)]
+        return groups
+
+    def _fix_ambiguous(self, sql: str, masked: str, column: str) -> Optional[Tuple[str, str]]:
+        """
+        Qualify a bare column with the first FROM/JOIN table that has it, but only
+        when the ON clauses equate it across every such table (a join key). Any
+        other column (UnitPrice in Products and Order Details) is left to the LLM.
+        """
+        refs = self._references(masked)
+        if not refs:
+            return None
+        holders = [a for a, t in refs.items() if column.lower() in self.columns[t]]
+        if not holders:
+            return None
+        if len(holders) > 1 and not any(set(holders) <= group for group in self._equated(masked, column)):
+            return None
+        alias = holders[0]
+        table = refs[alias]
+        ref = _ref(alias, table)
+        spans = [m.span() for m in re.finditer(rf'(?<![\w."]){re.escape(column)}(?![\w"])(?!\s*\()', masked, re.IGNORECASE)
+                 if not re.search(r'\bAS\s+$', masked[:m.start()], re.IGNORECASE)]
+        if not spans:
+            return None
+        return _replace_spans(sql, spans, f"{ref}.{self.columns[table][column.lower()]}"), f"qualified {column} as {ref}.{column}"
@@ -1,10 +1,116 @@
 import sqlite3
 import re
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from typing import List, Dict, Any, Optional
 from functools import lru_cache
 
+from agent.tools.sql_cache import get_result_cache, db_fingerprint, is_cacheable
+from agent.tools.rollups import get_rollups
+from agent.tools.query_log import get_query_log
+from agent.tools.date_filters import rewrite_date_filters, has_date_key
+from agent.tools.query_guard import (
+    QueryTooExpensive, QUERY_TIMEOUT_S, MAX_RESULT_ROWS, preflight, deadline, fetch_capped
+)
+from agent.tools.result_set import ResultSet
+
 DB_PATH = "data/northwind.sqlite"
 
+# Connection pool tuning (agent only ever reads the database)
+POOL_MAX_SIZE = 8
+STATEMENT_CACHE_SIZE = 256          # prepared statements cached per connection
+READ_PRAGMAS = {
+    "mmap_size": 256 * 1024 * 1024,  # map the DB file instead of read() syscalls
+    "cache_size": -64000,            # negative = KiB, i.e. ~64MB page cache per connection
+    "temp_store": "MEMORY",          # sorts / GROUP BY temp b-trees stay in RAM
+    "query_only": "ON",              # belt and braces on top of mode=ro
+}
+
+
+# ==============================================================================
+# CONNECTION POOL - Reuse warm read-only connections across queries and threads
+# ==============================================================================
+
+class ConnectionPool:
+    """
+    Thread-safe pool of read-only SQLite connections.
+    
+    Connections are opened lazily (up to max_size) with a `mode=ro` URI and the
+    READ_PRAGMAS above, then reused so repeated queries skip connect cost and keep
+    a warm page cache. Callers block when all connections are checked out.
+    """
+    
+    def __init__(self, db_path: str, max_size: int = POOL_MAX_SIZE):
+        self.db_path = db_path
+        self.max_size = max_size
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+    
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            f"file:{self.db_path}?mode=ro",
+            uri=True,
+            check_same_thread=False,  # pool guarantees one thread at a time
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        for pragma, value in READ_PRAGMAS.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+    
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of the with-block"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._created < self.max_size
+                if can_open:
+                    self._created += 1
+            if can_open:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                conn = self._idle.get()
+        
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+    
+    def close_all(self):
+        """Close idle connections (checked-out ones are closed when returned and the pool is dropped)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the shared pool for DB_PATH, recreating it if DB_PATH was changed"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.db_path != DB_PATH:
+            if _pool is not None:
+                _pool.close_all()
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
 # ==============================================================================
 # SCHEMA RETRIEVAL - Critical Fix: Include ALL tables with proper names
 # ==============================================================================
@@ -24,10 +130,9 @@ def get_schema_info() -> Dict[str, List[Dict[str, str]]]:
             ]
         }
     """
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    try:
+    with get_pool().connection() as conn:
+        cursor = conn.cursor()
+        
         # Get ALL tables (not just views)
         cursor.execute("""
             SELECT name FROM sqlite_master 
@@ -54,38 +159,81 @@ def get_schema_info() -> Dict[str, List[Dict[str, str]]]:
             ]
         
         return schema
-        
-    finally:
-        conn.close()
 
 
-def get_schema_text() -> str:
+@lru_cache(maxsize=1)
+def get_foreign_keys() -> List[Dict[str, str]]:
+    """
+    Returns declared foreign keys as join edges.
+    
+    Returns:
+        List of {'table', 'column', 'ref_table', 'ref_column'} dicts
+    """
+    edges = []
+    with get_pool().connection() as conn:
+        for table in get_schema_info():
+            rows = conn.execute(f'PRAGMA foreign_key_list("{table}")').fetchall()
+            for row in rows:
+                # row: (id, seq, ref_table, from, to, on_update, on_delete, match)
+                edges.append({
+                    'table': table,
+                    'column': row[3],
+                    'ref_table': row[2],
+                    'ref_column': row[4] or row[3]
+                })
+    return edges
+
+
+def quote_table(table_name: str) -> str:
+    return f'"{table_name}"' if ' ' in table_name else table_name
+
+
+def get_schema_text(
+    tables: Optional[List[str]] = None,
+    columns: Optional[Dict[str, List[str]]] = None,
+    join_paths: Optional[List[str]] = None
+) -> str:
     """
     Returns schema formatted as human-readable text for LLM prompts.
     This is what should be passed to NL2SQL module.
+    
+    Args:
+        tables: Only describe these tables (default: all)
+        columns: Per-table column subset (default: all columns of each table)
+        join_paths: Join conditions to list under the tables
     """
     schema = get_schema_info()
     
     lines = ["=== NORTHWIND DATABASE SCHEMA ===\n"]
     
-    for table_name, columns in schema.items():
+    for table_name, table_columns in schema.items():
+        if tables is not None and table_name not in tables:
+            continue
+        keep = set(columns[table_name]) if columns and table_name in columns else None
+        
         # Quote table names with spaces
-        display_name = f'"{table_name}"' if ' ' in table_name else table_name
-        lines.append(f"Table: {display_name}")
+        lines.append(f"Table: {quote_table(table_name)}")
         
-        for col in columns:
+        for col in table_columns:
+            if keep is not None and col['name'] not in keep:
+                continue
             pk_marker = " [PRIMARY KEY]" if col['pk'] else ""
             notnull_marker = " [NOT NULL]" if col['notnull'] else ""
             lines.append(f"  - {col['name']} ({col['type']}){pk_marker}{notnull_marker}")
         
         lines.append("")  # Blank line between tables
     
+    if join_paths:
+        lines.append("=== JOIN PATHS ===")
+        lines.extend(f"• {path}" for path in join_paths)
+        lines.append("")
+    
     # Add critical notes
     lines.append("=== IMPORTANT NOTES ===")
     lines.append("• Table 'Order Details' MUST be quoted: \"Order Details\"")
     lines.append("• Use lowercase view aliases: orders, products, customers")
     lines.append("• Revenue calculation: SUM(UnitPrice * Quantity * (1 - Discount))")
-    lines.append("• Date filtering: WHERE DATE(OrderDate) BETWEEN 'YYYY-MM-DD' AND 'YYYY-MM-DD'")
+    lines.append("• Date filtering: WHERE o.OrderDate >= 'YYYY-MM-DD' AND o.OrderDate < 'YYYY-MM-DD' (day after the end date)")
     lines.append("• Join Products to Categories using: Products.CategoryID = Categories.CategoryID")
     
     return "\n".join(lines)
@@ -95,21 +243,58 @@ def get_schema_text() -> str:
 # SQL EXECUTION - Enhanced error handling and logging
 # ==============================================================================
 
-def execute_sql(query: str, verbose: bool = False) -> Dict[str, Any]:
+def _fetch_all(pool: ConnectionPool, query: str, timeout: Optional[float] = None,
+               max_rows: Optional[int] = None, check_plan: bool = False) -> ResultSet:
+    """
+    Run `query` on a pooled connection under the guardrails in query_guard.
+
+    Raises:
+        QueryTooExpensive: cartesian plan (check_plan), deadline hit or row cap exceeded
+    """
+    with pool.connection() as conn:
+        if check_plan:
+            preflight(conn, query)
+        cursor = conn.cursor()  # plain tuples; ResultSet holds the column names once
+        try:
+            with deadline(conn, timeout):
+                cursor.execute(query)
+                return ResultSet.from_cursor(cursor, fetch_capped(cursor, max_rows))
+        finally:
+            cursor.close()
+
+
+def _log_query(query: str, source: str, start: float, success: bool, row_count: int = 0):
+    query_log = get_query_log()
+    if query_log is not None:
+        query_log.record(query, source, (time.perf_counter() - start) * 1000, success, row_count)
+
+
+def execute_sql(query: str, verbose: bool = False, use_cache: bool = True,
+                timeout: Optional[float] = QUERY_TIMEOUT_S,
+                max_rows: Optional[int] = MAX_RESULT_ROWS) -> Dict[str, Any]:
     """
     Execute SQL query with robust error handling.
+    Successful results are served from / stored in the shared SQLResultCache.
+    KPI aggregates the rollup layer recognizes run against the daily rollups.
+    Every call is appended to the query log (see agent/tools/index_advisor.py).
+    Base-table queries are guarded: cartesian plans are refused up front, and
+    execution stops at `timeout` seconds or past `max_rows` rows.
     
     Args:
         query: SQL query string
         verbose: If True, print detailed execution info
+        use_cache: If False, always hit the database
+        timeout: Wall-clock limit in seconds (None = unlimited)
+        max_rows: Row cap (None = unlimited)
         
     Returns:
         Dict with keys:
         - success: bool
-        - rows: list of dicts (empty on failure)
+        - rows: ResultSet, used like a list of dicts (empty list on failure)
         - columns: list of column names
         - error: error message (None on success)
         - row_count: number of rows returned
+        - error_type / reason: "too_expensive" and the guardrail that fired, when one did
     """
     if not query or not isinstance(query, str):
         return {
@@ -131,34 +316,75 @@ def execute_sql(query: str, verbose: bool = False) -> Dict[str, Any]:
             "row_count": 0
         }
     
-    conn = None
+    start = time.perf_counter()
+    cache = get_result_cache() if use_cache and is_cacheable(query) else None
+    if cache is not None:
+        fingerprint = db_fingerprint(DB_PATH)
+        cached = cache.get(fingerprint, query)
+        if cached is not None:
+            if verbose:
+                print(f"   [SQL] Cache hit: {cached['row_count']} rows")
+            _log_query(query, 'cache', start, True, cached['row_count'])
+            return cached
+    
+    # Where the query ran ('rollup' or 'base') and, on the base path, the SQL that ran
+    source = 'base'
+    executed = query
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row  # Enable dict-like access
-        cursor = conn.cursor()
-        
         if verbose:
             print(f"   [SQL] Executing query:")
             print(f"   {query[:200]}..." if len(query) > 200 else f"   {query}")
         
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        
-        # Convert to list of dicts
-        result_rows = [dict(row) for row in rows]
-        columns = list(rows[0].keys()) if rows else []
+        rows = None
+        rollups = get_rollups(DB_PATH)
+        rollup_query = rollups.route(query) if rollups is not None else None
+        if rollup_query is not None:
+            try:
+                source = 'rollup'
+                rows = _fetch_all(rollups.pool, rollup_query, timeout, max_rows)
+                if verbose:
+                    print(f"   [SQL] Answered from rollups: {rollup_query}")
+            except sqlite3.Error as e:
+                source = 'base'
+                if verbose:
+                    print(f"   [SQL] Rollup query failed ({e}), using base tables")
+        if rows is None:
+            # Index-friendly day ranges instead of DATE()/strftime() on OrderDate
+            executed = rewrite_date_filters(query, date_key=has_date_key(DB_PATH, db_fingerprint(DB_PATH)))
+            if verbose and executed != query:
+                print(f"   [SQL] Date filters rewritten: {executed}")
+            rows = _fetch_all(get_pool(), executed, timeout, max_rows, check_plan=True)
         
         if verbose:
-            print(f"   [SQL] Success: {len(result_rows)} rows returned")
-            if result_rows:
-                print(f"   [SQL] Sample row: {result_rows[0]}")
+            print(f"   [SQL] Success: {len(rows)} rows returned")
+            if rows:
+                print(f"   [SQL] Sample row: {rows[0]}")
         
-        return {
+        result = {
             "success": True,
-            "rows": result_rows,
-            "columns": columns,
+            "rows": rows,
+            "columns": list(rows.columns),
             "error": None,
-            "row_count": len(result_rows)
+            "row_count": len(rows)
+        }
+        if cache is not None:
+            cache.put(fingerprint, query, result)
+        _log_query(executed if source == 'base' else query, source, start, True, len(rows))
+        return result
+    
+    except QueryTooExpensive as e:
+        if verbose:
+            print(f"   [SQL] Refused ({e.reason}): {e}")
+        _log_query(executed if source == 'base' else query, source, start, False)
+        
+        return {
+            "success": False,
+            "error": str(e),
+            "error_type": "too_expensive",
+            "reason": e.reason,
+            "rows": [],
+            "columns": [],
+            "row_count": 0
         }
         
     except sqlite3.Error as e:
@@ -170,6 +396,7 @@ def execute_sql(query: str, verbose: bool = False) -> Dict[str, Any]:
         # Enhanced error messages with hints
         hints = _get_error_hints(error_msg, query)
         full_error = f"{error_msg}{hints}"
+        _log_query(executed if source == 'base' else query, source, start, False)
         
         return {
             "success": False,
@@ -180,6 +407,7 @@ def execute_sql(query: str, verbose: bool = False) -> Dict[str, Any]:
         }
         
     except Exception as e:
+        _log_query(executed if source == 'base' else query, source, start, False)
         return {
             "success": False,
             "error": f"Unexpected error: {str(e)}",
@@ -187,10 +415,6 @@ def execute_sql(query: str, verbose: bool = False) -> Dict[str, Any]:
             "columns": [],
             "row_count": 0
         }
-        
-    finally:
-        if conn:
-            conn.close()
 
 
 def _get_error_hints(error_msg: str, query: str) -> str:
@@ -237,7 +461,7 @@ def _get_error_hints(error_msg: str, query: str) -> str:
     elif "syntax error" in error_msg.lower():
         if "BETWEDIR" in query or "BETWELOG" in query:
             hints.append("\n  → Typo in BETWEEN clause")
-            hints.append("  → Correct: WHERE DATE(col) BETWEEN 'date1' AND 'date2'")
+            hints.append("  → Correct: WHERE o.OrderDate >= 'start' AND o.OrderDate < 'day after end'")
     
     # Ambiguous column
     elif "ambiguous" in error_msg.lower():
@@ -281,12 +505,14 @@ def extract_tables_from_sql(sql: str) -> List[str]:
     )
     
     for match in pattern1.finditer(sql):
-        table = match.group(1) or match.group(2) or match.group(3) or match.group(4)
-        if table:
-            # Remove any trailing aliases (e.g., "Orders o" -> "Orders")
-            table = table.split()[0].strip().strip(',;')
-            if table and not _is_sql_keyword(table):
-                tables.add(table)
+        quoted = match.group(1) or match.group(2) or match.group(3)
+        if quoted:
+            # Quoted names may contain spaces ("Order Details") and are never keywords
+            tables.add(quoted.strip())
+            continue
+        table = (match.group(4) or '').strip(',;')
+        if table and not _is_sql_keyword(table):
+            tables.add(table)
     
     return sorted(list(tables))
 
@@ -316,31 +542,31 @@ def verify_database_setup() -> Dict[str, Any]:
         Dict with status and diagnostics
     """
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Check for key tables
-        cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' 
-            ORDER BY name
-        """)
-        tables = [row[0] for row in cursor.fetchall()]
+        with get_pool().connection() as conn:
+            cursor = conn.cursor()
+            
+            # Check for key tables
+            cursor.execute("""
+                SELECT name FROM sqlite_master 
+                WHERE type='table' 
+                ORDER BY name
+            """)
+            tables = [row[0] for row in cursor.fetchall()]
         
-        # Expected core tables
-        expected = ['Orders', 'Order Details', 'Products', 'Customers', 'Categories']
-        missing = [t for t in expected if t not in tables]
+            # Expected core tables
+            expected = ['Orders', 'Order Details', 'Products', 'Customers', 'Categories']
+            missing = [t for t in expected if t not in tables]
         
-        # Check if views exist
-        cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='view'
-        """)
-        views = [row[0] for row in cursor.fetchall()]
+            # Check if views exist
+            cursor.execute("""
+                SELECT name FROM sqlite_master 
+                WHERE type='view'
+            """)
+            views = [row[0] for row in cursor.fetchall()]
         
-        # Sample row count
-        cursor.execute("SELECT COUNT(*) FROM Orders")
-        order_count = cursor.fetchone()[0]
+            # Sample row count
+            cursor.execute("SELECT COUNT(*) FROM Orders")
+            order_count = cursor.fetchone()[0]
         
         status = {
             "success": len(missing) == 0,
@@ -351,7 +577,6 @@ def verify_database_setup() -> Dict[str, Any]:
             "database_path": DB_PATH
         }
         
-        conn.close()
         return status
         
     except Exception as e:
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Benchmark: thread-per-question HybridAgent.run vs HybridAgent.arun on one event loop.
+
+The LM is a stand-in server with a fixed latency and `--server-slots` parallel
+slots (like OLLAMA_NUM_PARALLEL); requests beyond that queue inside it. Both
+modes answer the same questions with the same number in flight; the report
+shows wall time, how busy the server was kept, and how many threads it took.
+
+Usage (from the repo root):
+    python benchmarks/bench_async_agent.py --questions 64 --in-flight 32 --latency-ms 100
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import click
+import dspy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.async_limits import configure_async_limits
+from agent.graph_hybrid import HybridAgent
+from agent.tools.query_log import configure_query_log
+
+SAMPLE_QUESTIONS = "sample_questions_hybrid_eval.jsonl"
+
+
+class StandInLM(dspy.BaseLM):
+    """Answers every signature with fixed fields after `latency` seconds, `slots` requests at a time"""
+
+    def __init__(self, latency: float, slots: int):
+        super().__init__(model='stand-in', cache=False)
+        self.latency = latency
+        self.slots = slots
+        self._thread_slots = threading.BoundedSemaphore(slots)
+        self._loop_slots = None
+        self.busy_s = 0.0
+        self.requests = 0
+
+    def _response(self, messages):
+        fields = messages[0]['content']
+        if '`sql`' in fields:
+            text = "[[ ## sql ## ]]\nSELECT COUNT(*) AS n FROM Orders"
+        elif '`route`' in fields:
+            text = "[[ ## reasoning ## ]]\nstand-in\n\n[[ ## route ## ]]\nsql"
+        else:
+            text = "[[ ## answer ## ]]\n1\n\n[[ ## explanation ## ]]\nstand-in\n\n[[ ## confidence ## ]]\n0.9"
+        message = SimpleNamespace(content=text + "\n\n[[ ## completed ## ]]")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage={}, model=self.model)
+
+    def forward(self, prompt=None, messages=None, **kwargs):
+        with self._thread_slots:
+            time.sleep(self.latency)
+            self.busy_s += self.latency
+            self.requests += 1
+        return self._response(messages)
+
+    async def aforward(self, prompt=None, messages=None, **kwargs):
+        if self._loop_slots is None:
+            self._loop_slots = asyncio.Semaphore(self.slots)
+        async with self._loop_slots:
+            await asyncio.sleep(self.latency)
+            self.busy_s += self.latency
+            self.requests += 1
+        return self._response(messages)
+
+
+class ThreadSampler:
+    """Peak threading.active_count() while the block runs"""
+
+    def __enter__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(0.005):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak -= 1  # the sampler itself
+
+
+def _questions(n):
+    with open(SAMPLE_QUESTIONS) as f:
+        sample = [json.loads(line) for line in f if line.strip()]
+    return [sample[i % len(sample)] for i in range(n)]
+
+
+def _run_threads(agent, questions, in_flight):
+    with ThreadPoolExecutor(max_workers=in_flight) as pool:
+        return list(pool.map(lambda q: agent.run(q['question'], q['format_hint']), questions))
+
+
+async def _run_async(agent, questions, in_flight):
+    window = asyncio.Semaphore(in_flight)
+
+    async def answer(q):
+        async with window:
+            return await agent.arun(q['question'], q['format_hint'])
+
+    return await asyncio.gather(*(answer(q) for q in questions))
+
+
+@click.command()
+@click.option('--questions', default=64, show_default=True, help='Questions answered per mode')
+@click.option('--in-flight', default=32, show_default=True, help='Questions in flight at once')
+@click.option('--latency-ms', default=100, show_default=True, help='Stand-in LM latency per request')
+@click.option('--server-slots', default=4, show_default=True, help='Requests the stand-in LM serves in parallel')
+def main(questions, in_flight, latency_ms, server_slots):
+    configure_query_log(None)
+    configure_async_limits(max_lm_requests=server_slots)
+    batch = _questions(questions)
+
+    print(f"{questions} questions, {in_flight} in flight, LM {latency_ms} ms x {server_slots} slots\n")
+    print(f"{'':<10}{'wall s':>8}{'q/s':>8}{'LM calls':>10}{'LM busy':>9}{'threads':>9}")
+    answers = {}
+    for mode in ('threads', 'async'):
+        lm = StandInLM(latency_ms / 1000, server_slots)
+        dspy.configure(lm=lm)
+        agent = HybridAgent(enable_logging=False, answer_cache_threshold=None)
+        agent.run(batch[0]['question'], batch[0]['format_hint'])  # warm the rollups, pool and caches
+        lm.busy_s, lm.requests = 0.0, 0
+        with ThreadSampler() as threads:
+            start = time.perf_counter()
+            if mode == 'threads':
+                states = _run_threads(agent, batch, in_flight)
+            else:
+                states = asyncio.run(_run_async(agent, batch, in_flight))
+            wall = time.perf_counter() - start
+        answers[mode] = [state['final_answer'] for state in states]
+        busy = lm.busy_s / (wall * server_slots)
+        print(f"{mode:<10}{wall:>8.2f}{questions / wall:>8.1f}{lm.requests:>10}{busy:>9.0%}{threads.peak:>9}")
+
+    assert answers['threads'] == answers['async'], "run() and arun() answers differ"
+
+
+if __name__ == '__main__':
+    main()
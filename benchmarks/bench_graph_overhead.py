@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-question LangGraph overhead.
+
+Compares the old behaviour (build + compile the graph on every question and
+walk every node regardless of route) against the compiled graph cached on
+HybridAgent with route-specific edges.
+
+LM modules are replaced by stubs so only graph overhead is measured.
+
+Usage (from the repo root):
+    python benchmarks/bench_graph_overhead.py --iterations 200
+"""
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import click
+from langgraph.graph import StateGraph, END
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.graph_hybrid import AgentState, HybridAgent
+
+
+def _stub_agent(route: str) -> HybridAgent:
+    agent = HybridAgent(enable_logging=False, answer_cache_threshold=None)
+    agent.router = lambda question: route
+    agent.nl2sql = lambda *args, **kwargs: SimpleNamespace(sql="SELECT 1 AS value")
+    agent.synthesizer = lambda *args, **kwargs: SimpleNamespace(
+        answer="1", explanation="stub", confidence="1.0"
+    )
+    return agent
+
+
+def _build_legacy_graph(agent: HybridAgent):
+    """Original wiring: retriever always flows into planner → nl2sql → executor."""
+    def passthrough(node):
+        def wrapped(state):
+            if node in ('planner', 'nl2sql') and state['route'] == 'rag':
+                return {**state}
+            return getattr(agent, f"{node}_node")(state)
+        return wrapped
+
+    workflow = StateGraph(AgentState)
+    for node in ['router', 'retriever', 'planner', 'nl2sql', 'executor', 'repair', 'synthesizer']:
+        workflow.add_node(node, passthrough(node))
+
+    workflow.set_entry_point("router")
+    workflow.add_conditional_edges("router", lambda state: 'retriever' if state['route'] in ('rag', 'hybrid') else 'planner',
+                                   {'retriever': 'retriever', 'planner': 'planner'})
+    workflow.add_edge("retriever", "planner")
+    workflow.add_edge("planner", "nl2sql")
+    workflow.add_edge("nl2sql", "executor")
+    workflow.add_conditional_edges("executor", agent.should_repair, {'repair': 'repair', 'synthesize': 'synthesizer'})
+    workflow.add_edge("repair", "nl2sql")
+    workflow.add_edge("synthesizer", END)
+    return workflow.compile()
+
+
+def _initial_state(question: str, format_hint: str) -> AgentState:
+    return {
+        'question': question,
+        'format_hint': format_hint,
+        'route': '',
+        'retrieved_chunks': [],
+        'constraints': {},
+        'sql_query': '',
+        'sql_results': {},
+        'sql_error': None,
+        'final_answer': None,
+        'explanation': '',
+        'confidence': 0.0,
+        'citations': [],
+        'repair_count': 0,
+        'max_repairs': 2,
+        'sql_source': '',
+        'started_at': time.perf_counter(),
+        'node_timings': []
+    }
+
+
+def _time_per_question(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+@click.command()
+@click.option('--iterations', default=200, show_default=True, help='Questions per measurement')
+def main(iterations):
+    question = "According to the product policy, what is the return window for unopened Beverages?"
+
+    print(f"{'route':<8} {'before (ms/q)':>14} {'after (ms/q)':>14} {'speedup':>9}")
+    for route in ['rag', 'sql', 'hybrid']:
+        agent = _stub_agent(route)
+
+        def before():
+            _build_legacy_graph(agent).invoke(_initial_state(question, 'int'))
+
+        def after():
+            agent.run(question, 'int')
+
+        before_ms = _time_per_question(before, iterations)
+        after_ms = _time_per_question(after, iterations)
+        print(f"{route:<8} {before_ms:>14.3f} {after_ms:>14.3f} {before_ms / after_ms:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: list-of-dicts query results vs the columnar ResultSet.
+
+Fetches the same rows both ways and reports fetch time and the memory the
+result holds (tracemalloc), plus the cost of the SQL cache JSON round-trip.
+
+Usage (from the repo root):
+    python benchmarks/bench_result_set.py --limit 50000 --repeat 5
+"""
+import json
+import os
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.tools import sqlite_tool
+from agent.tools.result_set import ResultSet, json_default, json_object_hook
+
+
+def _dict_rows(conn, sql):
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    return [dict(row) for row in cursor.execute(sql).fetchall()]
+
+
+def _result_set(conn, sql):
+    cursor = conn.cursor()
+    return ResultSet.from_cursor(cursor.execute(sql), cursor.fetchall())
+
+
+def _measure(fetch, conn, sql, repeat):
+    fetch(conn, sql)  # warm the page cache
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fetch(conn, sql)
+    ms = (time.perf_counter() - start) / repeat * 1000
+    tracemalloc.start()
+    result = fetch(conn, sql)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, ms, held
+
+
+def _round_trip_ms(rows, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        json.loads(json.dumps({'rows': rows}, default=json_default), object_hook=json_object_hook)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+@click.command()
+@click.option('--limit', default=50_000, show_default=True, help='Rows to fetch from "Order Details" x Orders')
+@click.option('--repeat', default=5, show_default=True, help='Timed runs per variant')
+def main(limit, repeat):
+    sql = f"""
+        SELECT od.OrderID, od.ProductID, od.UnitPrice, od.Quantity, od.Discount, o.CustomerID, o.OrderDate
+        FROM "Order Details" od JOIN Orders o ON od.OrderID = o.OrderID LIMIT {limit}"""
+    conn = sqlite3.connect(f"file:{os.path.abspath(sqlite_tool.DB_PATH)}?mode=ro", uri=True)
+
+    dicts, dict_ms, dict_bytes = _measure(_dict_rows, conn, sql, repeat)
+    columnar, col_ms, col_bytes = _measure(_result_set, conn, sql, repeat)
+    assert columnar == dicts, "ResultSet rows differ from dict rows"
+
+    print(f"{len(dicts):,} rows x {len(columnar.columns)} columns\n")
+    print(f"{'':<14}{'fetch ms':>10}{'held MiB':>10}{'cache json ms':>15}")
+    print(f"{'list[dict]':<14}{dict_ms:>10.1f}{dict_bytes / 2**20:>10.1f}{_round_trip_ms(dicts, repeat):>15.1f}")
+    print(f"{'ResultSet':<14}{col_ms:>10.1f}{col_bytes / 2**20:>10.1f}{_round_trip_ms(columnar, repeat):>15.1f}")
+    print(f"\nmemory: {dict_bytes / max(col_bytes, 1):.1f}x smaller, fetch: {dict_ms / max(col_ms, 1e-9):.1f}x faster")
+
+
+if __name__ == '__main__':
+    main()
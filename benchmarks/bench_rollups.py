@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: KPI aggregates on the base tables vs the daily rollups.
+
+Builds (or reuses) the rollup file, then times each query below on the
+Northwind tables and in its rewritten rollup form, checking both return the
+same rows.
+
+Usage (from the repo root):
+    python benchmarks/bench_rollups.py --repeat 50
+"""
+import os
+import sys
+import time
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.tools import sqlite_tool
+from agent.tools.rollups import get_rollups, rewrite_query
+
+QUERIES = {
+    'revenue, one month': """
+        SELECT SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS revenue
+        FROM "Order Details" od JOIN Orders o ON od.OrderID = o.OrderID
+        WHERE o.OrderDate >= '1997-06-01' AND o.OrderDate < '1997-07-01'""",
+    'quantity by category, one year': """
+        SELECT c.CategoryName AS category, SUM(od.Quantity) AS quantity
+        FROM "Order Details" od JOIN Orders o ON od.OrderID = o.OrderID
+        JOIN Products p ON od.ProductID = p.ProductID JOIN Categories c ON p.CategoryID = c.CategoryID
+        WHERE DATE(o.OrderDate) BETWEEN '1997-01-01' AND '1997-12-31'
+        GROUP BY c.CategoryName ORDER BY quantity DESC""",
+    'AOV by customer, all time': """
+        SELECT cu.CompanyName AS customer,
+               SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) / COUNT(DISTINCT od.OrderID) AS aov
+        FROM "Order Details" od JOIN Orders o ON od.OrderID = o.OrderID
+        JOIN Customers cu ON o.CustomerID = cu.CustomerID
+        GROUP BY cu.CompanyName ORDER BY aov DESC LIMIT 10""",
+    'top products by revenue, all time': """
+        SELECT p.ProductName AS product, SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS revenue
+        FROM "Order Details" od JOIN Products p ON od.ProductID = p.ProductID
+        GROUP BY p.ProductName ORDER BY revenue DESC LIMIT 3""",
+}
+
+
+def _time(pool, sql, repeat):
+    rows = sqlite_tool._fetch_all(pool, sql).tuples()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        sqlite_tool._fetch_all(pool, sql)
+    return rows, (time.perf_counter() - start) / repeat * 1000
+
+
+def _same(a, b):
+    return len(a) == len(b) and all(
+        all(abs(x - y) <= 1e-6 * max(1.0, abs(x)) if isinstance(x, float) else x == y for x, y in zip(r1, r2))
+        for r1, r2 in zip(a, b)
+    )
+
+
+@click.command()
+@click.option('--repeat', default=50, show_default=True, help='Timed runs per query')
+def main(repeat):
+    store = get_rollups(sqlite_tool.DB_PATH)
+    start = time.perf_counter()
+    store.ensure()
+    print(f"rollups ready in {(time.perf_counter() - start) * 1000:.0f} ms ({store.path})\n")
+
+    for name, sql in QUERIES.items():
+        rewritten = rewrite_query(sql)
+        base_rows, base_ms = _time(sqlite_tool.get_pool(), sql, repeat)
+        if rewritten is None:
+            print(f"{name:36s} base {base_ms:8.2f} ms   (not rewritable)")
+            continue
+        rollup_rows, rollup_ms = _time(store.pool, rewritten, repeat)
+        check = 'same rows' if _same(base_rows, rollup_rows) else 'MISMATCH'
+        print(f"{name:36s} base {base_ms:8.2f} ms   rollup {rollup_ms:7.2f} ms   "
+              f"x{base_ms / max(rollup_ms, 1e-9):5.1f}   {check}")
+
+
+if __name__ == '__main__':
+    main()
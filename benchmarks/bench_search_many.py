@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: DocumentRetriever.search_many vs a loop of search calls.
+
+Uses the repo's docs/ (TF-IDF mode) and synthetic queries built from the
+indexed vocabulary, and checks both paths return identical results.
+
+Usage (from the repo root):
+    python benchmarks/bench_search_many.py --queries 5000
+"""
+import os
+import random
+import sys
+import time
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.rag.retrieval import DocumentRetriever
+
+
+@click.command()
+@click.option('--queries', default=5000, show_default=True, help='Number of queries')
+@click.option('--top-k', default=3, show_default=True)
+def main(queries, top_k):
+    retriever = DocumentRetriever()
+    vocabulary = list(retriever.vectorizer.vocabulary_)
+    rng = random.Random(0)
+    batch = [' '.join(rng.sample(vocabulary, 4)) for _ in range(queries)]
+
+    start = time.perf_counter()
+    looped = [retriever.search(q, top_k) for q in batch]
+    loop_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = retriever.search_many(batch, top_k)
+    batch_s = time.perf_counter() - start
+
+    print(f"queries: {queries}, chunks: {len(retriever.chunks)}")
+    print(f"search loop:  {loop_s * 1000:9.1f} ms")
+    print(f"search_many:  {batch_s * 1000:9.1f} ms  ({loop_s / batch_s:.1f}x)")
+    print(f"identical:    {looped == batched}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Check: cold start to first-question-ready stays within a time budget.
+
+Each run starts a fresh interpreter that imports the entry module and builds a
+HybridAgent (see agent/startup_profile.py). The median of --runs is compared
+with --budget-ms; the script exits 1 when it is over, or when one of the heavy
+packages (dspy, scikit-learn, ...) is imported before the first question, so it
+can gate CI.
+
+Usage (from the repo root):
+    python benchmarks/check_startup_budget.py --runs 5 --budget-ms 2000
+"""
+import os
+import statistics
+import sys
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent.startup_profile import profile_startup, format_report
+
+STARTUP_BUDGET_MS = 2000  # measured ~0.9 s; was ~6 s with dspy and scikit-learn imported eagerly
+
+
+@click.command()
+@click.option('--entry', default='run_agent_hybrid', show_default=True,
+              type=click.Choice(['run_agent_hybrid', 'serve_agent']), help='Entry point whose cold start is timed')
+@click.option('--runs', default=5, show_default=True, type=click.IntRange(min=1), help='Fresh processes timed')
+@click.option('--budget-ms', default=STARTUP_BUDGET_MS, show_default=True, type=click.FloatRange(min=0),
+              help='Largest acceptable median time to first-question-ready')
+def main(entry, runs, budget_ms):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # The first run may rebuild the retrieval index or rollups; it is reported but not timed
+    first = profile_startup(entry, cwd=root)
+    print(format_report(first), end='\n\n')
+
+    timings = []
+    for i in range(runs):
+        profile = profile_startup(entry, cwd=root, importtime=False)
+        timings.append(profile['ready_ms'])
+        print(f"run {i + 1}: import {profile['import_ms']:.0f} ms + init {profile['init_ms']:.0f} ms"
+              f" = {profile['ready_ms']:.0f} ms")
+
+    median = statistics.median(timings)
+    failures = []
+    if median > budget_ms:
+        failures.append(f"median {median:.0f} ms exceeds the {budget_ms:.0f} ms budget")
+    if first['loaded']:
+        failures.append(f"heavy packages imported before the first question: {', '.join(first['loaded'])}")
+
+    if failures:
+        for failure in failures:
+            print(f"✗ {failure}")
+        sys.exit(1)
+    print(f"✓ median {median:.0f} ms to first-question-ready (budget {budget_ms:.0f} ms)")
+
+
+if __name__ == '__main__':
+    main()
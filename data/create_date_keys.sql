@@ -0,0 +1,8 @@
+-- Normalized calendar-day key for Orders, applied by `python -m agent.tools.date_filters`.
+-- OrderDate holds 'YYYY-MM-DD HH:MM:SS'; OrderDay is its DATE() as a virtual generated
+-- column (always in sync, no triggers) with an index, so day/month/year filters become
+-- index range scans. execute_sql rewrites DATE()/strftime() filters onto it.
+
+ALTER TABLE Orders ADD COLUMN OrderDay TEXT GENERATED ALWAYS AS (DATE(OrderDate)) VIRTUAL;
+
+CREATE INDEX IF NOT EXISTS idx_orders_orderday ON Orders(OrderDay);
@@ -0,0 +1,58 @@
+-- Daily KPI rollups (see docs/kpi_definitions.md), built by agent/tools/rollups.py.
+-- Runs against the rollup database with the Northwind DB attached read-only as `base`.
+--
+-- Each rollup keeps the join semantics of the base query it replaces:
+-- tables a query may leave out are LEFT JOINed, so their columns are NULL for
+-- rows the inner join would drop and the rewrite adds `IS NOT NULL` instead.
+-- `orders` is COUNT(DISTINCT OrderID) per group; an order has a single date, so
+-- it stays additive across days within a group (AOV = SUM(revenue) / SUM(orders)).
+
+CREATE TABLE rollup_daily AS
+SELECT DATE(o.OrderDate) AS day,
+       SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS revenue,
+       SUM(od.Quantity) AS quantity,
+       COUNT(DISTINCT od.OrderID) AS orders
+FROM base."Order Details" od
+LEFT JOIN base.Orders o ON od.OrderID = o.OrderID
+GROUP BY DATE(o.OrderDate);
+
+CREATE TABLE rollup_daily_category AS
+SELECT DATE(o.OrderDate) AS day,
+       c.CategoryName AS category,
+       SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS revenue,
+       SUM(od.Quantity) AS quantity,
+       COUNT(DISTINCT od.OrderID) AS orders
+FROM base."Order Details" od
+JOIN base.Products p ON od.ProductID = p.ProductID
+JOIN base.Categories c ON p.CategoryID = c.CategoryID
+LEFT JOIN base.Orders o ON od.OrderID = o.OrderID
+GROUP BY DATE(o.OrderDate), c.CategoryName;
+
+CREATE TABLE rollup_daily_product AS
+SELECT DATE(o.OrderDate) AS day,
+       p.ProductName AS product,
+       c.CategoryName AS category,
+       SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS revenue,
+       SUM(od.Quantity) AS quantity,
+       COUNT(DISTINCT od.OrderID) AS orders
+FROM base."Order Details" od
+JOIN base.Products p ON od.ProductID = p.ProductID
+LEFT JOIN base.Categories c ON p.CategoryID = c.CategoryID
+LEFT JOIN base.Orders o ON od.OrderID = o.OrderID
+GROUP BY DATE(o.OrderDate), p.ProductName, c.CategoryName;
+
+CREATE TABLE rollup_daily_customer AS
+SELECT DATE(o.OrderDate) AS day,
+       cu.CompanyName AS customer,
+       SUM(od.UnitPrice * od.Quantity * (1 - od.Discount)) AS revenue,
+       SUM(od.Quantity) AS quantity,
+       COUNT(DISTINCT od.OrderID) AS orders
+FROM base."Order Details" od
+JOIN base.Orders o ON od.OrderID = o.OrderID
+JOIN base.Customers cu ON o.CustomerID = cu.CustomerID
+GROUP BY DATE(o.OrderDate), cu.CompanyName;
+
+CREATE INDEX idx_rollup_daily_day ON rollup_daily(day);
+CREATE INDEX idx_rollup_daily_category_day ON rollup_daily_category(day, category);
+CREATE INDEX idx_rollup_daily_product_day ON rollup_daily_product(day, product);
+CREATE INDEX idx_rollup_daily_customer_day ON rollup_daily_customer(day, customer);
@@ -1,42 +1,375 @@
 #!/usr/bin/env python3
+import asyncio
 import json
+import os
+import sys
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import click
 from rich.console import Console
-from rich.progress import track
-import dspy
+from rich.progress import Progress
 
+from agent.async_limits import configure_async_limits, get_async_limits, MAX_LM_REQUESTS
 from agent.graph_hybrid import HybridAgent
+from agent.lm_setup import configure_lm
+from agent.tools.sql_cache import configure_result_cache, get_result_cache
+from agent.tools.rollups import configure_rollups, get_rollups, ROLLUP_PATH
+from agent.tools.query_log import configure_query_log, DEFAULT_LOG_PATH
+from agent.tools import sqlite_tool
 
 console = Console()
 
-def setup_dspy():
-    """Configure DSPy with local Ollama model"""
+# LM completion cache (DSPy's content-addressed cache: key = model + rendered prompt + call kwargs)
+LM_CACHE_DIR = ".cache/lm"
+LM_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+def setup_dspy(use_cache: bool = True, cache_dir: str = LM_CACHE_DIR, cache_max_bytes: int = LM_CACHE_MAX_BYTES):
+    """Configure DSPy with local Ollama model (dspy is imported on the first LM call)"""
+    configure_lm(
+        model='ollama/qwen3:4b-instruct',
+        api_base='http://localhost:11434',
+        use_cache=use_cache,
+        cache_dir=cache_dir,
+        cache_max_bytes=cache_max_bytes,
+        on_error=report_dspy_failure,
+    )
+    
+    console.print("   ✓ DSPy configured (loaded on first LM call)")
+
+def report_dspy_failure(e: Exception):
+    """Printed once, when the first LM call can't set DSPy up; the question itself fails as usual"""
+    console.print(f"[bold red]✗ DSPy configuration failed: {e}[/bold red]")
+    console.print("\n[yellow]Troubleshooting:[/yellow]")
+    console.print("1. Ensure Ollama is running: ollama serve")
+    console.print("2. Check model is pulled: ollama list")
+    console.print("3. Pull if needed: ollama pull phi3.5:3.8b-mini-instruct-q4_K_M")
+
+def run_question(agent, q):
+    """
+    Run the agent on one question and format the output record.
+    Errors are caught per question so one failure never aborts the batch.
+
+    Returns:
+        (output, error) - error is None on success
+    """
     try:
-        # DSPy 2.4+ recommended format
-        lm = dspy.LM(
-            model='ollama/qwen3:4b-instruct',
-            api_base='http://localhost:11434',
-            api_key='',  # Not needed for Ollama but required param
+        result = agent.run(
+            question=q['question'],
+            format_hint=q['format_hint'],
+            max_repairs=2
         )
-        dspy.configure(lm=lm)
+        return format_output(q, result), None
         
-        console.print("   ✓ DSPy configured successfully")
+    except Exception as e:
+        return error_output(q, e), e
+
+
+async def arun_question(agent, q):
+    """run_question() on the event loop (HybridAgent.arun)"""
+    try:
+        result = await agent.arun(
+            question=q['question'],
+            format_hint=q['format_hint'],
+            max_repairs=2
+        )
+        return format_output(q, result), None
         
     except Exception as e:
-        console.print(f"[bold red]✗ DSPy configuration failed: {e}[/bold red]")
-        console.print("\n[yellow]Troubleshooting:[/yellow]")
-        console.print("1. Ensure Ollama is running: ollama serve")
-        console.print("2. Check model is pulled: ollama list")
-        console.print("3. Pull if needed: ollama pull phi3.5:3.8b-mini-instruct-q4_K_M")
-        raise
+        return error_output(q, e), e
+
+
+def format_output(q, result):
+    return {
+        'id': q['id'],
+        'final_answer': result['final_answer'],
+        'sql': result.get('sql_query', ''),
+        'confidence': result['confidence'],
+        'explanation': result['explanation'],
+        'citations': result['citations']
+    }
+
+
+def error_output(q, e):
+    return {
+        'id': q['id'],
+        'final_answer': None,
+        'sql': '',
+        'confidence': 0.0,
+        'explanation': f"Error: {str(e)}",
+        'citations': []
+    }
+
+
+def run_question_captured(agent, q):
+    """Worker entry point for concurrent runs: buffers the agent log for this question."""
+    with agent.capture_logs() as log_lines:
+        output, error = run_question(agent, q)
+    return output, error, log_lines
+
+
+async def arun_question_captured(agent, q):
+    """Task entry point for async runs: buffers the agent log for this question."""
+    with agent.capture_logs() as log_lines:
+        output, error = await arun_question(agent, q)
+    return output, error, log_lines
+
+
+def print_question_header(q):
+    console.print(f"\n{'='*80}")
+    console.print(f"[bold]Question ID:[/bold] {q['id']}")
+    console.print(f"[bold]Question:[/bold] {q['question']}")
+    console.print(f"[bold]Format:[/bold] {q['format_hint']}\n")
+
+
+def print_captured(q, output, error, log_lines, duplicate):
+    """Print a finished concurrent question as one block"""
+    print_question_header(q)
+    if duplicate:
+        console.print("[dim]↺ Duplicate question, reusing earlier result[/dim]")
+    else:
+        for line in log_lines:
+            console.print(line, markup=False, highlight=False)
+    print_question_result(output, error)
+
+
+def print_question_result(output, error):
+    if error is None:
+        console.print(f"\n[bold green]✓ Success[/bold green]")
+        console.print(f"Answer: {output['final_answer']}")
+        console.print(f"Confidence: {output['confidence']:.2f}")
+    else:
+        console.print(f"\n[bold red]✗ Error:[/bold red] {str(error)}")
+
+
+# Completed results kept for in-batch dedupe of identical (question, format_hint) pairs.
+# Bounded so memory stays flat on arbitrarily large inputs.
+DEDUPE_CACHE_SIZE = 10_000
+
+
+def iter_questions(batch, skip_ids=frozenset()):
+    """Yield questions one line at a time so memory doesn't grow with the input file"""
+    with open(batch, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            q = json.loads(line)
+            if q['id'] not in skip_ids:
+                yield q
+
+
+def count_questions(batch, skip_ids=frozenset()):
+    """Cheap streaming pass so the progress bar has a total"""
+    return sum(1 for _ in iter_questions(batch, skip_ids))
+
+
+def load_completed_ids(out):
+    """
+    Collect ids already written to `out` (for --resume).
+    A trailing partial line left by a crash mid-write is truncated so appends stay valid JSONL.
+    """
+    completed = set()
+    if not os.path.exists(out):
+        return completed
+    
+    offset = 0
+    with open(out, 'rb+') as f:
+        for line in f:
+            if not line.endswith(b'\n'):
+                f.truncate(offset)
+                break
+            offset += len(line)
+            try:
+                completed.add(json.loads(line)['id'])
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return completed
+
+
+def write_result(f, output):
+    """Append one result and flush so a crash never loses finished questions"""
+    f.write(json.dumps(output) + '\n')
+    f.flush()
+
+
+def remember(cache, key, value):
+    cache[key] = value
+    cache.move_to_end(key)
+    if len(cache) > DEDUPE_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def run_sequential(agent, questions, out_file, progress, task):
+    dedupe = OrderedDict()
+    for q in questions:
+        print_question_header(q)
+        key = (q['question'], q['format_hint'])
+        if key in dedupe:
+            output, error = dedupe[key]
+            dedupe.move_to_end(key)
+            console.print("[dim]↺ Duplicate question, reusing earlier result[/dim]")
+        else:
+            output, error = run_question(agent, q)
+            remember(dedupe, key, (output, error))
+        print_question_result(output, error)
+        write_result(out_file, {**output, 'id': q['id']})
+        progress.advance(task)
+
+
+def run_concurrent(agent, questions, out_file, progress, task, concurrency):
+    """
+    Run up to `concurrency` questions at once on a thread pool.
+    At most 2 * concurrency questions are in flight; results are written in input order
+    and each question's log is printed as one block once it finishes.
+    """
+    dedupe = OrderedDict()
+    pending = deque()
+
+    def drain_one():
+        q, future, duplicate = pending.popleft()
+        output, error, log_lines = future.result()
+        print_captured(q, output, error, log_lines, duplicate)
+        write_result(out_file, {**output, 'id': q['id']})
+        progress.advance(task)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for q in questions:
+            key = (q['question'], q['format_hint'])
+            future = dedupe.get(key)
+            duplicate = future is not None
+            if duplicate:
+                dedupe.move_to_end(key)
+            else:
+                future = pool.submit(run_question_captured, agent, q)
+                remember(dedupe, key, future)
+            pending.append((q, future, duplicate))
+            
+            if len(pending) >= 2 * concurrency:
+                drain_one()
+        
+        while pending:
+            drain_one()
+
+
+async def run_async(agent, questions, out_file, progress, task, concurrency):
+    """
+    Same windowing, dedupe and in-order output as run_concurrent, but the
+    `concurrency` questions in flight are tasks on one event loop (HybridAgent.arun)
+    instead of threads, so it can be set in the hundreds. LM calls are still
+    capped by --max-lm-requests.
+    """
+    dedupe = OrderedDict()
+    pending = deque()
+
+    async def drain_one():
+        q, answer, duplicate = pending.popleft()
+        output, error, log_lines = await answer
+        print_captured(q, output, error, log_lines, duplicate)
+        write_result(out_file, {**output, 'id': q['id']})
+        progress.advance(task)
+
+    for q in questions:
+        key = (q['question'], q['format_hint'])
+        answer = dedupe.get(key)
+        duplicate = answer is not None
+        if duplicate:
+            dedupe.move_to_end(key)
+        else:
+            answer = asyncio.ensure_future(arun_question_captured(agent, q))
+            remember(dedupe, key, answer)
+        pending.append((q, answer, duplicate))
+        
+        if len(pending) >= 2 * concurrency:
+            await drain_one()
+    
+    while pending:
+        await drain_one()
+
+
+def print_startup_profile(ctx, param, value):
+    """--profile-startup: time this entry point's cold start in a fresh process, then exit"""
+    if not value or ctx.resilient_parsing:
+        return
+    from agent.startup_profile import profile_startup, format_report
+
+    entry = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    console.print(f"⏱️  Profiling cold start of {entry} (python -X importtime)...\n")
+    console.print(format_report(profile_startup(entry, warm_up=entry == 'serve_agent')), highlight=False)
+    ctx.exit()
+
+
+def agent_options(command):
+    """LM, cache and agent options shared by the batch runner and serve_agent.py (see setup_agent)"""
+    options = [
+        click.option('--profile-startup', is_flag=True, is_eager=True, expose_value=False,
+                     callback=print_startup_profile,
+                     help='Report import and init time to first-question-ready, then exit'),
+        click.option('--max-lm-requests', default=MAX_LM_REQUESTS, show_default=True, type=click.IntRange(min=1),
+                     help='LM requests in flight at once on the async path (match OLLAMA_NUM_PARALLEL)'),
+        click.option('--sql-cache', default=None, help='Persist the SQL result cache to this SQLite file'),
+        click.option('--no-lm-cache', is_flag=True, help='Bypass the on-disk LM response cache'),
+        click.option('--lm-cache-dir', default=LM_CACHE_DIR, show_default=True, help='Directory for the LM response cache'),
+        click.option('--lm-cache-size-mb', default=LM_CACHE_MAX_BYTES // (1024 * 1024), show_default=True,
+                     type=click.IntRange(min=1), help='Size limit of the LM response cache'),
+        click.option('--no-answer-cache', is_flag=True, help='Disable SQL reuse for near-duplicate questions'),
+        click.option('--retrieval-mode', default='tfidf', show_default=True,
+                     type=click.Choice(['tfidf', 'dense', 'hybrid']), help='Document retrieval backend'),
+        click.option('--sql-candidates', default=1, show_default=True, type=click.IntRange(min=1, max=4),
+                     help='SQL candidates generated and executed in parallel per question (1 = serial repair only)'),
+        click.option('--candidate-strategy', default='vote', show_default=True, type=click.Choice(['vote', 'first']),
+                     help="Pick the result most candidates agree on, or the first successful one"),
+        click.option('--no-rollups', is_flag=True, help='Always aggregate from the base tables'),
+        click.option('--rollup-path', default=ROLLUP_PATH, show_default=True, help='SQLite file holding the daily KPI rollups'),
+        click.option('--query-log', default=DEFAULT_LOG_PATH, show_default=True,
+                     help='Append executed SQL to this JSONL file for the index advisor ("" disables)'),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def setup_agent(max_lm_requests, sql_cache, no_lm_cache, lm_cache_dir, lm_cache_size_mb, no_answer_cache,
+                retrieval_mode, sql_candidates, candidate_strategy, no_rollups, rollup_path, query_log):
+    """Configure DSPy and the shared caches from agent_options, then build the agent"""
+    # Setup DSPy
+    console.print("⚙️  Configuring DSPy with Ollama...")
+    setup_dspy(
+        use_cache=not no_lm_cache,
+        cache_dir=lm_cache_dir,
+        cache_max_bytes=lm_cache_size_mb * 1024 * 1024
+    )
+    
+    if sql_cache:
+        configure_result_cache(persist_path=sql_cache)
+    configure_rollups(enabled=not no_rollups, path=rollup_path)
+    configure_query_log(query_log or None)
+    configure_async_limits(max_lm_requests=max_lm_requests)
+    
+    # Initialize agent
+    console.print("🤖 Initializing agent...\n")
+    return HybridAgent(
+        answer_cache_threshold=None if no_answer_cache else 0.85,
+        retrieval_mode=retrieval_mode,
+        sql_candidates=sql_candidates,
+        candidate_strategy=candidate_strategy
+    )
+
 
 @click.command()
 @click.option('--batch', required=True, help='Input JSONL file with questions')
 @click.option('--out', required=True, help='Output JSONL file for results')
-def main(batch, out):
+@click.option('--concurrency', default=1, show_default=True, type=click.IntRange(min=1),
+              help='Number of questions to run in parallel')
+@click.option('--async', 'use_async', is_flag=True,
+              help='Answer the --concurrency questions as tasks on one event loop instead of threads')
+@click.option('--resume', is_flag=True, help='Skip ids already present in --out and append the rest')
+@agent_options
+def main(batch, out, concurrency, use_async, resume, **agent_settings):
     """
     Run Retail Analytics Copilot in batch mode
     
+    Results are streamed to --out as each question finishes, so an interrupted
+    run can be continued with --resume.
+    
     Example:
         python run_agent_hybrid.py \\
             --batch sample_questions_hybrid_eval.jsonl \\
@@ -46,72 +379,52 @@ def main(batch, out):
     console.print(f"📥 Input: {batch}")
     console.print(f"📤 Output: {out}\n")
     
-    # Setup DSPy
-    console.print("⚙️  Configuring DSPy with Ollama...")
-    setup_dspy()
-    
-    # Initialize agent
-    console.print("🤖 Initializing agent...\n")
-    agent = HybridAgent()
+    agent = setup_agent(**agent_settings)
     
-    # Load questions
-    with open(batch, 'r') as f:
-        questions = [json.loads(line) for line in f]
+    # Resume from existing output
+    completed = load_completed_ids(out) if resume else set()
+    if completed:
+        console.print(f"⏩ Resuming: {len(completed)} questions already in {out}")
     
-    console.print(f"📋 Processing {len(questions)} questions...\n")
+    total = count_questions(batch, completed)
+    console.print(f"📋 Processing {total} questions (concurrency={concurrency}{', async' if use_async else ''})...\n")
     
-    # Process each question
-    results = []
-    for q in track(questions, description="Running agent..."):
-        console.print(f"\n{'='*80}")
-        console.print(f"[bold]Question ID:[/bold] {q['id']}")
-        console.print(f"[bold]Question:[/bold] {q['question']}")
-        console.print(f"[bold]Format:[/bold] {q['format_hint']}\n")
-        
-        try:
-            # Run agent
-            result = agent.run(
-                question=q['question'],
-                format_hint=q['format_hint'],
-                max_repairs=2
-            )
-            
-            # Format output
-            output = {
-                'id': q['id'],
-                'final_answer': result['final_answer'],
-                'sql': result.get('sql_query', ''),
-                'confidence': result['confidence'],
-                'explanation': result['explanation'],
-                'citations': result['citations']
-            }
-            
-            results.append(output)
-            
-            console.print(f"\n[bold green]✓ Success[/bold green]")
-            console.print(f"Answer: {output['final_answer']}")
-            console.print(f"Confidence: {output['confidence']:.2f}")
-            
-        except Exception as e:
-            console.print(f"\n[bold red]✗ Error:[/bold red] {str(e)}")
-            # Write error output
-            output = {
-                'id': q['id'],
-                'final_answer': None,
-                'sql': '',
-                'confidence': 0.0,
-                'explanation': f"Error: {str(e)}",
-                'citations': []
-            }
-            results.append(output)
+    # Process questions, streaming results to disk
+    with open(out, 'a' if resume else 'w') as out_file, \
+            Progress(console=console) as progress:
+        task = progress.add_task("Running agent...", total=total)
+        questions = iter_questions(batch, completed)
+        if use_async:
+            asyncio.run(run_async(agent, questions, out_file, progress, task, concurrency))
+        elif concurrency > 1:
+            run_concurrent(agent, questions, out_file, progress, task, concurrency)
+        else:
+            run_sequential(agent, questions, out_file, progress, task)
     
-    # Write outputs
     console.print(f"\n{'='*80}")
-    console.print(f"💾 Writing results to {out}...")
-    with open(out, 'w') as f:
-        for result in results:
-            f.write(json.dumps(result) + '\n')
-    
+    console.print(f"💾 Results written to {out}")
+    stats = get_result_cache().stats()
+    console.print(f"🗃️  SQL cache: {stats['hits']} hits / {stats['misses']} misses "
+                  f"({stats['entries']} entries, {stats['bytes'] / 1024:.0f} KiB, {stats['evictions']} evictions)")
+    stats = agent.schema_linker.stats()
+    if stats['calls']:
+        console.print(f"✂️  Schema linking: ~{stats['tokens_saved']} prompt tokens saved over {stats['calls']} NL2SQL calls "
+                      f"(~{stats['tokens_linked'] // stats['calls']} vs ~{stats['tokens_full'] // stats['calls']} per call)")
+    stats = agent.sql_repair.stats()
+    if stats['fixed'] or stats['unfixable']:
+        console.print(f"🔧 Auto-repair: {stats['fixed']} of {stats['fixed'] + stats['unfixable']} invalid queries "
+                      f"fixed locally ({stats['unfixable']} sent back to the LLM)")
+    if use_async:
+        stats = get_async_limits().stats()
+        console.print(f"🚦 LM requests: {stats['lm_calls']} calls, peak {stats['lm_peak']} of {stats['max_lm_requests']} "
+                      f"slots in flight, {stats['lm_waits']} waited for a slot")
+    if agent.answer_cache is not None:
+        stats = agent.answer_cache.stats()
+        console.print(f"♻️  Answer cache: {stats['hits']} hits / {stats['misses']} misses ({stats['entries']} entries)")
+    rollups = get_rollups(sqlite_tool.DB_PATH)
+    if rollups is not None:
+        stats = rollups.stats()
+        console.print(f"📊 Rollups: {stats['rewrites']} queries answered from {stats['path']} ({stats['builds']} rebuilds)")
     console.print("[bold green]✨ Done![/bold green]")
 
 if __name__ == '__main__':
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+import asyncio
+import json
+import time
+from collections import deque
+
+import click
+from aiohttp import web
+
+from agent.async_limits import get_async_limits
+from agent.micro_batch import BATCH_WINDOW_MS, MAX_BATCH
+from agent.tools.sql_cache import get_result_cache
+from agent.tools.rollups import get_rollups
+from agent.tools import sqlite_tool
+from run_agent_hybrid import console, agent_options, setup_agent, arun_question_captured, print_captured
+
+# ==============================================================================
+# HTTP SERVICE - One warm HybridAgent answering questions over HTTP/JSON
+# ==============================================================================
+
+MAX_IN_FLIGHT = 64          # questions answered at once; later requests wait for a slot
+LATENCY_WINDOW = 1000       # recent questions the latency percentiles are computed over
+
+
+class AgentService:
+    """
+    Answers POSTed questions with HybridAgent.arun on the server's event loop.
+
+    Requests use the batch JSONL shape ({"id", "question", "format_hint"}, or a
+    JSON array of them) and get the batch output records back. Concurrent
+    requests share micro-batched retrieval and DB work (see
+    HybridAgent.enable_micro_batching).
+    """
+
+    def __init__(self, agent, max_in_flight: int = MAX_IN_FLIGHT, print_logs: bool = True):
+        self.agent = agent
+        self.max_in_flight = max_in_flight
+        self.print_logs = print_logs
+        self.started = time.time()
+        self.requests = 0
+        self.questions = 0
+        self.errors = 0
+        self.in_flight = 0
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self._slots = None
+
+    async def on_startup(self, app):
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        await get_async_limits().run_blocking(self.agent.warm_up)
+
+    async def answer(self, q: dict) -> dict:
+        async with self._slots:
+            self.in_flight += 1
+            start = time.perf_counter()
+            try:
+                output, error, log_lines = await arun_question_captured(self.agent, q)
+            finally:
+                self.in_flight -= 1
+        self._latencies.append((time.perf_counter() - start) * 1000)
+        self.questions += 1
+        if error is not None:
+            self.errors += 1
+        if self.print_logs:
+            print_captured(q, output, error, log_lines, duplicate=False)
+        return output
+
+    # ------------------------------
+    # Handlers
+    # ------------------------------
+    async def ask(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        try:
+            payload = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            return web.json_response({'error': f"Invalid JSON: {e}"}, status=400)
+
+        questions = payload if isinstance(payload, list) else [payload]
+        for i, q in enumerate(questions):
+            if not isinstance(q, dict) or not isinstance(q.get('question'), str) or not isinstance(q.get('format_hint'), str):
+                return web.json_response({'error': f"Item {i}: expected an object with 'question' and 'format_hint'"},
+                                         status=400)
+            q.setdefault('id', f"request-{self.requests}-{i}")
+
+        outputs = await asyncio.gather(*(self.answer(q) for q in questions))
+        return web.json_response(outputs if isinstance(payload, list) else outputs[0])
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'status': 'ok',
+            'uptime_s': round(time.time() - self.started, 1),
+            'in_flight': self.in_flight,
+        })
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.collect_stats())
+
+    def collect_stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 1) if latencies else None
+
+        agent = self.agent
+        rollups = get_rollups(sqlite_tool.DB_PATH)
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'requests': self.requests,
+            'questions': self.questions,
+            'errors': self.errors,
+            'in_flight': self.in_flight,
+            'latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'max': percentile(1.0),
+                           'window': len(latencies)},
+            'lm': get_async_limits().stats(),
+            'micro_batches': {name: batcher.stats() for name, batcher in (agent.micro_batches or {}).items()},
+            'sql_cache': get_result_cache().stats(),
+            'schema_linking': agent.schema_linker.stats(),
+            'auto_repair': agent.sql_repair.stats(),
+            'answer_cache': agent.answer_cache.stats() if agent.answer_cache is not None else None,
+            'rollups': rollups.stats() if rollups is not None else None,
+        }
+
+
+def create_app(service: AgentService) -> web.Application:
+    app = web.Application()
+    app.on_startup.append(service.on_startup)
+    app.add_routes([
+        web.post('/ask', service.ask),
+        web.get('/health', service.health),
+        web.get('/stats', service.stats),
+    ])
+    return app
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', show_default=True, help='Interface to listen on')
+@click.option('--port', default=8000, show_default=True, type=int, help='Port to listen on')
+@click.option('--max-in-flight', default=MAX_IN_FLIGHT, show_default=True, type=click.IntRange(min=1),
+              help='Questions answered at once; further requests wait for a slot')
+@click.option('--batch-window-ms', default=BATCH_WINDOW_MS, show_default=True, type=click.FloatRange(min=0),
+              help='How long a request waits for others to share its retrieval/DB batch (0 disables batching)')
+@click.option('--max-batch', default=MAX_BATCH, show_default=True, type=click.IntRange(min=1),
+              help='Largest retrieval/DB micro-batch')
+@click.option('--quiet', is_flag=True, help="Don't print each question's agent log")
+@agent_options
+def main(host, port, max_in_flight, batch_window_ms, max_batch, quiet, **agent_settings):
+    """
+    Serve the Retail Analytics Copilot over HTTP with one warm agent
+
+    Endpoints:
+        POST /ask     {"id", "question", "format_hint"} or a list of them
+        GET  /health  liveness and questions in flight
+        GET  /stats   latency, LM, micro-batch and cache counters
+
+    Example:
+        python serve_agent.py --port 8000
+        curl -s localhost:8000/ask -d '{"question": "...", "format_hint": "int"}'
+    """
+    console.print("[bold blue]🚀 Retail Analytics Copilot service[/bold blue]")
+    agent = setup_agent(**agent_settings)
+    if batch_window_ms > 0:
+        agent.enable_micro_batching(window_ms=batch_window_ms, max_batch=max_batch)
+
+    service = AgentService(agent, max_in_flight=max_in_flight, print_logs=not quiet)
+    console.print(f"🌐 Listening on http://{host}:{port} (POST /ask, GET /health, GET /stats)")
+    web.run_app(create_app(service), host=host, port=port, print=None, access_log=None)
+
+
+if __name__ == '__main__':
+    main()